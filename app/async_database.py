@@ -0,0 +1,62 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from database import engine_options, instrumented_pool
+
+
+# Sync-Treiber -> passender asyncio-Treiber
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(database_url: str):
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncDatabaseManager:
+    """
+    Async counterpart to backend_db_lib's DatabaseManager. It shares the database with the
+    sync manager but keeps its own asyncpg/aiosqlite connection pool.
+    """
+
+    def __init__(self, database_url: str, on_engine=None):
+        self.url = async_url(database_url)
+        self.engine_args = {}
+        if self.url.get_backend_name() != "sqlite":
+            self.engine_args = engine_options(database_url, asyncio=True)
+        if self.url.database not in (None, "", ":memory:"):
+            # Wartezeiten auf Verbindungen mit engine="async" in /metrics (SQLite im Speicher hat keinen Queue-Pool)
+            self.engine_args["poolclass"] = instrumented_pool(AsyncAdaptedQueuePool, "async")
+        # Wie PooledDatabaseManager: Engine erst beim ersten Zugriff, on_engine bekommt die sync Engine
+        self.on_engine = on_engine
+        self.session = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            engine = create_async_engine(self.url, **self.engine_args)
+            if self.on_engine is not None:
+                self.on_engine(engine.sync_engine)
+            self._engine = engine
+        return self._engine
+
+    def create_session(self):
+        return self.session(bind=self.engine)
+
+    async def run_sync(self, fn):
+        # Führt sync ORM-Code (z.B. aus hydration.py) nicht-blockierend auf der async Verbindung aus
+        async with self.create_session() as session:
+            return await session.run_sync(fn)
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
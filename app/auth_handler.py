@@ -1,12 +1,20 @@
 import os
 import time
+import hashlib
 import jwt
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Request, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jwt import DecodeError
 
 
-from config import JWT_SECRET, JWT_ALGORITHM
+from config import JWT_SECRET, JWT_ALGORITHM, JWT_KEY_ID, JWT_PREVIOUS_KEYS, JWT_DEFAULT_KEY_ID, TOKEN_CACHE_TTL, TOKEN_CACHE_MAXSIZE
+from cache import Cache, shared_store
+from jwt_verifier import JWTVerifier
+from profiling import timed
+
+
+# Bereits verifizierte Claims, Schlüssel ist (kid, SHA-256 des Tokens), nie das Token selbst
+token_cache = Cache("tokens", TOKEN_CACHE_MAXSIZE, TOKEN_CACHE_TTL, shared_store)
+verifier = JWTVerifier({**JWT_PREVIOUS_KEYS, JWT_KEY_ID: JWT_SECRET}, default_kid=JWT_DEFAULT_KEY_ID, algorithms=[JWT_ALGORITHM])
 
 
 def sign_jwt(user_id: str, user_company: int, user_role: str):
@@ -16,16 +24,43 @@ def sign_jwt(user_id: str, user_company: int, user_role: str):
         "company_id": user_company,
         "role": user_role
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM, headers={"kid": JWT_KEY_ID})
     return token
 
 
 def decode_jwt(token: str):
-    try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return decoded_token if decoded_token["expires"] >= time.time() else None
-    except DecodeError:
+    with timed("jwt"):
+        return _decode_jwt(token)
+
+
+def _decode_jwt(token: str):
+    # Der kid wird bei jedem Aufruf gegen die aktuellen Keys geprüft, Tokens entfernter Keys gelten auch im Cache nicht mehr
+    kid = verifier.kid(token)
+    if kid not in verifier.keys:
         return None
+    key = (kid, hashlib.sha256(token.encode()).digest())
+    decoded_token = token_cache.get(key)
+    if decoded_token is None:
+        decoded_token = verifier.decode(token)
+        if decoded_token is None:
+            return None
+        token_cache.set(key, decoded_token)
+
+    # expires wird auch bei Cache-Treffern geprüft, abgelaufene Tokens werden nie ausgeliefert
+    if decoded_token["expires"] < time.time():
+        token_cache.invalidate(key)
+        return None
+    return dict(decoded_token)
+
+
+def get_token_payload(authorization: str | None = Header(default=None)):
+    # FastAPI-Dependency: Authorization-Header einmal pro Request parsen und verifizieren
+    if authorization is None:
+        raise HTTPException(status_code=403, detail="Invalid authorization code.")
+    payload = decode_jwt(authorization.replace("Bearer", "").strip())
+    if payload is None:
+        raise HTTPException(status_code=403, detail="Invalid token or expired token.")
+    return payload
 
 
 class JWTBearer(HTTPBearer):
@@ -0,0 +1,197 @@
+import io
+import asyncio
+
+import anyio.from_thread
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from backend_db_lib.models import User
+from config import BULK_IMPORT_CHUNK_SIZE
+from changelog import record_user_changes_by_email
+from user_updates import TARGET_NAMES, existing_targets
+from passwords import hash_password_async
+
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+# Fremdschlüssel, die auf Zeilen der eigenen Company zeigen müssen (Rollen sind global)
+TARGET_FIELDS = ("role_id", "layer_id", "group_id", "supervisor_id")
+
+
+class ImportUserData(BaseModel):
+    first_name: str
+    last_name: str
+    email: str
+    password: str
+    supervisor_id: int | None = None
+    role_id: int | None = None
+    layer_id: int | None = None
+    group_id: int | None = None
+    company_id: int | None = None
+
+
+class RequestBody(io.RawIOBase):
+    """
+    The request body as a readable file for pandas. The parser runs in a worker thread and
+    pulls the next chunk from the event loop only when it needs more data, so large imports are
+    parsed and inserted while they are still being uploaded.
+    """
+
+    def __init__(self, request):
+        self.chunks = request.stream()
+        self.pending = b""
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    async def next_chunk(self):
+        return await self.chunks.__anext__()
+
+    def readinto(self, buffer):
+        while not self.pending and not self.finished:
+            try:
+                self.pending = anyio.from_thread.run(self.next_chunk)
+            except StopAsyncIteration:
+                self.finished = True
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def open_request_body(request):
+    return io.BufferedReader(RequestBody(request))
+
+
+def read_chunks(file, import_format: str, chunksize: int = BULK_IMPORT_CHUNK_SIZE):
+    # pandas erst beim ersten Import laden, nicht beim Start des Service
+    import pandas as pd
+
+    if import_format == "csv":
+        reader = pd.read_csv(file, chunksize=chunksize, dtype=str, keep_default_na=False, skipinitialspace=True)
+    else:
+        reader = pd.read_json(file, lines=True, chunksize=chunksize, dtype=False)
+
+    for frame in reader:
+        frame = frame.astype(object).where(frame.notna(), None)
+        yield [{key: (None if value == "" else value) for key, value in record.items()} for record in frame.to_dict("records")]
+
+
+def insert_users(session, rows):
+    # Ein executemany pro Chunk, bei Constraint-Fehlern zeilenweise um die kaputten Zeilen zu finden
+    try:
+        session.execute(User.__table__.insert(), [row for _, row in rows])
+        record_user_changes_by_email(session, rows[0][1]["company_id"], [row["email"] for _, row in rows])
+        session.commit()
+        return []
+    except IntegrityError:
+        session.rollback()
+
+    errors = []
+    for line, row in rows:
+        try:
+            session.execute(User.__table__.insert(), [row])
+            record_user_changes_by_email(session, row["company_id"], [row["email"]])
+            session.commit()
+        except IntegrityError as e:
+            session.rollback()
+            errors.append({"row": line, "email": row["email"], "error": str(e.orig)})
+    return errors
+
+
+def existing_emails(session, emails):
+    return {email for (email,) in session.query(User.email).filter(User.email.in_(emails)).all()}
+
+
+def check_chunk(session, company_id: int, users):
+    # Eine Query für die E-Mails, eine IN-Query pro Feld für Rolle, Layer, Gruppe und Vorgesetzten (wie plan_reorg)
+    targets = {}
+    for field in TARGET_FIELDS:
+        wanted = {getattr(user, field) for user in users if getattr(user, field) is not None}
+        targets[field] = existing_targets(session, company_id, field, wanted) if wanted else set()
+    return existing_emails(session, [user.email for user in users]), targets
+
+
+async def import_users(file, import_format: str, company_id: int, run_in_session):
+    """
+    Imports the users chunk by chunk. Every chunk is committed on its own: rows listed in
+    `errors` are skipped, all other rows are imported, also when a later chunk fails to parse.
+    """
+    report = {"imported": 0, "failed": 0, "errors": []}
+    seen = set()
+    line = 0
+    chunks = read_chunks(file, import_format)
+
+    while True:
+        try:
+            records = await run_in_threadpool(next, chunks, None)
+        except ValueError as e:  # auch pandas.errors.ParserError
+            # Bereits committete Chunks bleiben importiert
+            raise HTTPException(status_code=400, detail=f"Could not parse {import_format} input after {report['imported']} imported users: {e}")
+        if records is None:
+            break
+
+        valid = []
+        errors = []
+        for record in records:
+            line += 1
+            try:
+                user = ImportUserData(**record)
+            except ValidationError as e:
+                errors.append({"row": line, "email": record.get("email"), "error": str(e)})
+                continue
+            if user.company_id not in (None, company_id):
+                errors.append({"row": line, "email": user.email, "error": "User must belong to your company"})
+                continue
+            if user.email in seen:
+                errors.append({"row": line, "email": user.email, "error": "Duplicate email in import"})
+                continue
+            seen.add(user.email)
+            valid.append((line, user))
+
+        # Eindeutigkeit und Fremdschlüssel gegen die DB einmal pro Chunk prüfen
+        existing, targets = await run_in_session(lambda session: check_chunk(session, company_id, [user for _, user in valid]))
+        checked = []
+        for line_number, user in valid:
+            missing = next((field for field in TARGET_FIELDS if getattr(user, field) is not None and getattr(user, field) not in targets[field]), None)
+            if user.email in existing:
+                errors.append({"row": line_number, "email": user.email, "error": "Email already registered"})
+            elif missing is not None:
+                errors.append({"row": line_number, "email": user.email, "error": f"{TARGET_NAMES[missing]} not found in your company"})
+            else:
+                checked.append((line_number, user))
+        valid = checked
+
+        password_hashes = await asyncio.gather(*(hash_password_async(user.password) for _, user in valid))
+        rows = [
+            (line_number, {
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "email": user.email,
+                "password_hash": password_hash,
+                "profile_picture_url": None,
+                "supervisor_id": user.supervisor_id,
+                "role_id": user.role_id,
+                "layer_id": user.layer_id,
+                "group_id": user.group_id,
+                "company_id": company_id,
+            })
+            for (line_number, user), password_hash in zip(valid, password_hashes)
+        ]
+        if rows:
+            insert_errors = await run_in_session(lambda session: insert_users(session, rows))
+            report["imported"] += len(rows) - len(insert_errors)
+            errors += insert_errors
+
+        report["errors"] += sorted(errors, key=lambda error: error["row"])
+
+    report["failed"] = len(report["errors"])
+    return report
@@ -0,0 +1,335 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from urllib.parse import urlparse
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+from config import REFERENCE_CACHE_TTL, REFERENCE_CACHE_MAXSIZE, USER_CACHE_TTL, USER_CACHE_MAXSIZE, STATS_CACHE_TTL, STATS_CACHE_MAXSIZE, CACHE_URL, CACHE_PREFIX, CACHE_LOCAL_TTL
+
+
+logger = logging.getLogger(__name__)
+_missing = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+    `get` returns `default` for missing or expired keys.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class RedisStore:
+    """
+    Key-value store shared by all replicas. Values are stored as JSON with a TTL,
+    events (e.g. cache evictions) are broadcast on one pub/sub channel.
+    A failing store is treated like a cache miss, the database stays the source of truth.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = CACHE_PREFIX):
+        import redis  # optional, nur nötig wenn CACHE_URL auf einen Redis zeigt
+
+        self.errors = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.channel = f"{prefix}:events"
+        # Eigene Nachrichten werden beim Empfang ignoriert
+        self.origin = uuid.uuid4().hex
+        self._handlers = defaultdict(list)
+        self._pubsub = None
+        self._listener = None
+
+    def key(self, *parts):
+        return ":".join((self.prefix,) + parts)
+
+    def _run(self, fn, *args, **kwargs):
+        # Sync ORM-Code der async Engine läuft als Greenlet im Event-Loop (AsyncSession.run_sync),
+        # der Redis-Roundtrip wird dort in einen Thread ausgelagert statt den Loop zu blockieren
+        if in_greenlet():
+            return await_only(asyncio.to_thread(fn, *args, **kwargs))
+        return fn(*args, **kwargs)
+
+    def get(self, key: str):
+        try:
+            raw = self._run(self.client.get, key)
+        except self.errors as e:
+            logger.warning("Shared cache get failed: %s", e)
+            return None
+        return None if raw is None else orjson.loads(raw)
+
+    def set(self, key: str, value, ttl: float):
+        try:
+            self._run(self.client.set, key, orjson.dumps(value), px=max(1, int(ttl * 1000)))
+        except self.errors as e:
+            logger.warning("Shared cache set failed: %s", e)
+
+    def delete(self, *keys: str):
+        if not keys:
+            return
+        try:
+            self._run(self.client.delete, *keys)
+        except self.errors as e:
+            # Einträge laufen spätestens nach ihrer TTL ab
+            logger.error("Shared cache delete failed: %s", e)
+
+    def delete_prefix(self, prefix: str):
+        try:
+            keys = self._run(lambda: list(self.client.scan_iter(match=f"{prefix}*", count=1000)))
+        except self.errors as e:
+            logger.error("Shared cache scan failed: %s", e)
+            return
+        self.delete(*keys)
+
+    # Zähler und Versionen: None wenn der Store nicht erreichbar ist, der Aufrufer entscheidet über den Fallback
+
+    def incr(self, key: str, ttl: float = None):
+        try:
+            value = self._run(self.client.incr, key)
+            if ttl is not None and value == 1:
+                self._run(self.client.pexpire, key, max(1, int(ttl * 1000)))
+        except self.errors as e:
+            logger.error("Shared counter incr failed: %s", e)
+            return None
+        return value
+
+    def get_int(self, key: str):
+        try:
+            value = self._run(self.client.get, key)
+        except self.errors as e:
+            logger.warning("Shared counter get failed: %s", e)
+            return None
+        return 0 if value is None else int(value)
+
+    def get_many(self, *keys: str):
+        try:
+            values = self._run(self.client.mget, keys)
+        except self.errors as e:
+            logger.warning("Shared cache mget failed: %s", e)
+            return None
+        return [None if value is None else value.decode() for value in values]
+
+    def setdefault(self, key: str, value: str):
+        try:
+            self._run(self.client.set, key, value, nx=True)
+            stored = self._run(self.client.get, key)
+        except self.errors as e:
+            logger.warning("Shared cache setdefault failed: %s", e)
+            return None
+        return None if stored is None else stored.decode()
+
+    def publish(self, kind: str, **data):
+        try:
+            self._run(self.client.publish, self.channel, orjson.dumps({"origin": self.origin, "kind": kind, **data}))
+        except self.errors as e:
+            logger.error("Publishing %s event failed: %s", kind, e)
+
+    def subscribe(self, kind: str, handler):
+        self._handlers[kind].append(handler)
+
+    def dispatch(self, message):
+        event = orjson.loads(message["data"])
+        if event.get("origin") == self.origin:
+            return
+        for handler in self._handlers.get(event.get("kind"), ()):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Handling %s event failed", event.get("kind"))
+
+    def start(self):
+        # Listener-Thread, wird beim App-Start gestartet
+        if self._listener is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{self.channel: self.dispatch})
+            self._listener = self._pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener.join(timeout=5)
+            self._pubsub.close()
+            self._listener = None
+            self._pubsub = None
+
+
+def create_store(url: str):
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return None
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisStore(url)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+def cache_key(key):
+    # Tupel-Schlüssel werden zu "a:b", bytes (z.B. Token-Hashes) zu Hex, damit sie im geteilten Store gleich aussehen
+    if isinstance(key, tuple):
+        return ":".join(cache_key(part) for part in key)
+    if isinstance(key, bytes):
+        return key.hex()
+    return str(key)
+
+
+class Cache:
+    """
+    Namespaced cache used by the endpoints. Without a store it is a plain in-process TTLCache.
+    With a shared store the local copy is only a short-lived near cache in front of it,
+    and invalidations are published so the other replicas drop their local copies too.
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float, store=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.store = store
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl if store is None else min(ttl, CACHE_LOCAL_TTL))
+        self.remote_hits = 0
+        if store is not None:
+            store.subscribe("evict", self._evicted)
+
+    def _store_key(self, key: str):
+        return self.store.key(self.namespace, key)
+
+    def get(self, key, default=None):
+        key = cache_key(key)
+        value = self.local.get(key, _missing)
+        if value is not _missing:
+            return value
+        if self.store is not None:
+            value = self.store.get(self._store_key(key))
+            if value is not None:
+                self.remote_hits += 1
+                self.local.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value):
+        key = cache_key(key)
+        self.local.set(key, value)
+        if self.store is not None:
+            self.store.set(self._store_key(key), value, self.ttl)
+
+    def invalidate(self, *keys):
+        keys = [cache_key(key) for key in keys]
+        self.local.invalidate(*keys)
+        if self.store is not None and keys:
+            self.store.delete(*(self._store_key(key) for key in keys))
+            self.store.publish("evict", cache=self.namespace, keys=keys)
+
+    def clear(self):
+        self.local.clear()
+        if self.store is not None:
+            self.store.delete_prefix(self.store.key(self.namespace, ""))
+            self.store.publish("evict", cache=self.namespace, keys=None)
+
+    def _evicted(self, event):
+        if event.get("cache") != self.namespace:
+            return
+        if event.get("keys") is None:
+            self.local.clear()
+        else:
+            self.local.invalidate(*event["keys"])
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update({
+            "ttl": self.ttl,
+            "hits": stats["hits"] + self.remote_hits,
+            "misses": stats["misses"] - self.remote_hits,
+            "remote_hits": self.remote_hits,
+            "backend": "memory" if self.store is None else self.store.name,
+        })
+        return stats
+
+
+# Geteilter Store aller Replicas, None bei CACHE_URL=memory://
+shared_store = create_store(CACHE_URL)
+
+
+async def run_store(fn, *args):
+    # Aus async Handlern: mit geteiltem Store blockiert fn (Redis-Roundtrips), dann im Threadpool, sonst direkt
+    if shared_store is None:
+        return fn(*args)
+    return await run_in_threadpool(fn, *args)
+
+
+def publish(kind: str, **data):
+    # Event an die anderen Replicas, ohne geteilten Store gibt es keine
+    if shared_store is not None:
+        shared_store.publish(kind, **data)
+
+
+def subscribe(kind: str, handler):
+    if shared_store is not None:
+        shared_store.subscribe(kind, handler)
+
+
+# Company, Role, Group und Layer ändern sich fast nie.
+# Schlüssel: (tabelle, id) für einzelne Einträge, ("layers"|"groups", company_id, version) für die Listen pro Company
+reference_cache = Cache("references", REFERENCE_CACHE_MAXSIZE, REFERENCE_CACHE_TTL, shared_store)
+
+# Hydrierte User für GET user/{id}, Schlüssel ist (User-ID, Version)
+user_cache = Cache("users", USER_CACHE_MAXSIZE, USER_CACHE_TTL, shared_store)
+
+# Org-Statistiken (org_stats.py), Schlüssel enthält die Datenversion der Company
+stats_cache = Cache("statistics", STATS_CACHE_MAXSIZE, STATS_CACHE_TTL, shared_store)
+
+
+def reference_key(model, entity_id):
+    return (model.__tablename__, entity_id)
@@ -0,0 +1,98 @@
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table, exists, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from backend_db_lib.models import User
+
+
+# Eigene Metadata wie migrations.py, create_all von backend_db_lib legt die Tabellen nicht an
+change_metadata = MetaData()
+
+# Änderungsprotokoll für den Delta-Sync, alle Einträge eines Commits haben dieselbe Version
+change_table = Table(
+    "user_management_changes", change_metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+    Column("company_id", Integer, nullable=False),
+    Column("version", BigInteger, nullable=False),
+    Column("entity", String(16), nullable=False),
+    Column("entity_id", Integer, nullable=False),
+    Column("changed_at", DateTime, nullable=False, server_default=func.now()),
+    Index("ix_user_management_changes_company_version", "company_id", "version"),
+)
+
+# Versionszähler pro Company. Die Zeile bleibt bis zum Commit gesperrt, Versionen werden also in Commit-Reihenfolge
+# vergeben: wer Version n sieht, sieht auch alle kleineren. Mit der id als Version konnte ein später committeter
+# Eintrag mit kleinerer id hinter einem Client-Stand landen und ging verloren
+version_table = Table(
+    "user_management_change_versions", change_metadata,
+    Column("company_id", Integer, primary_key=True, autoincrement=False),
+    Column("version", BigInteger, nullable=False),
+)
+
+ENTITIES = ("user", "group", "layer")
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def create_tables(engine):
+    # Beim Start (main.py lifespan) und von Migration 0003, bestehende Tabellen bleiben
+    change_metadata.create_all(engine, checkfirst=True)
+
+
+def next_version(session, company_id: int):
+    # INSERT ... ON CONFLICT DO UPDATE sperrt die Zeile der Company bis zum Commit
+    upsert = UPSERTS[session.get_bind().dialect.name]
+    statement = upsert(version_table).values(company_id=company_id, version=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[version_table.c.company_id], set_={"version": version_table.c.version + 1},
+    ).returning(version_table.c.version)
+    return session.execute(statement).scalar_one()
+
+
+def record_changes(session, company_id: int, entity: str, entity_ids):
+    # Im selben Commit wie die Änderung selbst
+    entity_ids = list(entity_ids)
+    if entity_ids:
+        version = next_version(session, company_id)
+        session.execute(insert(change_table), [{"company_id": company_id, "version": version, "entity": entity, "entity_id": i} for i in entity_ids])
+
+
+def record_user_changes_by_email(session, company_id: int, emails):
+    # Für Inserts ohne RETURNING (Bulk-Import): ids über die E-Mail nachschlagen
+    version = next_version(session, company_id)
+    session.execute(insert(change_table).from_select(
+        ["company_id", "version", "entity", "entity_id"],
+        select(User.company_id, literal(version), literal("user"), User.id).where(User.company_id == company_id, User.email.in_(list(emails))),
+    ))
+
+
+def current_version(session, company_id: int):
+    return session.query(func.coalesce(func.max(version_table.c.version), 0)).filter(version_table.c.company_id == company_id).scalar()
+
+
+def changes_since(session, company_id: int, since: int, limit: int):
+    """
+    Returns ({entity: [ids]}, version, has_more) for the changes of the company after `since`.
+    Continue with since=version while has_more is set. A version is never split across pages,
+    so a page can hold more than `limit` entries.
+    """
+    columns = (change_table.c.id, change_table.c.version, change_table.c.entity, change_table.c.entity_id)
+    rows = session.execute(
+        select(*columns)
+        .where(change_table.c.company_id == company_id, change_table.c.version > since)
+        .order_by(change_table.c.version, change_table.c.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    if has_more and rows[limit].version == rows[limit - 1].version:
+        # Rest der letzten Version nachladen, die nächste Seite beginnt nach ihr
+        rows = rows[:limit] + session.execute(
+            select(*columns)
+            .where(change_table.c.company_id == company_id, change_table.c.version == rows[limit - 1].version, change_table.c.id > rows[limit - 1].id)
+        ).all()
+        has_more = session.query(exists().where(change_table.c.company_id == company_id, change_table.c.version > rows[-1].version)).scalar()
+    else:
+        rows = rows[:limit]
+
+    changed = {entity: {} for entity in ENTITIES}
+    for _, _, entity, entity_id in rows:
+        changed[entity][entity_id] = None
+    return {entity: list(ids) for entity, ids in changed.items()}, rows[-1].version if rows else since, has_more
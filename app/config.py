@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 db_user = os.environ.get("DB_USER", "backendgang")
 db_password = os.environ.get("DB_PASSWORD", "backendgang")
@@ -6,7 +7,82 @@ db_hostname = os.environ.get("DB_HOSTNAME", "db")
 db_port = os.environ.get("DB_PORT", "8010")
 db_name = os.environ.get("DB_NAME", "backend")
 
-JWT_SECRET = "feaf1952d59f883ecf260a8683fed21ab0ad9a53323eca4f"
+JWT_SECRET = os.environ.get("JWT_SECRET", "feaf1952d59f883ecf260a8683fed21ab0ad9a53323eca4f")
 JWT_ALGORITHM = "HS256"
-DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_hostname}:{db_port}/{db_name}"
+# Key-Rotation: neue Tokens tragen JWT_KEY_ID als kid, JWT_PREVIOUS_KEYS ("kid:secret,...") werden weiter akzeptiert
+JWT_KEY_ID = os.environ.get("JWT_KEY_ID", "v1")
+JWT_PREVIOUS_KEYS = dict(entry.split(":", 1) for entry in os.environ.get("JWT_PREVIOUS_KEYS", "").split(",") if entry.strip())
+# Key für Tokens ohne kid (vor der Rotation ausgestellt)
+JWT_DEFAULT_KEY_ID = os.environ.get("JWT_DEFAULT_KEY_ID", JWT_KEY_ID)
+JWT_BATCH_MAX = int(os.environ.get("JWT_BATCH_MAX", "1000"))
+DATABASE_URL = os.environ.get("DB_URL", f"postgresql://{db_user}:{db_password}@{db_hostname}:{db_port}/{db_name}")
 LOGIN_TIME = 600
+
+REFERENCE_CACHE_TTL = float(os.environ.get("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_MAXSIZE = int(os.environ.get("REFERENCE_CACHE_MAXSIZE", "4096"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+USER_CACHE_MAXSIZE = int(os.environ.get("USER_CACHE_MAXSIZE", "10000"))
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", "600"))
+STATS_CACHE_MAXSIZE = int(os.environ.get("STATS_CACHE_MAXSIZE", "256"))
+
+# memory:// = nur prozesslokal, redis://host:port/db = geteilt zwischen allen Replicas
+CACHE_URL = os.environ.get("CACHE_URL", "memory://")
+CACHE_PREFIX = os.environ.get("CACHE_PREFIX", "user_management")
+# Mit geteiltem Backend bleiben Einträge nur so lange im lokalen Near-Cache
+CACHE_LOCAL_TTL = float(os.environ.get("CACHE_LOCAL_TTL", "5"))
+
+# Ausstehende Migrationen (migrations.py) beim Start anwenden, auf Postgres nacheinander über einen Advisory-Lock
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+# python main.py: Worker-Prozesse (jeder mit eigenem Pool und eigenen lokalen Caches), Reloader nur für die Entwicklung
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "8001"))
+WORKERS = int(os.environ.get("WEB_CONCURRENCY", "1"))
+RELOAD = os.environ.get("UVICORN_RELOAD", "false").lower() in ("1", "true", "yes")
+
+# Opt-in: Lese-Endpunkte über asyncpg statt psycopg2 im Threadpool
+ASYNC_DB_ENABLED = os.environ.get("ASYNC_DB_ENABLED", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# Millisekunden, 0 = kein Timeout
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", "0"))
+
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_MAXSIZE = int(os.environ.get("TOKEN_CACHE_MAXSIZE", "10000"))
+
+# Passwort-Hashing über passlib, z.B. pbkdf2_sha256, bcrypt oder argon2
+PASSWORD_HASH_SCHEME = os.environ.get("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+PASSWORD_HASH_ROUNDS = int(os.environ.get("PASSWORD_HASH_ROUNDS", "0"))  # 0 = passlib-Default
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+# Fehlgeschlagene Logins pro Fenster (Sekunden), danach 429 ohne DB-Zugriff und Hashing; 0 = kein Limit
+LOGIN_ATTEMPT_WINDOW = float(os.environ.get("LOGIN_ATTEMPT_WINDOW", "300"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get("LOGIN_MAX_FAILURES_PER_IP", "50"))
+LOGIN_MAX_FAILURES_PER_ACCOUNT = int(os.environ.get("LOGIN_MAX_FAILURES_PER_ACCOUNT", "10"))  # pro Account und Client-IP
+# Reverse Proxies (IPs oder Netze, kommagetrennt), deren X-Forwarded-For für die Client-IP übernommen wird
+TRUSTED_PROXIES = [proxy.strip() for proxy in os.environ.get("TRUSTED_PROXIES", "").split(",") if proxy.strip()]
+
+BULK_IMPORT_CHUNK_SIZE = int(os.environ.get("BULK_IMPORT_CHUNK_SIZE", "1000"))
+
+HIERARCHY_INDEX_TTL = float(os.environ.get("HIERARCHY_INDEX_TTL", "300"))
+# Suche: In-Memory-Index (nur ohne Postgres) und Mindest-Ähnlichkeit für unscharfe Treffer (wie pg_trgm)
+SEARCH_INDEX_TTL = float(os.environ.get("SEARCH_INDEX_TTL", "300"))
+SEARCH_SIMILARITY_THRESHOLD = float(os.environ.get("SEARCH_SIMILARITY_THRESHOLD", "0.3"))
+SEARCH_MAX_LIMIT = int(os.environ.get("SEARCH_MAX_LIMIT", "100"))
+
+USER_LIST_MAX_LIMIT = int(os.environ.get("USER_LIST_MAX_LIMIT", "1000"))
+USER_LOOKUP_MAX = int(os.environ.get("USER_LOOKUP_MAX", "1000"))
+USER_BATCH_UPDATE_MAX = int(os.environ.get("USER_BATCH_UPDATE_MAX", "10000"))
+REORG_MAX_CHANGES = int(os.environ.get("REORG_MAX_CHANGES", "10000"))
+# User pro Query im Directory-Snapshot bzw. Änderungen pro Delta-Antwort
+DIRECTORY_CHUNK_SIZE = int(os.environ.get("DIRECTORY_CHUNK_SIZE", "1000"))
+
+HTTP_CACHE_CONTROL = os.environ.get("HTTP_CACHE_CONTROL", "private, no-cache")
+
+# Sampling-Profiler für Requests über der Schwelle (Millisekunden, 0 = aus)
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get("PROFILE_SLOW_REQUEST_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "user_management_profiles"))
@@ -0,0 +1,120 @@
+import time
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_STATEMENT_TIMEOUT
+from metrics import Histogram, render_metric
+
+
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+
+class PoolStats:
+    def __init__(self):
+        self.wait = Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+
+
+# Pro Engine ("sync", "async"), gleiche Labels wie die Pool-Gauges
+pool_stats = {}
+
+
+class InstrumentedPool:
+    # Misst, wie lange ein Request auf eine freie Verbindung warten muss
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.wait.observe(time.perf_counter() - start)
+
+
+def instrumented_pool(pool_class, name: str):
+    # Als Klasse statt Attribut am Pool, damit es auch nach engine.dispose() (neuer Pool) erhalten bleibt
+    stats = pool_stats.setdefault(name, PoolStats())
+    return type(f"Instrumented{pool_class.__name__}", (InstrumentedPool, pool_class), {"stats": stats})
+
+
+def engine_options(database_url: str, asyncio: bool = False):
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if DB_STATEMENT_TIMEOUT and make_url(database_url).get_backend_name() == "postgresql":
+        if asyncio:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+    return options
+
+
+class PooledDatabaseManager:
+    """
+    Same create_session() interface as backend_db_lib's DatabaseManager, but the engine's pool
+    is configured from config.py and instrumented for the /metrics endpoint.
+    """
+
+    def __init__(self, base, database_url: str, on_engine=None):
+        self.base = base
+        self.database_url = database_url
+        # Engine (und DB-Treiber-Import) erst beim ersten Zugriff bzw. im Lifespan der App
+        self.on_engine = on_engine
+        self.session = sessionmaker()
+        self._engine = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = create_engine(self.database_url, poolclass=instrumented_pool(QueuePool, "sync"), **engine_options(self.database_url))
+                    if self.on_engine is not None:
+                        self.on_engine(engine)
+                    self._engine = engine
+        return self._engine
+
+    def create_session(self):
+        return self.session(bind=self.engine)
+
+    def dispose(self):
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+def render_pool_metrics(engines):
+    # engines: {"sync": engine, "async": engine.sync_engine, ...}
+    gauges = {
+        "size": (lambda pool: pool.size(), "Configured number of pooled connections"),
+        "checked_out": (lambda pool: pool.checkedout(), "Connections currently in use"),
+        "idle": (lambda pool: pool.checkedin(), "Connections idle in the pool"),
+        # QueuePool.overflow() startet bei -pool_size
+        "overflow": (lambda pool: max(0, pool.overflow()), "Connections opened above the pool size"),
+    }
+    lines = []
+    for suffix, (read, help_text) in gauges.items():
+        samples = [
+            (f'engine="{name}"', read(engine.pool))
+            for name, engine in engines.items()
+            if isinstance(engine.pool, QueuePool)
+        ]
+        lines += render_metric(f"user_management_db_pool_{suffix}", "gauge", help_text, samples)
+
+    pools = [(name, engine.pool.stats) for name, engine in engines.items() if isinstance(engine.pool, InstrumentedPool)]
+    lines += render_metric("user_management_db_pool_wait_seconds", "histogram", "Time spent waiting for a pooled connection",
+                           [line for name, stats in pools for line in stats.wait.render("user_management_db_pool_wait_seconds", f'engine="{name}"')])
+    lines += render_metric("user_management_db_pool_timeouts_total", "counter",
+                           "Failed connection acquires", [(f'engine="{name}"', stats.timeouts) for name, stats in pools])
+    return lines
@@ -0,0 +1,83 @@
+import secrets
+import threading
+from collections import defaultdict
+
+from fastapi import Response
+
+from config import HTTP_CACHE_CONTROL
+from cache import shared_store
+
+
+class DataVersions:
+    """
+    Version counter per company, bumped by every write endpoint. The epoch changes on every
+    process start so ETags handed out before a restart never match again.
+    With a shared store the counters and the epoch live there, so all replicas hand out the same ETags.
+    If that store is unavailable `etag` returns None and responses go out without ETag.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._versions = defaultdict(int)
+        self._global = 0
+        self._lock = threading.Lock()
+        self.epoch = secrets.token_hex(4)
+
+    def _key(self, company_id):
+        return self.store.key("versions", "global" if company_id is None else str(company_id))
+
+    def get(self, company_id=None):
+        # None wenn der geteilte Store nicht erreichbar ist
+        if self.store is not None:
+            return self.store.get_int(self._key(company_id))
+        with self._lock:
+            return self._global if company_id is None else self._versions[company_id]
+
+    def bump(self, company_id):
+        if self.store is not None:
+            # Läuft nach dem Commit: ein Fehler wird vom Store geloggt, der Request bleibt erfolgreich
+            self.store.incr(self._key(company_id))
+            self.store.incr(self._key(None))
+            return
+        with self._lock:
+            self._versions[company_id] += 1
+            self._global += 1
+
+    def etag(self, resource: str, company_id=None):
+        # company_id=None: Ressourcen ohne bekannte Company (z.B. user/{id}) hängen an der globalen Version
+        scope = "global" if company_id is None else f"c{company_id}"
+        if self.store is None:
+            return f'"{self.epoch}-{resource}-{scope}-{self.get(company_id)}"'
+
+        # Epoch und Zähler in einem Roundtrip, geht der Store verloren beginnt eine neue Epoch
+        epoch_key = self.store.key("versions", "epoch")
+        values = self.store.get_many(epoch_key, self._key(company_id))
+        if values is None:
+            return None
+        epoch, version = values
+        if epoch is None:
+            epoch = self.store.setdefault(epoch_key, secrets.token_hex(4))
+            if epoch is None:
+                return None
+        return f'"{epoch}-{resource}-{scope}-{int(version or 0)}"'
+
+
+data_versions = DataVersions(shared_store)
+
+
+def cache_headers(etag: str):
+    return {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL}
+
+
+def not_modified(request, response, etag: str):
+    # Liefert eine 304-Response wenn der Client die aktuelle Version hat, sonst werden die Header gesetzt.
+    # Ohne ETag (Store nicht erreichbar) gibt es weder 304 noch Cache-Header
+    if etag is None:
+        return None
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=cache_headers(etag))
+    response.headers.update(cache_headers(etag))
+    return None
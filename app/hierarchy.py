@@ -0,0 +1,211 @@
+import time
+import threading
+from collections import defaultdict, deque
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import aliased
+
+from backend_db_lib.models import User
+from config import HIERARCHY_INDEX_TTL
+from cache import publish, subscribe
+
+
+class OrgHierarchy:
+    """
+    Parent-pointer index over the supervisor tree of one company.
+    Built from a single projected query, afterwards every lookup is answered in memory.
+    """
+
+    def __init__(self, rows):
+        self.parent = {}
+        self.layer = {}
+        self.group = {}
+        self.children = defaultdict(set)
+        self.built_at = time.monotonic()
+        self._lock = threading.RLock()
+        for user_id, supervisor_id, layer_id, group_id in rows:
+            self.add(user_id, supervisor_id, layer_id, group_id)
+
+    def add(self, user_id, supervisor_id, layer_id, group_id):
+        with self._lock:
+            self.parent[user_id] = supervisor_id
+            self.layer[user_id] = layer_id
+            self.group[user_id] = group_id
+            if supervisor_id is not None:
+                self.children[supervisor_id].add(user_id)
+
+    def update(self, user_id, **changes):
+        with self._lock:
+            if user_id not in self.parent:
+                return
+            if "supervisor_id" in changes:
+                old = self.parent[user_id]
+                if old is not None:
+                    self.children[old].discard(user_id)
+                self.parent[user_id] = changes["supervisor_id"]
+                if changes["supervisor_id"] is not None:
+                    self.children[changes["supervisor_id"]].add(user_id)
+            if "layer_id" in changes:
+                self.layer[user_id] = changes["layer_id"]
+            if "group_id" in changes:
+                self.group[user_id] = changes["group_id"]
+
+    def ancestors(self, user_id):
+        # Supervisor-Kette nach oben als Liste (kein Generator, der den Lock hält), bricht bei Zyklen ab
+        with self._lock:
+            chain = []
+            seen = {user_id}
+            current = self.parent.get(user_id)
+            while current is not None and current not in seen:
+                chain.append(current)
+                seen.add(current)
+                current = self.parent.get(current)
+            return chain
+
+    def ancestor_at_layer(self, user_id, layer_id):
+        with self._lock:
+            if self.layer.get(user_id) == layer_id:
+                return user_id
+            for ancestor in self.ancestors(user_id):
+                if self.layer.get(ancestor) == layer_id:
+                    return ancestor
+            return None
+
+    def subordinates(self, user_id):
+        with self._lock:
+            result = []
+            seen = {user_id}
+            queue = deque(self.children.get(user_id, ()))
+            while queue:
+                current = queue.popleft()
+                if current in seen:
+                    continue
+                seen.add(current)
+                result.append(current)
+                queue.extend(self.children.get(current, ()))
+            return result
+
+    def supervisors_for_group(self, group_id, assigned_layer_id, audit_layer_id):
+        # Alle Vorgesetzten im Audit-Layer für die User der Gruppe im zugewiesenen Layer
+        with self._lock:
+            members = [u for u, g in self.group.items() if g == group_id and self.layer.get(u) == assigned_layer_id]
+            supervisors = {self.ancestor_at_layer(member, audit_layer_id) for member in members}
+            supervisors.discard(None)
+            return sorted(supervisors)
+
+    def cycles(self, new_supervisors: dict):
+        with self._lock:
+            return supervisor_cycles(self.parent, new_supervisors)
+
+
+def supervisor_cycles(parent: dict, new_supervisors: dict):
+    # User aus new_supervisors ({user_id: supervisor_id}), die nach den Änderungen in ihrer eigenen Supervisor-Kette lägen
+    state = {}  # 1: auf dem aktuellen Pfad, 2: fertig
+    cyclic = set()
+    for start in new_supervisors:
+        path = []
+        current = start
+        while current is not None and current not in state:
+            state[current] = 1
+            path.append(current)
+            current = new_supervisors[current] if current in new_supervisors else parent.get(current)
+        if current is not None and state[current] == 1:
+            cyclic.update(user for user in path[path.index(current):] if user in new_supervisors)
+        for user in path:
+            state[user] = 2
+    return cyclic
+
+
+# Namespace für pg_advisory_xact_lock(namespace, company_id)
+SUPERVISOR_LOCK = 1712
+
+
+def lock_supervisors(session, company_id):
+    # Auf Postgres werden Vorgesetzten-Änderungen einer Company bis zum Commit serialisiert,
+    # zwei gleichzeitige Requests können so keinen Zyklus gemeinsam schließen
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_advisory_xact_lock(:namespace, :company_id)"), {"namespace": SUPERVISOR_LOCK, "company_id": company_id})
+
+
+def current_supervisors(session, company_id):
+    """
+    Supervisor pointers of the company as stored right now, for cycle checks inside the writing
+    transaction (the index above may be stale). Takes the supervisor lock of the company first.
+    """
+    lock_supervisors(session, company_id)
+    return dict(session.query(User.id, User.supervisor_id).filter(User.company_id == company_id).all())
+
+
+def supervisor_chain(session, company_id, user_id):
+    """
+    Ids of user_id and all its supervisors up to the top as stored right now, with one recursive
+    query instead of the whole company. Takes the supervisor lock of the company first.
+    """
+    lock_supervisors(session, company_id)
+    chain = select(User.id, User.supervisor_id).where(User.company_id == company_id, User.id == user_id).cte("supervisor_chain", recursive=True)
+    parent = aliased(User)
+    # UNION statt UNION ALL, ein schon gespeicherter Zyklus endet so trotzdem
+    chain = chain.union(
+        select(parent.id, parent.supervisor_id).join(chain, parent.id == chain.c.supervisor_id).where(parent.company_id == company_id)
+    )
+    return set(session.execute(select(chain.c.id)).scalars())
+
+
+class HierarchyIndex:
+    """
+    Lazily built OrgHierarchy per company. Write endpoints patch the index in place and tell
+    the other replicas to rebuild theirs, HIERARCHY_INDEX_TTL bounds how long changes made
+    elsewhere can go unnoticed.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._companies = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, company_id):
+        with self._lock:
+            hierarchy = self._companies.get(company_id)
+        if hierarchy is None or hierarchy.built_at + self.ttl < time.monotonic():
+            rows = session.query(User.id, User.supervisor_id, User.layer_id, User.group_id).filter(User.company_id == company_id).all()
+            hierarchy = OrgHierarchy(rows)
+            with self._lock:
+                self._companies[company_id] = hierarchy
+        return hierarchy
+
+    def add_user(self, company_id, user_id, supervisor_id, layer_id, group_id):
+        with self._lock:
+            hierarchy = self._companies.get(company_id)
+        if hierarchy is not None:
+            hierarchy.add(user_id, supervisor_id, layer_id, group_id)
+        publish("hierarchy", company_id=company_id)
+
+    def update_user(self, company_id, user_id, **changes):
+        self.update_users(company_id, [user_id], **changes)
+
+    def update_users(self, company_id, user_ids, **changes):
+        self.apply(company_id, dict.fromkeys(user_ids, changes))
+
+    def apply(self, company_id, changes: dict):
+        # {user_id: {Feld: Wert}}, ein Event für alle Änderungen
+        with self._lock:
+            hierarchy = self._companies.get(company_id)
+        if hierarchy is not None:
+            for user_id, values in changes.items():
+                hierarchy.update(user_id, **values)
+        publish("hierarchy", company_id=company_id)
+
+    def invalidate(self, company_id=None):
+        self.drop(company_id)
+        publish("hierarchy", company_id=company_id)
+
+    def drop(self, company_id=None):
+        with self._lock:
+            if company_id is None:
+                self._companies.clear()
+            else:
+                self._companies.pop(company_id, None)
+
+
+org_index = HierarchyIndex(HIERARCHY_INDEX_TTL)
+subscribe("hierarchy", lambda event: org_index.drop(event["company_id"]))
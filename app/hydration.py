@@ -0,0 +1,210 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import aliased
+
+from backend_db_lib.models import User, Layer, Group, Role, Company
+from cache import reference_cache, reference_key
+
+
+# Felder, die nie in einer User-Antwort landen dürfen
+USER_HIDDEN_FIELDS = ("password_hash", "company_id", "role_id", "group_id", "layer_id")
+
+# Name im Response -> (Model, Fremdschlüssel)
+USER_RELATIONS = {
+    "company": (Company, "company_id"),
+    "role": (Role, "role_id"),
+    "group": (Group, "group_id"),
+    "layer": (Layer, "layer_id"),
+}
+COMPANY_RELATION = {"company": (Company, "company_id")}
+
+# Alles, was per fields= abgefragt werden kann
+USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs if attr.key not in USER_HIDDEN_FIELDS]
+USER_FIELDS = USER_COLUMNS + list(USER_RELATIONS)
+# Bulk-Lookup zusätzlich mit der Supervisor-Zusammenfassung wie bei user/{id}
+LOOKUP_FIELDS = USER_FIELDS + ["supervisor"]
+
+
+def entity_to_dict(entity, exclude=()):
+    if entity is None:
+        return None
+    return {
+        attr.key: getattr(entity, attr.key)
+        for attr in inspect(entity).mapper.column_attrs
+        if attr.key not in exclude
+    }
+
+
+def user_to_dict(user, company, role, group, layer):
+    data = entity_to_dict(user, exclude=USER_HIDDEN_FIELDS)
+    data["company"] = entity_to_dict(company)
+    data["role"] = entity_to_dict(role)
+    data["group"] = entity_to_dict(group)
+    data["layer"] = entity_to_dict(layer)
+    return data
+
+
+def query_hydrated_users(session):
+    # User, Supervisor-Zusammenfassung und alle Referenzdaten in einem SELECT
+    supervisor = aliased(User)
+    return (
+        session.query(User, supervisor.id, supervisor.first_name, supervisor.last_name, Company, Role, Group, Layer)
+        .outerjoin(supervisor, supervisor.id == User.supervisor_id)
+        .outerjoin(Company, Company.id == User.company_id)
+        .outerjoin(Role, Role.id == User.role_id)
+        .outerjoin(Group, Group.id == User.group_id)
+        .outerjoin(Layer, Layer.id == User.layer_id)
+    )
+
+
+def hydrate_user_row(row):
+    user, supervisorid, supervisorfirst_name, supervisorlast_name, company, role, group, layer = row
+    data = user_to_dict(user, company, role, group, layer)
+    if user.supervisor_id is not None:
+        data["supervisorid"] = supervisorid
+        data["supervisorlast_name"] = supervisorlast_name
+        data["supervisorfirst_name"] = supervisorfirst_name
+    return data
+
+
+def fetch_by_ids(session, model, ids):
+    # Referenzdaten als dicts, zuerst aus dem Cache, der Rest mit einem IN (...) Query
+    result = {}
+    missing = set()
+    for i in {i for i in ids if i is not None}:
+        cached = reference_cache.get(reference_key(model, i))
+        if cached is None:
+            missing.add(i)
+        else:
+            result[i] = cached
+
+    if missing:
+        for entity in session.query(model).filter(model.id.in_(missing)).all():
+            result[entity.id] = entity_to_dict(entity)
+            reference_cache.set(reference_key(model, entity.id), result[entity.id])
+    return result
+
+
+def hydrate_rows(session, entities, relations, exclude=()):
+    # Ein IN (...) Query pro Relation, danach Join im Speicher
+    lookups = {
+        name: fetch_by_ids(session, model, (getattr(entity, fk) for entity in entities))
+        for name, (model, fk) in relations.items()
+    }
+
+    result = []
+    for entity in entities:
+        data = entity_to_dict(entity, exclude=exclude)
+        for name, (model, fk) in relations.items():
+            data[name] = lookups[name].get(getattr(entity, fk))
+        result.append(data)
+    return result
+
+
+def query_company_references(session, model, company_id, ids=None):
+    # Layer/Gruppen einer Company direkt aus der DB, optional nur die mit den angegebenen ids
+    query = session.query(model).where(model.company_id == company_id)
+    if ids is not None:
+        query = query.where(model.id.in_(list(ids)))
+    return hydrate_rows(session, query.all(), COMPANY_RELATION)
+
+
+def company_references(session, model, company_id, list_name, version):
+    # Alle Layer/Gruppen einer Company, gecached pro Datenversion (ETag). Ohne Version (Store nicht erreichbar) kein Cache
+    if version is None:
+        return query_company_references(session, model, company_id)
+    key = (list_name, company_id, version)
+    cached = reference_cache.get(key)
+    if cached is None:
+        cached = query_company_references(session, model, company_id)
+        reference_cache.set(key, cached)
+    return cached
+
+
+def hydrate_users(session, users):
+    return hydrate_rows(session, users, USER_RELATIONS, exclude=USER_HIDDEN_FIELDS)
+
+
+def hydrate_users_by_ids(session, user_ids, chunksize=10000):
+    # Reihenfolge von user_ids bleibt erhalten, IN-Listen werden für große Mengen gestückelt
+    users = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), chunksize):
+        for user in session.query(User).filter(User.id.in_(user_ids[start:start + chunksize])).all():
+            users[user.id] = user
+    return hydrate_users(session, [users[user_id] for user_id in user_ids if user_id in users])
+
+
+def query_user_page(session, filters, after_id=None, limit=None, fields=None):
+    """
+    Keyset page over User.id. Only the requested columns (plus the foreign keys the requested
+    relations need) are selected. Returns the rows and the id to continue after, or None.
+    """
+    fields = fields or USER_FIELDS
+    columns = [column for column in USER_COLUMNS if column in fields]
+    relations = {name: USER_RELATIONS[name] for name in fields if name in USER_RELATIONS}
+    selected = list(dict.fromkeys(["id"] + columns + [fk for _, fk in relations.values()]))
+
+    query = session.query(*(getattr(User, column) for column in selected)).filter(*filters)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    query = query.order_by(User.id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    rows = [row._mapping for row in query.all()]
+
+    next_after = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1]["id"]
+
+    lookups = {
+        name: fetch_by_ids(session, model, (row[fk] for row in rows))
+        for name, (model, fk) in relations.items()
+    }
+    result = []
+    for row in rows:
+        data = {column: row[column] for column in columns}
+        for name, (model, fk) in relations.items():
+            data[name] = lookups[name].get(row[fk])
+        result.append(data)
+    return result, next_after
+
+
+def hydrate_user(session, user_id: int):
+    row = query_hydrated_users(session).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    return hydrate_user_row(row)
+
+
+def lookup_users(session, company_id: int, key: str, values, fields=None):
+    """
+    Hydrated users of the company whose `key` column ("id" or "email") is in `values`, in the
+    order of `values`. One query for the users, one IN (...) per relation and one for the supervisors.
+    Returns the users and the values that were not found.
+    """
+    fields = fields or LOOKUP_FIELDS
+    with_supervisor = "supervisor" in fields
+    # key und supervisor_id werden intern gebraucht, auch wenn sie nicht angefragt sind
+    page_fields = list(dict.fromkeys([field for field in fields if field != "supervisor"] + [key] + (["supervisor_id"] if with_supervisor else [])))
+    values = list(dict.fromkeys(values))
+    users, _ = query_user_page(session, [User.company_id == company_id, getattr(User, key).in_(values)], fields=page_fields)
+
+    if with_supervisor:
+        supervisor_ids = {user["supervisor_id"] for user in users if user["supervisor_id"] is not None}
+        supervisors = {}
+        if supervisor_ids:
+            supervisors = {row.id: row for row in session.query(User.id, User.first_name, User.last_name).filter(User.id.in_(supervisor_ids)).all()}
+        for user in users:
+            supervisor = supervisors.get(user["supervisor_id"])
+            if supervisor is not None:
+                user["supervisorid"] = supervisor.id
+                user["supervisorfirst_name"] = supervisor.first_name
+                user["supervisorlast_name"] = supervisor.last_name
+
+    by_key = {user[key]: user for user in users}
+    internal = [field for field in page_fields if field not in fields]
+    for user in users:
+        for field in internal:
+            del user[field]
+    return [by_key[value] for value in values if value in by_key], [value for value in values if value not in by_key]
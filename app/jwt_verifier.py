@@ -0,0 +1,104 @@
+# Lokale Token-Prüfung für andere Services, statt für jeden Request validateJWT aufzurufen.
+# Braucht nur PyJWT (FastAPI nur für bearer_dependency), die Datei kann in andere Services kopiert werden:
+#
+#   verifier = JWTVerifier.from_env()          # JWT_KEYS="v2:neues-secret,v1:altes-secret"
+#   payload = verifier.verify(token)           # dict oder None
+#   app.get("/x")(lambda payload=Depends(bearer_dependency(verifier)): ...)
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import jwt
+
+
+class JWTVerifier:
+    """
+    Verifies tokens issued by the user management service. The signing key is picked by the
+    `kid` header, so keys can be rotated: the service signs with the newest key while verifiers
+    still accept the older ones. Tokens without `kid` (issued before rotation) use `default_kid`.
+    Verified claims are cached by the token's SHA-256 until they expire.
+    """
+
+    def __init__(self, keys: dict, default_kid: str = None, algorithms=("HS256",), cache_size: int = 10000):
+        self.keys = dict(keys)
+        self.default_kid = default_kid if default_kid is not None else next(iter(self.keys), None)
+        self.algorithms = list(algorithms)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, keys_var: str = "JWT_KEYS", algorithm_var: str = "JWT_ALGORITHM"):
+        # "kid:secret,kid:secret", der erste Key ist der aktuelle
+        keys = dict(entry.split(":", 1) for entry in os.environ[keys_var].split(",") if entry.strip())
+        return cls(keys, algorithms=[os.environ.get(algorithm_var, "HS256")])
+
+    def add_key(self, kid: str, key: str):
+        self.keys[kid] = key
+
+    def remove_key(self, kid: str):
+        # Tokens mit diesem Key werden sofort ungültig, auch bereits gecachte
+        self.keys.pop(kid, None)
+        with self._lock:
+            self._cache.clear()
+
+    def verify(self, token: str):
+        cache_key = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            payload = self._cache.get(cache_key)
+        if payload is None:
+            payload = self.decode(token)
+            if payload is None:
+                return None
+            with self._lock:
+                self._cache[cache_key] = payload
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        # expires wird auch bei Cache-Treffern geprüft
+        if payload.get("expires", 0) < time.time():
+            with self._lock:
+                self._cache.pop(cache_key, None)
+            return None
+        return dict(payload)
+
+    def verify_many(self, tokens):
+        return [self.verify(token) for token in tokens]
+
+    def kid(self, token: str):
+        # kid aus dem noch nicht geprüften Header, None bei kaputten Tokens
+        try:
+            return jwt.get_unverified_header(token).get("kid", self.default_kid)
+        except jwt.InvalidTokenError:
+            return None
+
+    def decode(self, token: str):
+        # Nur Signatur und kid prüfen, ohne Cache und ohne expires
+        try:
+            key = self.keys.get(self.kid(token))
+            if key is None:
+                return None
+            return jwt.decode(token, key, algorithms=self.algorithms)
+        except jwt.InvalidTokenError:
+            return None
+
+
+def bearer_dependency(verifier: JWTVerifier):
+    # FastAPI-Dependency wie get_token_payload in auth_handler.py, liefert die Claims
+    from fastapi import Header, HTTPException
+
+    def token_payload(authorization: str | None = Header(default=None)):
+        if authorization is None:
+            raise HTTPException(status_code=403, detail="Invalid authorization code.")
+        scheme, _, token = authorization.partition(" ")
+        if scheme != "Bearer":
+            raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
+        payload = verifier.verify(token.strip())
+        if payload is None:
+            raise HTTPException(status_code=403, detail="Invalid token or expired token.")
+        return payload
+
+    return token_payload
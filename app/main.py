@@ -1,26 +1,85 @@
 import os
-import uvicorn
-from typing import Union
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Union
 
-from fastapi import FastAPI, Depends, Header, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from fastapi.testclient import TestClient
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 
-from config import DATABASE_URL
-from auth_handler import sign_jwt, JWTBearer, decode_jwt
+from config import DATABASE_URL, ASYNC_DB_ENABLED, HOST, PORT, WORKERS, RELOAD, USER_LIST_MAX_LIMIT, USER_LOOKUP_MAX, SEARCH_MAX_LIMIT, USER_BATCH_UPDATE_MAX, REORG_MAX_CHANGES, JWT_BATCH_MAX, DIRECTORY_CHUNK_SIZE, MIGRATE_ON_STARTUP
+from auth_handler import sign_jwt, JWTBearer, decode_jwt, get_token_payload
 from backend_db_lib.models import User, base, Layer, Group, Role, Company
-from backend_db_lib.manager import DatabaseManager
+from database import PooledDatabaseManager, render_pool_metrics
+from async_database import AsyncDatabaseManager
+from passwords import hash_password_async, verify_password_async
+from bulk_import import import_users, open_request_body, CONTENT_TYPES
+from hydration import hydrate_user, hydrate_users_by_ids, fetch_by_ids, company_references, query_company_references, query_user_page, lookup_users, USER_FIELDS, LOOKUP_FIELDS
+from pagination import encode_cursor, decode_cursor, parse_fields
+from schemas import UserResponse, UserListResponse, UserLookupResponse, LayerListResponse, GroupListResponse
+from hierarchy import org_index
+from search import search_users, search_index
+from org_stats import cached_org_statistics
+from user_updates import UPDATABLE_FIELDS, update_users, creates_cycle, missing_target, plan_reorg, apply_reorg
+from changelog import record_changes, changes_since, current_version, create_tables
+from etag import data_versions, not_modified, cache_headers
+from profiling import RequestMetricsMiddleware, ProfiledORJSONResponse, instrument_engine, request_metrics
+from migrations import upgrade, migration_lock
+from ratelimit import account_attempts, client_ip, login_blocked, login_failed, login_succeeded
+from cache import reference_cache, user_cache, shared_store, reference_key, run_store
 from fastapi.middleware.cors import CORSMiddleware
-import json
-import pandas as pd
+import orjson
+
+
+
+logger = logging.getLogger(__name__)
+
+# Engines werden erst im Lifespan (bzw. beim ersten Zugriff) angelegt, der Import bleibt schnell
+dbm = PooledDatabaseManager(base, DATABASE_URL, on_engine=instrument_engine)
+async_dbm = AsyncDatabaseManager(DATABASE_URL, on_engine=instrument_engine) if ASYNC_DB_ENABLED else None
+
+
+def create_change_log(engine):
+    # Jeder Schreibzugriff protokolliert, die Tabellen dürfen nicht erst mit Migration 0003 kommen.
+    # Mehrere Worker starten gleichzeitig, daher unter dem Migrations-Lock
+    with migration_lock(engine):
+        create_tables(engine)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if MIGRATE_ON_STARTUP:
+        # upgrade() nimmt selbst den Migrations-Lock, parallel startende Worker warten
+        await run_in_threadpool(lambda: upgrade(dbm.engine))
+    # Ohne Änderungsprotokoll schlägt jeder Schreibzugriff fehl, daher hier wie upgrade() ohne try:
+    # lieber kein Start als ein Worker, der bis zum Neustart 500 liefert
+    await run_in_threadpool(lambda: create_change_log(dbm.engine))
+    # Je eine Verbindung vorab öffnen, damit der erste Request nicht auf Engine und Verbindungsaufbau wartet
+    try:
+        await run_in_threadpool(lambda: dbm.engine.connect().close())
+        if async_dbm is not None:
+            async with async_dbm.engine.connect():
+                pass
+    except Exception as e:
+        logger.warning("Database not reachable at startup: %s", e)
+    # Invalidierungen der anderen Replicas empfangen
+    if shared_store is not None:
+        shared_store.start()
+    yield
+    if async_dbm is not None:
+        await async_dbm.dispose()
+    dbm.dispose()
+    if shared_store is not None:
+        shared_store.stop()
 
 
-
-dbm = DatabaseManager(base, DATABASE_URL)
 app = FastAPI(docs_url="/api/user_management/docs",
               redoc_url="/api/user_management/redoc",
-              openapi_url="/api/user_management/openapi.json")
-client = TestClient(app)
+              openapi_url="/api/user_management/openapi.json",
+              default_response_class=ProfiledORJSONResponse,
+              lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +88,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Latenz, SQL-Statements und DB/JWT/Serialisierungs-Zeit pro Route, siehe /metrics
+app.add_middleware(RequestMetricsMiddleware)
+
+
+async def run_in_session(fn):
+    # DB-Zugriffe aus async Handlern: async Engine falls aktiviert, sonst sync Session im Threadpool
+    if async_dbm is not None:
+        return await async_dbm.run_sync(fn)
+
+    def with_session():
+        with dbm.create_session() as session:
+            return fn(session)
+
+    return await run_in_threadpool(with_session)
+
+
+def typed_response(content, etag: str = None):
+    # Die dicts aus hydration.py passen schon zum response_model der Route: direkt mit orjson rendern, statt sie
+    # noch einmal zu validieren und durch jsonable_encoder zu schicken. Das response_model bleibt für die OpenAPI-Doku
+    return ProfiledORJSONResponse(content, headers=cache_headers(etag) if etag is not None else None)
+
+
+async def user_page(filters, cursor, limit, fields):
+    # Keyset-Pagination über User.id, optional nur ausgewählte Felder
+    after_id = decode_cursor(cursor)
+    fields = parse_fields(fields, USER_FIELDS)
+    data, next_after = await run_in_session(lambda session: query_user_page(session, filters, after_id, limit, fields))
+
+    return typed_response({"result": 1, "data": data, "next_cursor": encode_cursor(next_after) if next_after is not None else None})
 
 # Login
 class LoginData(BaseModel):
@@ -50,29 +138,44 @@ class LoginDataResponse(BaseModel):
 
 
 @app.post("/api/user_management/login/")
-def login_user(login_data: LoginData):
-    with dbm.create_session() as session:
-        # todo: add password hashing
-        valid_user = session.query(User).filter(
-            (User.email == login_data.email)
-            & (User.generate_hash(login_data.password) == User.password_hash)
-        )
-        if valid_user.count() > 0:
-            roleasstring = session.query(Role).get(valid_user.first().role_id)
-            jwt = sign_jwt(valid_user.first().id, valid_user.first(
-            ).company_id, roleasstring.role_name)
-            return LoginDataResponse(result=1, token=jwt)
-        else:
-            return LoginDataResponse(result=0, token=None)
+async def login_user(login_data: LoginData, request: Request):
+    # Gesperrte IPs/Accounts werden vor DB-Zugriff und Hashing abgewiesen
+    ip = client_ip(request)
+    if await run_store(login_blocked, login_data.email, ip):
+        raise HTTPException(status_code=429, detail="Too many failed login attempts",
+                            headers={"Retry-After": str(account_attempts.retry_after())})
+
+    # User und Rolle in einer Query
+    valid_user = await run_in_session(lambda session: session.query(User.id, User.company_id, User.password_hash, Role.role_name).outerjoin(
+        Role, Role.id == User.role_id
+    ).filter(
+        User.email == login_data.email
+    ).first())
+
+    # Passwort wird im Hash-Pool geprüft, nicht im SQL-Filter
+    valid, new_hash = await verify_password_async(login_data.password, valid_user.password_hash if valid_user else None)
+    if not valid:
+        await run_store(login_failed, login_data.email, ip)
+        return LoginDataResponse(result=0, token=None)
+    await run_store(login_succeeded, login_data.email, ip)
+
+    if new_hash is not None:
+        # Alte Hashes transparent auf den aktuellen Algorithmus/Work-Factor heben
+        def rehash(session):
+            session.query(User).filter(User.id == valid_user.id).update({"password_hash": new_hash})
+            session.commit()
+
+        await run_in_session(rehash)
+    jwt = sign_jwt(valid_user.id, valid_user.company_id, valid_user.role_name)
+    return LoginDataResponse(result=1, token=jwt)
 
 # Logout
 @app.post("/api/user_management/logout/")
-def logout_user(authorization: str | None = Header(default=None)):
-    uid = decode_jwt(authorization.replace(
-        "Bearer", "").strip()).get("user_id")
+def logout_user(token: dict = Depends(get_token_payload)):
+    uid = token.get("user_id")
     with dbm.create_session() as session:
         user = session.query(User).where(User.id == uid)
-    return {"result": 1, "first_name": user.first().first_name, "last_name": user.first().last_name}
+        return {"result": 1, "first_name": user.first().first_name, "last_name": user.first().last_name}
 
 # validate JWT
 @app.post("/api/user_management/validateJWT/")
@@ -84,18 +187,76 @@ def validate_user(jwt: str):
         raise HTTPException(status_code=401, detail="JWT not valid")
 
 
+# Viele Tokens in einem Call prüfen, Ergebnisse in der Reihenfolge der Anfrage
+class ValidateJWTBatch(BaseModel):
+    tokens: List[str]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "tokens": ["eyJhbGciOiJIUzI1NiIs...", "eyJhbGciOiJIUzI1NiIs..."]
+            }
+        }
+
+
+@app.post("/api/user_management/validateJWT/batch/")
+def validate_users(batch: ValidateJWTBatch):
+    if len(batch.tokens) > JWT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {JWT_BATCH_MAX} tokens per request")
+    payloads = {token: decode_jwt(token.strip()) for token in set(batch.tokens)}
+    return {"result": 1, "data": [{"result": 0} if payloads[token] is None else {"result": 1, "payload": payloads[token]} for token in batch.tokens]}
+
+
 # Layer abfragen
-@app.get("/api/user_management/layers/")
-def get_layers(authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        cid = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("company_id")
-        alllayers = session.query(Layer).where(Layer.company_id == cid).all()
+@app.get("/api/user_management/layers/", response_model=LayerListResponse, response_model_exclude_unset=True)
+async def get_layers(request: Request, response: Response, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+    etag = await run_store(data_versions.etag, "layers", cid)
+    cached_response = not_modified(request, response, etag)
+    if cached_response is not None:
+        return cached_response
+    alllayers = await run_in_session(lambda session: company_references(session, Layer, cid, "layers", etag))
+
+    return typed_response({"result": 1, "data": alllayers}, etag)
+
+
+def write_permission(token: dict):
+    urole = token.get("role")
+    if (urole != "ceo" and urole != "admin"):
+        raise HTTPException(status_code=404, detail="No Permission")
+
+
+async def users_changed(company_id, user_ids, values):
+    # Nach dem Commit: Hierarchie-Index und ETags der Company, die Cache-Schlüssel enthalten die Version
+    def changed():
+        org_index.update_users(company_id, user_ids, **values)
+        data_versions.bump(company_id)
+
+    await run_store(changed)
+
+
+async def update_user_attributes(user_id: int, values: dict, token: dict):
+    # Ein UPDATE ... RETURNING, danach ein gejointer Read für die Antwort
+    write_permission(token)
+    if not values:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    cid = token.get("company_id")
+
+    def write(session):
+        if creates_cycle(session, cid, [user_id], values):
+            raise HTTPException(status_code=400, detail="Supervisor change would create a cycle")
+        if not update_users(session, cid, [user_id], values):
+            return None, missing_target(session, cid, values)
+        return hydrate_user(session, user_id), None
 
-        for layer in alllayers:
-            layer.company = session.query(Company).get(layer.company_id)
+    userinfo, missing = await run_in_session(write)
+    if userinfo is None:
+        raise HTTPException(status_code=404, detail=f"{missing} not found in your company" if missing else "User not found")
+    await users_changed(cid, [user_id], values)
 
-        return {"result": 1, "data": alllayers}
+    return {"result": 1, "id": userinfo["id"], "first_name": userinfo["first_name"], "last_name": userinfo["last_name"], "email": userinfo["email"], "profile_picture_url": userinfo["profile_picture_url"],
+            "supervisor": {"supervisorid": userinfo.get("supervisorid"), "first_name": userinfo.get("supervisorfirst_name"), "last_name": userinfo.get("supervisorlast_name")},
+            "layer": userinfo["layer"], "company": userinfo["company"], "group": userinfo["group"], "role": userinfo["role"]}
 
 
 # User einem Layer hinzufügen
@@ -111,33 +272,8 @@ class AddLayerToUser(BaseModel):
 
 
 @app.post("/api/user_management/user/layer/{user_id}")
-def post_user_layer(user_id: int, user_layer_data: AddLayerToUser, authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        urole = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("role")
-        if (urole != "ceo" and urole != "admin"):
-            raise HTTPException(status_code=404, detail="No Permission")
-        else:
-            user = session.query(User).filter(User.id == user_id)
-            session.query(User).filter(User.id == user.first().id).update(
-                {'layer_id': user_layer_data.layer_id})
-            session.commit()
-
-            if user.first().supervisor_id != None:
-                supervisorid = session.query(User).get(user.first().supervisor_id).id
-                supervisorlast_name = session.query(User).get(user.first().supervisor_id).last_name
-                supervisorfirst_name = session.query(User).get(user.first().supervisor_id).first_name
-            else:
-                supervisorid = None
-                supervisorlast_name = None
-                supervisorfirst_name = None
-
-            company = session.query(Company).get(user.first().company_id)
-            role = session.query(Role).get(user.first().role_id)
-            group = session.query(Group).get(user.first().group_id)
-            layer = session.query(Layer).get(user.first().layer_id)
-
-    return {"result": 1, "id": user.first().id, "first_name": user.first().first_name, "last_name": user.first().last_name, "email": user.first().email,  "profile_picture_url": user.first().profile_picture_url, "supervisor": {"supervisorid": supervisorid, "first_name": supervisorfirst_name, "last_name": supervisorlast_name, "last_name": supervisorlast_name}, "layer": layer,"company": company, "group": group, "role": role}
+async def post_user_layer(user_id: int, user_layer_data: AddLayerToUser, token: dict = Depends(get_token_payload)):
+    return await update_user_attributes(user_id, {"layer_id": user_layer_data.layer_id}, token)
 
 
 # User einer Gruppe hinzufügen
@@ -153,33 +289,132 @@ class AddLayerToGroup(BaseModel):
 
 
 @app.post("/api/user_management/user/group/{user_id}")
-def post_user_group(user_id: int, user_group_data: AddLayerToGroup, authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        urole = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("role")
-        if (urole != "ceo" and urole != "admin"):
-            raise HTTPException(status_code=404, detail="No Permission")
-        else:
-            user = session.query(User).filter(User.id == user_id)
-            session.query(User).filter(User.id == user.first().id).update(
-                {'group_id': user_group_data.group_id})
-            session.commit()
+async def post_user_group(user_id: int, user_group_data: AddLayerToGroup, token: dict = Depends(get_token_payload)):
+    return await update_user_attributes(user_id, {"group_id": user_group_data.group_id}, token)
 
-            if user.first().supervisor_id != None:
-                supervisorid = session.query(User).get(user.first().supervisor_id).id
-                supervisorlast_name = session.query(User).get(user.first().supervisor_id).last_name
-                supervisorfirst_name = session.query(User).get(user.first().supervisor_id).first_name
-            else:
-                supervisorid = None
-                supervisorlast_name = None
-                supervisorfirst_name = None
 
-            company = session.query(Company).get(user.first().company_id)
-            role = session.query(Role).get(user.first().role_id)
-            group = session.query(Group).get(user.first().group_id)
-            layer = session.query(Layer).get(user.first().layer_id)
+# Layer, Gruppe, Vorgesetzten und/oder Rolle eines Users ändern, nur gesetzte Felder werden geschrieben
+class UpdateUserData(BaseModel):
+    layer_id: Union[int, None] = None
+    group_id: Union[int, None] = None
+    supervisor_id: Union[int, None] = None
+    role_id: Union[int, None] = None
 
-    return {"result": 1, "id": user.first().id, "first_name": user.first().first_name, "last_name": user.first().last_name, "email": user.first().email,  "profile_picture_url": user.first().profile_picture_url, "supervisor": {"supervisorid": supervisorid, "first_name": supervisorfirst_name, "last_name": supervisorlast_name}, "layer": layer,"company": company, "group": group, "role": role}
+    class Config:
+        schema_extra = {
+            "example": {
+                "layer_id": 2,
+                "supervisor_id": 1
+            }
+        }
+
+
+@app.patch("/api/user_management/user/{user_id}")
+async def patch_user(user_id: int, user_data: UpdateUserData, token: dict = Depends(get_token_payload)):
+    values = user_data.dict(exclude_unset=True)
+    if any(values[field] is None for field in values if field != "supervisor_id"):
+        raise HTTPException(status_code=400, detail="Only supervisor_id can be removed")
+    return await update_user_attributes(user_id, values, token)
+
+
+# Viele User auf einmal verschieben, z.B. in einen anderen Layer oder eine andere Gruppe
+class BatchUpdateUserData(UpdateUserData):
+    user_ids: List[int]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "user_ids": [2, 3],
+                "group_id": 2
+            }
+        }
+
+
+@app.patch("/api/user_management/users/")
+async def patch_users(user_data: BatchUpdateUserData, token: dict = Depends(get_token_payload)):
+    write_permission(token)
+    values = user_data.dict(exclude_unset=True, exclude={"user_ids"})
+    if not values:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    if any(values[field] is None for field in values if field != "supervisor_id"):
+        raise HTTPException(status_code=400, detail="Only supervisor_id can be removed")
+    user_ids = list(dict.fromkeys(user_data.user_ids))
+    if len(user_ids) > USER_BATCH_UPDATE_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {USER_BATCH_UPDATE_MAX} users per request")
+    cid = token.get("company_id")
+
+    def write(session):
+        if creates_cycle(session, cid, user_ids, values):
+            raise HTTPException(status_code=400, detail="Supervisor change would create a cycle")
+        updated = update_users(session, cid, user_ids, values)
+        return updated, None if updated else missing_target(session, cid, values)
+
+    updated, missing = await run_in_session(write)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"{missing} not found in your company")
+    if updated:
+        await users_changed(cid, updated, values)
+
+    updated_ids = set(updated)
+    return {"result": 1, "updated": [i for i in user_ids if i in updated_ids], "not_found": [i for i in user_ids if i not in updated_ids]}
+
+
+# Reorganisation: viele User mit jeweils eigenen Änderungen, alles oder nichts in einer Transaktion
+class ReorgChange(UpdateUserData):
+    user_id: int
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "user_id": 3,
+                "group_id": 1,
+                "supervisor_id": 1
+            }
+        }
+
+
+class ReorgData(BaseModel):
+    changes: List[ReorgChange]
+    dry_run: bool = False
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "changes": [{"user_id": 2, "layer_id": 1}, {"user_id": 3, "group_id": 1, "supervisor_id": 1}],
+                "dry_run": False
+            }
+        }
+
+
+@app.post("/api/user_management/reorg/")
+async def post_reorg(reorg_data: ReorgData, token: dict = Depends(get_token_payload)):
+    write_permission(token)
+    if not reorg_data.changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    if len(reorg_data.changes) > REORG_MAX_CHANGES:
+        raise HTTPException(status_code=400, detail=f"At most {REORG_MAX_CHANGES} changes per request")
+    cid = token.get("company_id")
+    changes = [change.dict(exclude_unset=True) for change in reorg_data.changes]
+
+    def reorg(session):
+        # Prüfen (eine Query pro Feld), Zyklen gegen den aktuellen Stand suchen, dann gebündelt schreiben
+        planned, errors = plan_reorg(session, cid, changes)
+        if planned and not errors and not reorg_data.dry_run:
+            apply_reorg(session, cid, planned)
+        return planned, errors
+
+    planned, errors = await run_in_session(reorg)
+    if errors:
+        raise HTTPException(status_code=400, detail={"message": "Reorg rejected, nothing was changed", "errors": errors})
+    if planned and not reorg_data.dry_run:
+        def reorganized():
+            org_index.apply(cid, planned)
+            data_versions.bump(cid)
+
+        await run_store(reorganized)
+
+    return {"result": 1, "dry_run": reorg_data.dry_run, "updated": len(planned), "unchanged": len(changes) - len(planned),
+            "changes": {field: sum(field in values for values in planned.values()) for field in UPDATABLE_FIELDS}}
 
 
 # Layer hinzufügen
@@ -197,21 +432,30 @@ class AddLayerData(BaseModel):
 
 
 @app.post("/api/user_management/layers/")
-def post_layers(layer_data: AddLayerData, authorization: str | None = Header(default=None)):
+def post_layers(layer_data: AddLayerData, token: dict = Depends(get_token_payload)):
     with dbm.create_session() as session:
         existing_layer = session.query(Layer).filter(
-            Layer.layer_name == layer_data.layer_name
-            and Layer.company_id == decode_jwt(authorization.replace("Bearer", "").strip()).get("company_id")
+            Layer.layer_name == layer_data.layer_name,
+            Layer.company_id == token.get("company_id")
         )
         if existing_layer.count() > 0:
             raise HTTPException(status_code=404, detail="Layer already exists in the Company")
         else:
             new_layer = Layer(id=None, layer_name=layer_data.layer_name, layer_number=layer_data.layer_number,
-                              company_id=decode_jwt(authorization.replace("Bearer", "").strip()).get("company_id"))
+                              company_id=token.get("company_id"))
             session.add(new_layer)
-            session.commit()
-
-            company = session.query(Company).get(new_layer.company_id)
+            try:
+                session.flush()
+                record_changes(session, new_layer.company_id, "layer", [new_layer.id])
+                session.commit()
+            except IntegrityError:
+                # uq_layer_company_name, gleichzeitig angelegt
+                session.rollback()
+                raise HTTPException(status_code=404, detail="Layer already exists in the Company")
+            reference_cache.invalidate(reference_key(Layer, new_layer.id))
+            data_versions.bump(new_layer.company_id)
+
+            company = fetch_by_ids(session, Company, [new_layer.company_id]).get(new_layer.company_id)
 
             return {"result": 1, "id": new_layer.id, "layer_name": new_layer.layer_name, "layer_number": new_layer.layer_number, "company": company}
 
@@ -229,22 +473,30 @@ class AddGroupData(BaseModel):
 
 
 @app.post("/api/user_management/groups/")
-def post_groups(group_data: AddGroupData, authorization: str | None = Header(default=None)):
+def post_groups(group_data: AddGroupData, token: dict = Depends(get_token_payload)):
     with dbm.create_session() as session:
         existing_group = session.query(Group).filter(
-            Group.group_name == group_data.group_name
-            and Group.company_id == decode_jwt(authorization.replace("Bearer", "").strip()).get("company_id")
+            Group.group_name == group_data.group_name,
+            Group.company_id == token.get("company_id")
         )
         if existing_group.count() > 0:
             raise HTTPException(status_code=404, detail="Group already exists in the Company")
             
         else:
-            new_group = Group(id=None, group_name=group_data.group_name, company_id=decode_jwt(
-                authorization.replace("Bearer", "").strip()).get("company_id"))
+            new_group = Group(id=None, group_name=group_data.group_name, company_id=token.get("company_id"))
             session.add(new_group)
-            session.commit()
-
-            company = session.query(Company).get(new_group.company_id)
+            try:
+                session.flush()
+                record_changes(session, new_group.company_id, "group", [new_group.id])
+                session.commit()
+            except IntegrityError:
+                # uq_group_company_name, gleichzeitig angelegt
+                session.rollback()
+                raise HTTPException(status_code=404, detail="Group already exists in the Company")
+            reference_cache.invalidate(reference_key(Group, new_group.id))
+            data_versions.bump(new_group.company_id)
+
+            company = fetch_by_ids(session, Company, [new_group.company_id]).get(new_group.company_id)
 
             return {"result": 1, "id": new_group.id, "group_name": new_group.group_name, "company": company}
 
@@ -279,168 +531,280 @@ class AddUserData(BaseModel):
 
 
 @app.post("/api/user_management/register/")
-def register(user_data: AddUserData):
-    with dbm.create_session() as session:
+async def register(user_data: AddUserData):
+    password_hash = await hash_password_async(user_data.password_hash)
+
+    def create_user(session):
         existing_user = session.query(User).filter(
             User.email == user_data.email
         )
         if existing_user.count() > 0:
             raise HTTPException(status_code=404, detail="Email already registered")
         else:
-            new_user = User(id=None, first_name=user_data.first_name, last_name=user_data.last_name, email=user_data.email, password=User.generate_hash(user_data.password_hash),
+            new_user = User(id=None, first_name=user_data.first_name, last_name=user_data.last_name, email=user_data.email, password=password_hash,
                             profile_picture_url=None, supervisor_id=user_data.supervisor_id, layer_id=user_data.layer_id, company_id=user_data.company_id, group_id=user_data.group_id, role_id=user_data.role_id)
             session.add(new_user)
+            session.flush()
+            record_changes(session, new_user.company_id, "user", [new_user.id])
             session.commit()
-            return {"result": 1, "id": new_user.id, "first_name": new_user.first_name, "last_name": new_user.last_name}
+            return {column: getattr(new_user, column) for column in ("id", "company_id", "supervisor_id", "layer_id", "group_id", "first_name", "last_name", "email")}
+
+    new_user = await run_in_session(create_user)
+
+    # Indizes und ETags nach dem Commit, außerhalb der Session
+    def user_created():
+        org_index.add_user(new_user["company_id"], new_user["id"], new_user["supervisor_id"], new_user["layer_id"], new_user["group_id"])
+        search_index.add_user(new_user["company_id"], new_user["id"], new_user["first_name"], new_user["last_name"], new_user["email"])
+        data_versions.bump(new_user["company_id"])
+
+    await run_store(user_created)
+    return {"result": 1, "id": new_user["id"], "first_name": new_user["first_name"], "last_name": new_user["last_name"]}
+
+# Mehrere User auf einmal anlegen, Body als CSV oder NDJSON (eine Zeile pro User)
+@app.post("/api/user_management/register/bulk/")
+async def register_bulk(request: Request, import_format: str | None = Query(default=None, alias="format"), token: dict = Depends(get_token_payload)):
+    urole = token.get("role")
+    if (urole != "ceo" and urole != "admin"):
+        raise HTTPException(status_code=404, detail="No Permission")
+
+    import_format = import_format or CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if import_format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+
+    with open_request_body(request) as file:
+        report = await import_users(file, import_format, token.get("company_id"), run_in_session)
+
+    def imported():
+        org_index.invalidate(token.get("company_id"))
+        search_index.invalidate(token.get("company_id"))
+        data_versions.bump(token.get("company_id"))
+
+    await run_store(imported)
+
+    return {"result": 1, **report}
 
 # Get user info
-@app.get("/api/user_management/user/{user_id}")
-def get_users_group(user_id: int):
-    with dbm.create_session() as session:
-        userinfo = session.query(User).where(User.id == user_id).first()
+@app.get("/api/user_management/user/{user_id}", response_model=UserResponse, response_model_exclude_unset=True)
+async def get_users_group(user_id: int, request: Request, response: Response):
+    etag = await run_store(data_versions.etag, f"user{user_id}")
+    cached_response = not_modified(request, response, etag)
+    if cached_response is not None:
+        return cached_response
+    # Version im Schlüssel wie bei den Statistiken: der Near Cache einer Replica kann sonst zum neuen ETag alte Daten liefern
+    userinfo = await run_store(user_cache.get, (user_id, etag)) if etag is not None else None
+    if userinfo is None:
+        userinfo = await run_in_session(lambda session: hydrate_user(session, user_id))
+        if userinfo is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        if etag is not None:
+            await run_store(user_cache.set, (user_id, etag), userinfo)
+
+    return typed_response({"result": 1, "data": userinfo}, etag)
+
+
+# Komplettes Verzeichnis einer Company als NDJSON: erst die Version, dann Layer, Gruppen und User.
+# Danach mit directory/changes/?since=<version> aktuell halten
+@app.get("/api/user_management/directory/snapshot/")
+async def get_directory_snapshot(token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+
+    def references(session):
+        # Version vor den Daten lesen, Änderungen während des Snapshots kommen im nächsten Delta nochmal.
+        # Layer/Gruppen ohne Cache, der kann älter als die Version sein
+        version = current_version(session, cid)
+        return version, query_company_references(session, Layer, cid), query_company_references(session, Group, cid)
+
+    version, layers, groups = await run_in_session(references)
+
+    async def lines():
+        yield orjson.dumps({"type": "version", "company_id": cid, "version": version}) + b"\n"
+        for kind, entries in (("layer", layers), ("group", groups)):
+            for entry in entries:
+                yield orjson.dumps({"type": kind, "data": entry}) + b"\n"
+        after_id = None
+        while True:
+            users, after_id = await run_in_session(lambda session: query_user_page(session, [User.company_id == cid], after_id, DIRECTORY_CHUNK_SIZE))
+            yield b"".join(orjson.dumps({"type": "user", "data": user}) + b"\n" for user in users)
+            if after_id is None:
+                break
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Geänderte User, Gruppen und Layer seit einer Version, aktueller Stand statt einzelner Änderungen
+@app.get("/api/user_management/directory/changes/")
+async def get_directory_changes(since: int = Query(default=0, ge=0), token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+
+    def load(session):
+        changed, version, has_more = changes_since(session, cid, since, DIRECTORY_CHUNK_SIZE)
+        users = query_user_page(session, [User.company_id == cid, User.id.in_(changed["user"])])[0] if changed["user"] else []
+        # Wie im Snapshot ohne Cache, sonst fehlen frisch committete Einträge bis zur Invalidierung
+        layers = query_company_references(session, Layer, cid, changed["layer"]) if changed["layer"] else []
+        groups = query_company_references(session, Group, cid, changed["group"]) if changed["group"] else []
+        return {"result": 1, "version": version, "has_more": has_more, "users": users, "groups": groups, "layers": layers}
+
+    return await run_in_session(load)
+
+
+# Viele User auf einmal über ids oder E-Mails, z.B. für die Anzeige von Audit-Zuständigen in anderen Services
+class UserLookupData(BaseModel):
+    ids: Union[List[int], None] = None
+    emails: Union[List[str], None] = None
+    fields: Union[str, None] = None
 
-        if userinfo.supervisor_id != None:
-            userinfo.supervisorid = session.query(User).get(userinfo.supervisor_id).id
-            userinfo.supervisorlast_name = session.query(User).get(userinfo.supervisor_id).last_name
-            userinfo.supervisorfirst_name = session.query(User).get(userinfo.supervisor_id).first_name
+    class Config:
+        schema_extra = {
+            "example": {
+                "ids": [1, 2, 3],
+                "fields": "id,first_name,last_name,supervisor,layer"
+            }
+        }
 
-        userinfo.company = session.query(Company).get(userinfo.company_id)
-        userinfo.role = session.query(Role).get(userinfo.role_id)
-        userinfo.group = session.query(Group).get(userinfo.group_id)
-        userinfo.layer = session.query(Layer).get(userinfo.layer_id)
-        delattr(userinfo, "password_hash")
-        delattr(userinfo, "company_id")
-        delattr(userinfo, "role_id")
-        delattr(userinfo, "group_id")
-        delattr(userinfo, "layer_id")
 
-        return {"result": 1, "data": userinfo}
+@app.post("/api/user_management/users/lookup/", response_model=UserLookupResponse, response_model_exclude_unset=True)
+async def lookup_users_bulk(lookup: UserLookupData, token: dict = Depends(get_token_payload)):
+    if (lookup.ids is None) == (lookup.emails is None):
+        raise HTTPException(status_code=400, detail="Send either ids or emails")
+    key, values = ("id", lookup.ids) if lookup.ids is not None else ("email", lookup.emails)
+    if len(values) > USER_LOOKUP_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {USER_LOOKUP_MAX} users per request")
+    fields = parse_fields(lookup.fields, LOOKUP_FIELDS)
+    cid = token.get("company_id")
 
+    users, not_found = await run_in_session(lambda session: lookup_users(session, cid, key, values, fields))
+    return typed_response({"result": 1, "data": users, "not_found": not_found})
+
+
+# User der eigenen Company suchen: Präfix von Vorname, Nachname oder E-Mail, optional unscharf, bester Treffer zuerst
+@app.get("/api/user_management/users/search/", response_model=UserListResponse, response_model_exclude_unset=True)
+async def search_company_users(q: str = Query(min_length=1, max_length=100), fuzzy: bool = True, cursor: str | None = None,
+                               limit: int = Query(default=20, ge=1, le=SEARCH_MAX_LIMIT), fields: str | None = None,
+                               token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+    # Cursor ist hier ein Offset, die Reihenfolge hängt vom Score ab
+    offset = decode_cursor(cursor) or 0
+    fields = parse_fields(fields, LOOKUP_FIELDS)
+
+    def search(session):
+        user_ids = search_users(session, cid, q, fuzzy, offset, limit)
+        users, _ = lookup_users(session, cid, "id", user_ids[:limit], fields)
+        return users, len(user_ids) > limit
+
+    users, has_more = await run_in_session(search)
+    return typed_response({"result": 1, "data": users, "next_cursor": encode_cursor(offset + limit) if has_more else None})
+
+
+# Kennzahlen für Dashboards: Headcount je Gruppe, Layer und Rolle, Führungsspanne je Vorgesetztem
+@app.get("/api/user_management/statistics/")
+async def get_org_statistics(request: Request, response: Response, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+    etag = await run_store(data_versions.etag, "statistics", cid)
+    cached_response = not_modified(request, response, etag)
+    if cached_response is not None:
+        return cached_response
+    stats = await run_in_session(lambda session: cached_org_statistics(session, cid, etag))
+
+    return {"result": 1, "data": stats}
+
+
+# Cache-Statistiken der Referenzdaten
+@app.get("/api/user_management/cache/")
+def get_cache_stats():
+    return {"result": 1, "data": reference_cache.stats()}
+
+
+# Pool- und Request-Metriken im Prometheus-Format
+@app.get("/api/user_management/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    engines = {"sync": dbm.engine}
+    if async_dbm is not None:
+        engines["async"] = async_dbm.engine.sync_engine
+    return "\n".join(render_pool_metrics(engines) + request_metrics.render()) + "\n"
 
-# Alle Gruppen abrufen
-@app.get("/api/user_management/groups/")
-def get_groups(authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        cid = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("company_id")
-        allgroups = session.query(Group).where(Group.company_id == cid).all()
 
-        for group in allgroups:
-            group.company = session.query(Company).get(group.company_id)
+# Alle Gruppen abrufen
+@app.get("/api/user_management/groups/", response_model=GroupListResponse, response_model_exclude_unset=True)
+async def get_groups(request: Request, response: Response, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+    etag = await run_store(data_versions.etag, "groups", cid)
+    cached_response = not_modified(request, response, etag)
+    if cached_response is not None:
+        return cached_response
+    allgroups = await run_in_session(lambda session: company_references(session, Group, cid, "groups", etag))
 
-        return {"result": 1, "data": allgroups}
+    return typed_response({"result": 1, "data": allgroups}, etag)
 
 
 # Alle User in einem Layer abfragen
-@app.get("/api/user_management/group/{group_id}")
-def get_users_group_id(group_id: int, authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        cid = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("company_id")
-        alluser = session.query(User).where(User.company_id == cid).where(User.group_id == group_id).all()
-
-        for user in alluser:
-            user.company = session.query(Company).get(user.company_id)
-            user.role = session.query(Role).get(user.role_id)
-            user.group = session.query(Group).get(user.group_id)
-            user.layer = session.query(Layer).get(user.layer_id)
-            delattr(user, "password_hash")
-            delattr(user, "company_id")
-            delattr(user, "role_id")
-            delattr(user, "group_id")
-            delattr(user, "layer_id")
-
-        return {"result": 1, "data": alluser}
-
-# (Idee: Alle Vorgesetzten einer Gruppe), hier anfänglich umgesetzt, funktioniert noch nicht ganz
-# @app.get("/groups/supervisor/{group_id}/{assigned_layer_id}/{audit_layer_id}")
-# def get_group_supervisor(group_id: int, assigned_layer_id: int, audit_layer_id: int ,authorization: str | None = Header(default=None)):
-#     with dbm.create_session() as session:
-#         cid = decode_jwt(authorization.replace("Bearer", "").strip()).get("company_id")
-#         if (assigned_layer_id == audit_layer_id):
-#             supervisors = session.query(User).where(User.layer_id == assigned_layer_id).all()
-#             return {"result": 1, "data": supervisors}
-#         else:
-#             #assigned_layer_number = session.query(Layer.Layer_number).where(Layer.id == assigned_layer_id)
-#             audit_layer_number = session.query(Layer.layer_number).where(Layer.id == audit_layer_id).first()
-
-#             employee = session.query(User).where(User.group_id == group_id).where(User.layer_id == assigned_layer_id).first()
-#             for i in range(audit_layer_number.layer_number-1): #Zweihöchste Layer
-#                 if (i == audit_layer_number.layer_number-1): #Letzter durchlauf
-#                     employee = session.query(User).where(User.id == employee.supervisor_id)
-#                     return {"result": 1, "data": employee}
-#                 else:
-#                     employee = session.query(User).where(User.id == employee.supervisor_id).first()
-        # return {"result": 1, "data": employee}
+@app.get("/api/user_management/group/{group_id}", response_model=UserListResponse, response_model_exclude_unset=True)
+async def get_users_group_id(group_id: int, cursor: str | None = None, limit: int | None = Query(default=None, ge=1, le=USER_LIST_MAX_LIMIT),
+                             fields: str | None = None, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
 
-#Alle Employees vom Audit Layer zurückgeben
-@app.get("/api/user_management/groups/employee/{group_id}/{audit_layer_id}") 
-def get_auditlayer_employee(group_id: int, audit_layer_id: int ,authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        cid = decode_jwt(authorization.replace("Bearer", "").strip()).get("company_id")
-        employeesofgroupandlayer = session.query(User).where(User.company_id == cid).where(User.layer_id == audit_layer_id).where(User.group_id == group_id).all()
-
-        for employee in employeesofgroupandlayer:
-            employee.company = session.query(Company).get(employee.company_id)
-            employee.role = session.query(Role).get(employee.role_id)
-            employee.group = session.query(Group).get(employee.group_id)
-            employee.layer = session.query(Layer).get(employee.layer_id)
-            delattr(employee, "password_hash")
-            delattr(employee, "company_id")
-            delattr(employee, "role_id")
-            delattr(employee, "group_id")
-            delattr(employee, "layer_id")
-
-        return {"result": 1, "data": employeesofgroupandlayer}
+    return await user_page([User.company_id == cid, User.group_id == group_id], cursor, limit, fields)
 
-#Alle Supervisoren im Auditlayer von den User in einer Gruppe
-@app.get("/api/user_management/groups/supervisor/{audit_layer_id}")
-def get_group_supervisor(audit_layer_id: int, authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        cid = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("company_id")
-        useroflayer = session.query(User).where(User.company_id == cid).where(User.layer_id == audit_layer_id).all()
-
-        for user in useroflayer:
-            user.company = session.query(Company).get(user.company_id)
-            user.role = session.query(Role).get(user.role_id)
-            user.group = session.query(Group).get(user.group_id)
-            user.layer = session.query(Layer).get(user.layer_id)
-            delattr(user, "password_hash")
-            delattr(user, "company_id")
-            delattr(user, "role_id")
-            delattr(user, "group_id")
-            delattr(user, "layer_id")
-
-
-        return {"result": 1, "data": useroflayer}
-
-#Alle Employees von dem Audit_layer in einer Gruppe
-@app.get("/api/user_management/groups/employee/{group_id}/{audit_layer_id}")
-def get_group_employee(group_id: int, audit_layer_id: int, authorization: str | None = Header(default=None)):
-    with dbm.create_session() as session:
-        cid = decode_jwt(authorization.replace(
-            "Bearer", "").strip()).get("company_id")
-        employeesofgroupandlayer = session.query(User.id, User.first_name, User.last_name, User.email, User.profile_picture_url, User.role_id, User.group_id,
-                                                 User.supervisor_id, User.layer_id, User.company_id).where(User.company_id == cid).where(User.layer_id == audit_layer_id).where(User.group_id == group_id).all()
+# Alle Vorgesetzten im Audit-Layer für die User einer Gruppe im zugewiesenen Layer
+@app.get("/api/user_management/groups/supervisor/{group_id}/{assigned_layer_id}/{audit_layer_id}", response_model=UserListResponse, response_model_exclude_unset=True)
+async def get_group_supervisors_by_hierarchy(group_id: int, assigned_layer_id: int, audit_layer_id: int, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+    supervisors = await run_in_session(lambda session: hydrate_users_by_ids(
+        session, org_index.get(session, cid).supervisors_for_group(group_id, assigned_layer_id, audit_layer_id)))
+
+    return typed_response({"result": 1, "data": supervisors})
+
+# Vorgesetzter eines Users in einem bestimmten Layer
+@app.get("/api/user_management/user/{user_id}/supervisor/{layer_id}", response_model=UserResponse, response_model_exclude_unset=True)
+async def get_user_supervisor_at_layer(user_id: int, layer_id: int, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
 
-        for employeeofgroupandlayer in employeesofgroupandlayer:
-            employeeofgroupandlayer.company = session.query(Company).get(employeeofgroupandlayer.company_id)
-            employeeofgroupandlayer.role = session.query(Role).get(employeeofgroupandlayer.role_id)
-            employeeofgroupandlayer.group = session.query(Group).get(employeeofgroupandlayer.group_id)
-            employeeofgroupandlayer.layer = session.query(Layer).get(employeeofgroupandlayer.layer_id)
-            delattr(employeeofgroupandlayer, "password_hash")
-            delattr(employeeofgroupandlayer, "company_id")
-            delattr(employeeofgroupandlayer, "role_id")
-            delattr(employeeofgroupandlayer, "group_id")
-            delattr(employeeofgroupandlayer, "layer_id")
+    def find_supervisor(session):
+        hierarchy = org_index.get(session, cid)
+        if user_id not in hierarchy.parent:
+            raise HTTPException(status_code=404, detail="User not found")
+        supervisor_id = hierarchy.ancestor_at_layer(user_id, layer_id)
+        return hydrate_user(session, supervisor_id) if supervisor_id is not None else None
 
+    supervisor = await run_in_session(find_supervisor)
+    if supervisor is None:
+        raise HTTPException(status_code=404, detail="No supervisor in this layer")
 
+    return typed_response({"result": 1, "data": supervisor})
 
-        return {"result": 1, "data": employeesofgroupandlayer}
+# Alle direkten und indirekten Untergebenen eines Users
+@app.get("/api/user_management/user/{user_id}/subordinates", response_model=UserListResponse, response_model_exclude_unset=True)
+async def get_user_subordinates(user_id: int, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
 
+    def find_subordinates(session):
+        hierarchy = org_index.get(session, cid)
+        if user_id not in hierarchy.parent:
+            raise HTTPException(status_code=404, detail="User not found")
+        return hydrate_users_by_ids(session, hierarchy.subordinates(user_id))
 
+    subordinates = await run_in_session(find_subordinates)
+
+    return typed_response({"result": 1, "data": subordinates})
+
+#Alle Employees vom Audit Layer zurückgeben
+@app.get("/api/user_management/groups/employee/{group_id}/{audit_layer_id}", response_model=UserListResponse, response_model_exclude_unset=True) 
+async def get_auditlayer_employee(group_id: int, audit_layer_id: int, cursor: str | None = None, limit: int | None = Query(default=None, ge=1, le=USER_LIST_MAX_LIMIT),
+                                  fields: str | None = None, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+
+    return await user_page([User.company_id == cid, User.layer_id == audit_layer_id, User.group_id == group_id], cursor, limit, fields)
+
+#Alle Supervisoren im Auditlayer von den User in einer Gruppe
+@app.get("/api/user_management/groups/supervisor/{audit_layer_id}", response_model=UserListResponse, response_model_exclude_unset=True)
+async def get_group_supervisor(audit_layer_id: int, cursor: str | None = None, limit: int | None = Query(default=None, ge=1, le=USER_LIST_MAX_LIMIT),
+                               fields: str | None = None, token: dict = Depends(get_token_payload)):
+    cid = token.get("company_id")
+
+    return await user_page([User.company_id == cid, User.layer_id == audit_layer_id], cursor, limit, fields)
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
+    import uvicorn
+
+    # Produktion: mehrere Worker-Prozesse, kein Reloader. Entwicklung: UVICORN_RELOAD=true
+    uvicorn.run("main:app", host=HOST, port=PORT, workers=None if RELOAD else WORKERS, reload=RELOAD)
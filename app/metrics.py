@@ -0,0 +1,44 @@
+import threading
+
+
+class Histogram:
+    """
+    Minimal Prometheus-style histogram (cumulative buckets, sum and count).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+
+    def render(self, name: str, labels: str = ""):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        sep = "," if labels else ""
+        lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {n}' for bound, n in zip(self.buckets, counts)]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+
+def render_metric(name: str, kind: str, help_text: str, samples):
+    # samples: Liste von (labels, wert) oder fertige Zeilen bei Histogrammen
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for sample in samples:
+        if isinstance(sample, str):
+            lines.append(sample)
+        else:
+            labels, value = sample
+            lines.append(f"{name}{{{labels}}} {value}")
+    return lines
@@ -0,0 +1,182 @@
+# Schema-Migrationen dieses Service (die Tabellen selbst kommen aus backend_db_lib)
+#   python migrations.py upgrade --database-url postgresql://...
+#   python migrations.py status
+
+import argparse
+import datetime
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, create_engine, func, inspect, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+from backend_db_lib.models import User, Layer, Group
+from config import DATABASE_URL
+from changelog import change_table, version_table
+
+
+logger = logging.getLogger(__name__)
+
+# Eigene Metadata, damit create_all von backend_db_lib die Tabelle nicht anlegt
+migration_table = Table(
+    "user_management_migrations", MetaData(),
+    Column("version", String(64), primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration:
+    def __init__(self, version: str, description: str, indexes=(), tables=(), statements=(), dialects=None):
+        self.version = version
+        self.description = description
+        self.indexes = indexes
+        self.tables = tables
+        # Roh-SQL vor den Indizes, z.B. CREATE EXTENSION
+        self.statements = statements
+        # None = alle Datenbanken, sonst wird die Migration anderswo nur als angewendet markiert
+        self.dialects = dialects
+
+    def applies_to(self, dialect: str):
+        return self.dialects is None or dialect in self.dialects
+
+
+# Die Indizes hängen an Kopien der Tabellen in eigener Metadata, sonst legt create_all von backend_db_lib sie mit an
+migration_metadata = MetaData()
+user_table = User.__table__.to_metadata(migration_metadata)
+layer_table = Layer.__table__.to_metadata(migration_metadata)
+group_table = Group.__table__.to_metadata(migration_metadata)
+
+# Auf Postgres werden die Indizes mit CREATE INDEX CONCURRENTLY angelegt, Schreibzugriffe laufen weiter
+MIGRATIONS = [
+    Migration("0001", "Indexes for the user filter columns", [
+        # group/{id}, groups/employee/{group_id}/{layer_id} und der Hierarchie-Index (company_id allein)
+        Index("ix_user_company_group_layer", user_table.c.company_id, user_table.c.group_id, user_table.c.layer_id, postgresql_concurrently=True),
+        # groups/supervisor/{layer_id}
+        Index("ix_user_company_layer", user_table.c.company_id, user_table.c.layer_id, postgresql_concurrently=True),
+        # Login, Registrierung und Bulk-Import
+        Index("ix_user_email", user_table.c.email, postgresql_concurrently=True),
+    ]),
+    Migration("0002", "Unique layer and group names per company", [
+        Index("uq_layer_company_name", layer_table.c.company_id, layer_table.c.layer_name, unique=True, postgresql_concurrently=True),
+        Index("uq_group_company_name", group_table.c.company_id, group_table.c.group_name, unique=True, postgresql_concurrently=True),
+    ]),
+    Migration("0003", "Change log for the directory delta sync", tables=[change_table, version_table]),
+    # Suche (search.py): LIKE 'term%' und der Ähnlichkeits-Operator % über Trigramm-Indizes, SQLite sucht im Speicher
+    Migration("0004", "Trigram indexes for the user search", statements=["CREATE EXTENSION IF NOT EXISTS pg_trgm"], dialects=("postgresql",), indexes=[
+        Index(f"ix_user_{column.key}_trgm", func.lower(column).label(f"{column.key}_lower"), postgresql_using="gin",
+              postgresql_ops={f"{column.key}_lower": "gin_trgm_ops"}, postgresql_concurrently=True)
+        for column in (user_table.c.first_name, user_table.c.last_name, user_table.c.email)
+    ]),
+]
+
+
+# Schlüssel für pg_advisory_lock, in allen Workern und Replicas gleich
+MIGRATION_LOCK = 1711
+
+
+@contextmanager
+def migration_lock(engine):
+    """
+    Serializes schema changes of several workers or replicas (e.g. MIGRATE_ON_STARTUP with
+    WEB_CONCURRENCY > 1): on Postgres through a session-level advisory lock, the others wait and
+    then find nothing left to do. Other databases are not locked, migrate them before the workers start.
+    """
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    # AUTOCOMMIT: eine offene Transaktion hier würde CREATE INDEX CONCURRENTLY blockieren
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK})")
+        try:
+            yield
+        finally:
+            conn.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK})")
+
+
+def applied_versions(engine):
+    migration_table.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {version for (version,) in conn.execute(select(migration_table.c.version))}
+
+
+def apply(engine, migration):
+    # CONCURRENTLY geht nicht innerhalb einer Transaktion
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for statement in migration.statements:
+            conn.exec_driver_sql(statement)
+        for table in migration.tables:
+            table.create(conn, checkfirst=True)
+        for index in migration.indexes:
+            try:
+                index.create(conn, checkfirst=True)
+            except IntegrityError as e:
+                # Ein abgebrochenes CREATE INDEX CONCURRENTLY hinterlässt einen ungültigen Index
+                index.drop(conn, checkfirst=True)
+                raise RuntimeError(f"Migration {migration.version} failed on {index.name}, remove the duplicate rows first: {e.orig}") from e
+
+
+def upgrade(engine):
+    """
+    Applies all pending migrations in order and returns their versions. Indexes are created
+    with checkfirst, so indexes that already exist (e.g. created by hand) are adopted.
+    """
+    with migration_lock(engine):
+        return _upgrade(engine)
+
+
+def _upgrade(engine):
+    applied = applied_versions(engine)
+    done = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        if migration.applies_to(engine.dialect.name):
+            apply(engine, migration)
+        else:
+            logger.info("Migration %s does not apply to %s", migration.version, engine.dialect.name)
+        with engine.begin() as conn:
+            conn.execute(migration_table.insert().values(
+                version=migration.version, description=migration.description, applied_at=datetime.datetime.utcnow()))
+        logger.info("Applied migration %s: %s", migration.version, migration.description)
+        done.append(migration.version)
+    return done
+
+
+def status(engine):
+    applied = applied_versions(engine)
+    existing = {}
+    inspector = inspect(engine)
+    migrations = [migration for migration in MIGRATIONS if migration.applies_to(engine.dialect.name)]
+    for migration in migrations:
+        for index in migration.indexes:
+            if index.table.name not in existing:
+                existing[index.table.name] = {i["name"] for i in inspector.get_indexes(index.table.name)}
+    return [
+        {
+            "version": migration.version,
+            "description": migration.description,
+            "applied": migration.version in applied,
+            "indexes": {index.name: index.name in existing[index.table.name] for index in migration.indexes} if migration in migrations else {},
+            "tables": {table.name: inspector.has_table(table.name) for table in migration.tables} if migration in migrations else {},
+        }
+        for migration in MIGRATIONS
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("upgrade", "status"), nargs="?", default="upgrade")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    engine = create_engine(args.database_url)
+    if args.command == "upgrade":
+        applied = upgrade(engine)
+        print(f"Applied {', '.join(applied)}" if applied else f"{make_url(args.database_url).database} is up to date")
+    else:
+        for entry in status(engine):
+            indexes = ", ".join(f"{name}{'' if present else ' (missing)'}" for name, present in {**entry["tables"], **entry["indexes"]}.items())
+            print(f"{entry['version']} {'applied' if entry['applied'] else 'pending':<8} {entry['description']}: {indexes}")
@@ -0,0 +1,89 @@
+import statistics
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from backend_db_lib.models import User, Group, Layer, Role
+from cache import stats_cache
+from hydration import query_company_references
+
+
+def rollup(combinations, index, entities, name_fields):
+    # Headcount je Gruppe/Layer/Rolle aus den (group_id, layer_id, role_id, count)-Zeilen, auch für Einträge ohne User
+    counts = {}
+    for row in combinations:
+        counts[row[index]] = counts.get(row[index], 0) + row[-1]
+    result = [{"id": entity["id"], **{field: entity.get(field) for field in name_fields}, "headcount": counts.get(entity["id"], 0)} for entity in entities]
+    known = {entity["id"] for entity in entities}
+    return result, sum(count for key, count in counts.items() if key not in known)
+
+
+def span_of_control(session, company_id: int):
+    # Direkte Untergebene je Vorgesetztem, größte Teams zuerst
+    supervisor = aliased(User)
+    count = func.count(User.id).label("count")
+    reports = select(User.supervisor_id, count).where(User.company_id == company_id).group_by(User.supervisor_id).subquery()
+    rows = (
+        session.query(supervisor.id, supervisor.first_name, supervisor.last_name, supervisor.layer_id, reports.c.count)
+        .join(reports, reports.c.supervisor_id == supervisor.id)
+        .filter(supervisor.company_id == company_id)
+        .order_by(reports.c.count.desc(), supervisor.id)
+        .all()
+    )
+    supervisors = [{"id": row[0], "first_name": row[1], "last_name": row[2], "layer_id": row[3], "direct_reports": row[4]} for row in rows]
+
+    by_layer = {}
+    for entry in supervisors:
+        by_layer.setdefault(entry["layer_id"], []).append(entry["direct_reports"])
+    return {
+        **span_summary([entry["direct_reports"] for entry in supervisors]),
+        "by_layer": [{"layer_id": layer_id, **span_summary(counts)} for layer_id, counts in sorted(by_layer.items(), key=lambda item: (item[0] is None, item[0]))],
+        "by_supervisor": supervisors,
+    }
+
+
+def span_summary(counts):
+    if not counts:
+        return {"supervisors": 0, "average": 0, "median": 0, "max": 0}
+    return {"supervisors": len(counts), "average": round(sum(counts) / len(counts), 2), "median": statistics.median(counts), "max": max(counts)}
+
+
+def org_statistics(session, company_id: int):
+    """
+    Headcounts per group, layer and role and the span of control per supervisor. The users are
+    aggregated in SQL with two GROUP BY queries, group and layer names are read alongside.
+    cached_org_statistics caches the whole result per data version.
+    """
+    combinations = (
+        session.query(User.group_id, User.layer_id, User.role_id, func.count(User.id))
+        .filter(User.company_id == company_id)
+        .group_by(User.group_id, User.layer_id, User.role_id)
+        .all()
+    )
+    roles = [{"id": role_id, "role_name": role_name} for role_id, role_name in session.query(Role.id, Role.role_name).order_by(Role.id)]
+    groups, unassigned_groups = rollup(combinations, 0, query_company_references(session, Group, company_id), ("group_name",))
+    layers, unassigned_layers = rollup(combinations, 1, query_company_references(session, Layer, company_id), ("layer_name", "layer_number"))
+    roles, unassigned_roles = rollup(combinations, 2, roles, ("role_name",))
+
+    return {
+        "headcount": sum(row[-1] for row in combinations),
+        "groups": groups,
+        "layers": layers,
+        "roles": [role for role in roles if role["headcount"]],
+        # User ohne (gültige) Gruppe, Layer bzw. Rolle
+        "unassigned": {"group": unassigned_groups, "layer": unassigned_layers, "role": unassigned_roles},
+        "span_of_control": span_of_control(session, company_id),
+    }
+
+
+def cached_org_statistics(session, company_id: int, version: str):
+    # version ist das ETag der Company (data_versions), jeder Schreibzugriff erzeugt einen neuen Schlüssel.
+    # Ohne Version (Store nicht erreichbar) wird nicht gecacht
+    if version is None:
+        return org_statistics(session, company_id)
+    key = ("statistics", company_id, version)
+    cached = stats_cache.get(key)
+    if cached is None:
+        cached = org_statistics(session, company_id)
+        stats_cache.set(key, cached)
+    return cached
@@ -0,0 +1,44 @@
+import asyncio
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from config import PASSWORD_HASH_SCHEME, PASSWORD_HASH_ROUNDS, PASSWORD_HASH_WORKERS
+from backend_db_lib.models import User
+
+
+# Der konfigurierte Algorithmus hasht, die übrigen werden nur noch verifiziert und beim Login ersetzt
+KNOWN_SCHEMES = [PASSWORD_HASH_SCHEME] + [s for s in ("pbkdf2_sha256", "bcrypt", "argon2") if s != PASSWORD_HASH_SCHEME]
+context_args = {f"{PASSWORD_HASH_SCHEME}__rounds": PASSWORD_HASH_ROUNDS} if PASSWORD_HASH_ROUNDS else {}
+pwd_context = CryptContext(schemes=KNOWN_SCHEMES, default=PASSWORD_HASH_SCHEME, deprecated="auto", **context_args)
+
+# Begrenzter Pool, damit langsame KDFs den Server nicht blockieren (hashlib gibt das GIL frei)
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+
+def hash_password(password: str):
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, password_hash: str | None):
+    """
+    Returns (valid, new_hash). new_hash is set when the stored hash should be replaced,
+    i.e. it uses an old scheme, old work factor or the legacy User.generate_hash format.
+    """
+    if not password_hash:
+        # Gleiche Laufzeit wie bei existierenden Usern
+        pwd_context.dummy_verify()
+        return False, None
+    if pwd_context.identify(password_hash, required=False) is None:
+        valid = hmac.compare_digest(str(User.generate_hash(password)).encode(), password_hash.encode())
+        return valid, hash_password(password) if valid else None
+    return pwd_context.verify_and_update(password, password_hash)
+
+
+async def hash_password_async(password: str):
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, hash_password, password)
+
+
+async def verify_password_async(password: str, password_hash: str | None):
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, verify_password, password, password_hash)
@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import event
+
+from config import PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_DIR
+from metrics import Histogram, render_metric
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# Zeitanteile pro Request, Name -> Hilfetext der Metrik
+STAGES = {
+    "db": "Time spent executing SQL statements",
+    "jwt": "Time spent decoding and verifying the JWT",
+    "serialization": "Time spent rendering the JSON response body",
+}
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_statements = 0
+        self.durations = defaultdict(float)
+
+
+# Stats des laufenden Requests, wird vom Threadpool und von run_sync der async Engine mitkopiert
+current_request = ContextVar("current_request", default=None)
+
+
+class timed:
+    """
+    Adds the time spent in the block to `stage` of the current request, no-op outside of requests.
+    """
+
+    __slots__ = ("stage", "stats", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.stats = current_request.get()
+        if self.stats is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if self.stats is not None:
+            self.stats.durations[self.stage] += time.perf_counter() - self.start
+        return False
+
+
+def instrument_engine(engine):
+    # Anzahl und Dauer der Statements pro Request (für die async Engine: engine.sync_engine)
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.sql_statements += 1
+            stats.durations["db"] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class ProfiledORJSONResponse(ORJSONResponse):
+    def render(self, content):
+        with timed("serialization"):
+            return super().render(content)
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.stages = {stage: Histogram(STAGE_BUCKETS) for stage in STAGES}
+        self.responses = Counter()
+
+
+class RequestMetrics:
+    """
+    Per-route request metrics, labelled with the route template (not the concrete path)
+    so the number of series stays bounded.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def route(self, method: str, path: str):
+        key = (method, path)
+        metrics = self._routes.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self._routes.setdefault(key, RouteMetrics())
+        return metrics
+
+    def observe(self, method: str, path: str, status: int, duration: float, stats: RequestStats):
+        metrics = self.route(method, path)
+        metrics.latency.observe(duration)
+        metrics.statements.observe(stats.sql_statements)
+        for stage, histogram in metrics.stages.items():
+            histogram.observe(stats.durations.get(stage, 0.0))
+        with self._lock:
+            metrics.responses[status] += 1
+
+    def render(self, prefix: str = "user_management_http"):
+        with self._lock:
+            routes = sorted(self._routes.items())
+        labelled = [(f'method="{method}",route="{path}"', metrics) for (method, path), metrics in routes]
+
+        def histograms(read):
+            return [line for labels, metrics in labelled for line in read(metrics).render(name, labels)]
+
+        lines = []
+        name = f"{prefix}_request_duration_seconds"
+        lines += render_metric(name, "histogram", "Request latency per route", histograms(lambda metrics: metrics.latency))
+        name = f"{prefix}_sql_statements"
+        lines += render_metric(name, "histogram", "SQL statements executed per request", histograms(lambda metrics: metrics.statements))
+        for stage, help_text in STAGES.items():
+            name = f"{prefix}_{stage}_seconds"
+            lines += render_metric(name, "histogram", help_text, histograms(lambda metrics: metrics.stages[stage]))
+        lines += render_metric(f"{prefix}_responses_total", "counter", "Responses per route and status code", [
+            (f'{labels},status="{status}"', count)
+            for labels, metrics in labelled
+            for status, count in sorted(metrics.responses.items())
+        ])
+        return lines
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler for slow requests. While requests are in flight a background thread samples
+    the stacks of all threads every `interval` seconds; requests slower than `threshold` get their
+    samples written to `directory` as folded stacks (flamegraph.pl / speedscope format).
+    Samples include all threads, so concurrent requests show up in each other's profiles.
+    """
+
+    def __init__(self, threshold: float, interval: float, directory: str):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        samples = Counter()
+        with self._lock:
+            self._sessions[id(samples)] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self, samples, duration: float, label: str):
+        with self._lock:
+            self._sessions.pop(id(samples), None)
+        if duration >= self.threshold and samples:
+            return self.dump(samples, duration, label)
+        return None
+
+    def dump(self, samples, duration: float, label: str):
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{int(duration * 1000)}ms.folded")
+        with open(path, "w") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+        logger.warning("Slow request %s took %.0f ms, profile written to %s", label, duration * 1000, path)
+        return path
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(stack)))
+
+            # Unter dem Lock, damit stop() einen fertigen Zähler bekommt
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                for samples in self._sessions.values():
+                    samples.update(stacks)
+            time.sleep(self.interval)
+
+
+request_metrics = RequestMetrics()
+slow_request_profiler = SlowRequestProfiler(PROFILE_SLOW_REQUEST_MS / 1000, PROFILE_SAMPLE_INTERVAL_MS / 1000, PROFILE_DIR) if PROFILE_SLOW_REQUEST_MS else None
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording latency, SQL statements, DB/JWT/serialization time per route
+    and handing slow requests to the profiler (if PROFILE_SLOW_REQUEST_MS is set).
+    """
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics, profiler: SlowRequestProfiler = slow_request_profiler):
+        self.app = app
+        self.metrics = metrics
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        samples = self.profiler.start() if self.profiler is not None else None
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            current_request.reset(token)
+            # Das Routing trägt die gematchte Route in den Scope ein
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            self.metrics.observe(scope["method"], path, status, duration, stats)
+            if samples is not None:
+                self.profiler.stop(samples, duration, f"{scope['method']} {path}")
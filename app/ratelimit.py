@@ -0,0 +1,110 @@
+import time
+import threading
+import ipaddress
+
+from config import LOGIN_ATTEMPT_WINDOW, LOGIN_MAX_FAILURES_PER_IP, LOGIN_MAX_FAILURES_PER_ACCOUNT, TRUSTED_PROXIES
+from cache import shared_store, cache_key
+
+
+class AttemptLimiter:
+    """
+    Counts failed attempts per key in fixed windows of `window` seconds. A key is blocked once it
+    reached `limit` failures in the current window. With a store (cache.RedisStore) the counters
+    are shared between replicas, otherwise they live in this process. limit=0 disables the limiter.
+    If the store is unavailable the limiter fails open and blocks nothing.
+    """
+
+    def __init__(self, name: str, limit: int, window: float, store=None):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.store = store
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, key):
+        window = int(time.time() // self.window)
+        return (key, window), (window + 1) * self.window
+
+    def _store_key(self, slot):
+        return self.store.key("attempts", self.name, cache_key(slot[0]), str(slot[1]))
+
+    def failures(self, key) -> int:
+        slot, _ = self._slot(key)
+        if self.store is not None:
+            return self.store.get_int(self._store_key(slot)) or 0
+        with self._lock:
+            return self._counts.get(slot, 0)
+
+    def blocked(self, key) -> bool:
+        return self.limit > 0 and self.failures(key) >= self.limit
+
+    def retry_after(self) -> int:
+        return max(1, int(self._slot(None)[1] - time.time()))
+
+    def failed(self, key):
+        if self.limit <= 0:
+            return
+        slot, ends_at = self._slot(key)
+        if self.store is not None:
+            self.store.incr(self._store_key(slot), ttl=ends_at - time.time())
+            return
+        with self._lock:
+            if len(self._counts) > 100000:
+                # Abgelaufene Fenster wegwerfen
+                current = int(time.time() // self.window)
+                self._counts = {s: c for s, c in self._counts.items() if s[1] >= current}
+            self._counts[slot] = self._counts.get(slot, 0) + 1
+
+    def reset(self, key):
+        slot, _ = self._slot(key)
+        if self.store is not None:
+            self.store.delete(self._store_key(slot))
+            return
+        with self._lock:
+            self._counts.pop(slot, None)
+
+
+# Fehlgeschlagene Logins pro Client-IP und pro (E-Mail, Client-IP), erfolgreiche Logins zählen nicht.
+# Der Account-Zähler hängt an der IP, sonst könnte jeder einen fremden Account mit falschen Passwörtern sperren
+ip_attempts = AttemptLimiter("ip", LOGIN_MAX_FAILURES_PER_IP, LOGIN_ATTEMPT_WINDOW, shared_store)
+account_attempts = AttemptLimiter("account", LOGIN_MAX_FAILURES_PER_ACCOUNT, LOGIN_ATTEMPT_WINDOW, shared_store)
+
+trusted_proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in TRUSTED_PROXIES]
+
+
+def trusted(host) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def client_ip(request):
+    # Hinter vertrauenswürdigen Proxies: die letzte Adresse in X-Forwarded-For, die kein eigener Proxy ist
+    host = request.client.host if request.client else None
+    if not trusted(host):
+        return host
+    forwarded = [address.strip() for address in request.headers.get("x-forwarded-for", "").split(",") if address.strip()]
+    for address in reversed(forwarded):
+        if not trusted(address):
+            return address
+    return forwarded[0] if forwarded else host
+
+
+def account_key(email: str, ip):
+    return (email.strip().lower(), ip)
+
+
+def login_blocked(email: str, ip) -> bool:
+    return ip_attempts.blocked(ip) or account_attempts.blocked(account_key(email, ip))
+
+
+def login_failed(email: str, ip):
+    ip_attempts.failed(ip)
+    account_attempts.failed(account_key(email, ip))
+
+
+def login_succeeded(email: str, ip):
+    account_attempts.reset(account_key(email, ip))
@@ -0,0 +1,89 @@
+from typing import List, Union
+
+from pydantic import BaseModel
+
+
+# Response-Modelle für die Lese-Endpunkte. Weitere Spalten aus backend_db_lib werden
+# durchgereicht (extra = "allow"), Felder die per fields= weggelassen wurden bleiben weg
+# (response_model_exclude_unset=True an den Routen).
+
+class CompanyData(BaseModel):
+    id: int
+
+    class Config:
+        extra = "allow"
+
+
+class RoleData(BaseModel):
+    id: int
+    role_name: Union[str, None] = None
+
+    class Config:
+        extra = "allow"
+
+
+class GroupData(BaseModel):
+    id: int
+    group_name: Union[str, None] = None
+    company_id: Union[int, None] = None
+    company: Union[CompanyData, None] = None
+
+    class Config:
+        extra = "allow"
+
+
+class LayerData(BaseModel):
+    id: int
+    layer_name: Union[str, None] = None
+    layer_number: Union[int, None] = None
+    company_id: Union[int, None] = None
+    company: Union[CompanyData, None] = None
+
+    class Config:
+        extra = "allow"
+
+
+class UserData(BaseModel):
+    id: Union[int, None] = None
+    first_name: Union[str, None] = None
+    last_name: Union[str, None] = None
+    email: Union[str, None] = None
+    profile_picture_url: Union[str, None] = None
+    supervisor_id: Union[int, None] = None
+    supervisorid: Union[int, None] = None
+    supervisorfirst_name: Union[str, None] = None
+    supervisorlast_name: Union[str, None] = None
+    company: Union[CompanyData, None] = None
+    role: Union[RoleData, None] = None
+    group: Union[GroupData, None] = None
+    layer: Union[LayerData, None] = None
+
+    class Config:
+        extra = "allow"
+
+
+class UserResponse(BaseModel):
+    result: int
+    data: UserData
+
+
+class UserListResponse(BaseModel):
+    result: int
+    data: List[UserData]
+    next_cursor: Union[str, None] = None
+
+
+class UserLookupResponse(BaseModel):
+    result: int
+    data: List[UserData]
+    not_found: List[Union[int, str]]
+
+
+class LayerListResponse(BaseModel):
+    result: int
+    data: List[LayerData]
+
+
+class GroupListResponse(BaseModel):
+    result: int
+    data: List[GroupData]
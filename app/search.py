@@ -0,0 +1,218 @@
+import re
+import time
+import bisect
+import logging
+import threading
+
+from sqlalchemy import case, func, or_, select, text
+
+from backend_db_lib.models import User
+from cache import publish, subscribe
+from config import SEARCH_INDEX_TTL, SEARCH_SIMILARITY_THRESHOLD
+
+
+logger = logging.getLogger(__name__)
+
+# Durchsuchte Spalten, verglichen wird immer kleingeschrieben
+SEARCH_COLUMNS = (User.first_name, User.last_name, User.email)
+_words = re.compile(r"[^\w]+")
+
+
+def search_terms(query: str, max_terms: int = 5):
+    return [term for term in query.lower().split() if term][:max_terms]
+
+
+def trigrams(text: str):
+    # Wie pg_trgm: pro Wort zwei Leerzeichen davor, eins dahinter
+    grams = set()
+    for word in _words.split(text.lower()):
+        if word:
+            padded = f"  {word} "
+            grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: set, b: set):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class CompanyDirectory:
+    """
+    In-memory search index over one company's users, used when the database has no trigram
+    support (SQLite, or Postgres before migration 0004 installed pg_trgm). Prefix matches come from a sorted list of the lowercased column values,
+    fuzzy matches from a trigram -> values posting list. Scores follow search_users_sql.
+    """
+
+    def __init__(self, rows):
+        self.built_at = time.monotonic()
+        self.user_ids = []
+        self.values = []
+        self.sorted_values = []
+        # Namen wiederholen sich oft: Trigramme und Ähnlichkeit je eindeutigem Wert, nicht je User
+        self.positions = {}
+        self.postings = {}
+        self._lock = threading.Lock()
+        for user_id, *values in rows:
+            self.sorted_values.extend(self._add(user_id, values))
+        self.sorted_values.sort()
+
+    def _add(self, user_id, values):
+        position = len(self.user_ids)
+        values = [(value or "").lower() for value in values]
+        self.user_ids.append(user_id)
+        self.values.append(values)
+        new_values = []
+        for value in values:
+            if value not in self.positions:
+                new_values.append(value)
+                self.positions[value] = []
+                for gram in trigrams(value):
+                    self.postings.setdefault(gram, []).append(value)
+            self.positions[value].append(position)
+        return new_values
+
+    def add(self, user_id, *values):
+        with self._lock:
+            for value in self._add(user_id, values):
+                bisect.insort(self.sorted_values, value)
+
+    def prefix_matches(self, term):
+        matches = set()
+        index = bisect.bisect_left(self.sorted_values, term)
+        while index < len(self.sorted_values) and self.sorted_values[index].startswith(term):
+            matches.update(self.positions[self.sorted_values[index]])
+            index += 1
+        return matches
+
+    def term_scores(self, term, fuzzy):
+        scores = dict.fromkeys(self.prefix_matches(term), 1.0)
+        if fuzzy:
+            grams = trigrams(term)
+            # Kandidaten teilen mindestens ein Trigramm, exakt bewertet wird nur dort
+            candidates = {value for gram in grams for value in self.postings.get(gram, ())}
+            for value in candidates:
+                score = similarity(grams, trigrams(value))
+                if score >= SEARCH_SIMILARITY_THRESHOLD:
+                    for position in self.positions[value]:
+                        if scores.get(position, 0.0) < score:
+                            scores[position] = score
+        return scores
+
+    def search(self, terms, fuzzy, offset, limit):
+        with self._lock:
+            total = None
+            for term in terms:
+                scores = self.term_scores(term, fuzzy)
+                # Jeder Begriff muss passen, die Scores werden summiert
+                total = scores if total is None else {p: total[p] + scores[p] for p in total.keys() & scores.keys()}
+            ranked = sorted(total or {}, key=lambda p: (-total[p], self.values[p][1], self.values[p][0], self.user_ids[p]))
+            return [self.user_ids[p] for p in ranked[offset:offset + limit + 1]]
+
+
+class SearchIndex:
+    """
+    Lazily built CompanyDirectory per company, kept like hierarchy.HierarchyIndex: new users are
+    added in place, bulk imports drop the company and SEARCH_INDEX_TTL bounds staleness.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._companies = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, company_id):
+        with self._lock:
+            directory = self._companies.get(company_id)
+        if directory is None or directory.built_at + self.ttl < time.monotonic():
+            rows = session.query(User.id, *SEARCH_COLUMNS).filter(User.company_id == company_id).all()
+            directory = CompanyDirectory(rows)
+            with self._lock:
+                self._companies[company_id] = directory
+        return directory
+
+    def add_user(self, company_id, user_id, first_name, last_name, email):
+        with self._lock:
+            directory = self._companies.get(company_id)
+        if directory is not None:
+            directory.add(user_id, first_name, last_name, email)
+        publish("search", company_id=company_id)
+
+    def invalidate(self, company_id=None):
+        self.drop(company_id)
+        publish("search", company_id=company_id)
+
+    def drop(self, company_id=None):
+        with self._lock:
+            if company_id is None:
+                self._companies.clear()
+            else:
+                self._companies.pop(company_id, None)
+
+
+search_index = SearchIndex(SEARCH_INDEX_TTL)
+subscribe("search", lambda event: search_index.drop(event["company_id"]))
+
+
+# Engine -> (pg_trgm installiert, geprüft um), wird nach SEARCH_INDEX_TTL neu geprüft
+_trigram_support = {}
+
+
+def has_trigram(session):
+    # pg_trgm kommt erst mit Migration 0004, bis dahin sucht auch Postgres im In-Memory-Index
+    engine = session.get_bind()
+    available, checked_at = _trigram_support.get(engine, (None, 0.0))
+    if available is None or checked_at + SEARCH_INDEX_TTL < time.monotonic():
+        available = session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+        if not available:
+            logger.warning("pg_trgm is not installed, run migration 0004. Searching in memory until then")
+        _trigram_support[engine] = (available, time.monotonic())
+    return available
+
+
+def escape_like(term: str):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_users_sql(session, company_id, terms, fuzzy, offset, limit):
+    # Postgres: lower(...) LIKE 'term%' und der pg_trgm-Operator % nutzen die GIN-Indizes aus Migration 0004
+    columns = [func.lower(column) for column in SEARCH_COLUMNS]
+    if fuzzy:
+        # Schwelle für den Operator %, gilt nur für diese Transaktion
+        session.execute(select(func.set_config("pg_trgm.similarity_threshold", str(SEARCH_SIMILARITY_THRESHOLD), True)))
+    filters = []
+    score = None
+    for term in terms:
+        prefix = or_(*(column.like(escape_like(term) + "%", escape="\\") for column in columns))
+        if not fuzzy:
+            filters.append(prefix)
+            continue
+        filters.append(or_(prefix, *(column.op("%")(term) for column in columns)))
+        # Präfix-Treffer zählen voll, sonst die beste Trigramm-Ähnlichkeit
+        term_score = case((prefix, 1.0), else_=func.greatest(*(func.similarity(column, term) for column in columns)))
+        score = term_score if score is None else score + term_score
+
+    rows = (
+        session.query(User.id)
+        .filter(User.company_id == company_id, *filters)
+        .order_by(*([score.desc()] if fuzzy else []), User.last_name, User.first_name, User.id)
+        .offset(offset)
+        .limit(limit + 1)
+        .all()
+    )
+    return [user_id for (user_id,) in rows]
+
+
+def search_users(session, company_id, query, fuzzy=True, offset=0, limit=20):
+    """
+    Ids of the company's users matching every term of `query` (prefix of first name, last name or
+    email, with fuzzy=True also trigram similarity), best match first. Returns up to limit + 1 ids
+    so the caller can tell whether there is a next page.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if session.get_bind().dialect.name == "postgresql" and has_trigram(session):
+        return search_users_sql(session, company_id, terms, fuzzy, offset, limit)
+    return search_index.get(session, company_id).search(terms, fuzzy, offset, limit)
@@ -0,0 +1,198 @@
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+# Minimaler RESP2/RESP3-Server für die Tests: genug Redis für cache.RedisStore (GET/SET/DEL/INCRBY/MGET/SCAN, Pub/Sub)
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeRedisHandler)
+        self.data = {}
+        self.expires = {}
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def lookup(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.write_lock = threading.Lock()
+        self.channels = set()
+        self.protocol = 2
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    break
+                self.execute(command)
+        finally:
+            with self.server.lock:
+                for channel in self.channels:
+                    self.server.subscribers.get(channel, set()).discard(self)
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def send(self, payload: bytes):
+        with self.write_lock:
+            self.wfile.write(payload)
+
+    def encode(self, value):
+        if value is None:
+            return b"_\r\n" if self.protocol == 3 else b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            return b"+" + value.encode() + b"\r\n"
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self.encode(item) for item in value)
+        if isinstance(value, dict):
+            return b"%%%d\r\n" % len(value) + b"".join(self.encode(k) + self.encode(v) for k, v in value.items())
+        return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+    def execute(self, args):
+        name = args[0].decode().upper()
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            self.send(f"-ERR unknown command '{name}'\r\n".encode())
+            return
+        with self.server.lock if name not in ("SUBSCRIBE", "UNSUBSCRIBE", "PUBLISH") else _nolock:
+            reply = handler(*args[1:])
+        if reply is not _noreply:
+            self.send(self.encode(reply))
+
+    def push(self, items):
+        # Pub/Sub-Nachrichten sind in RESP3 Push-Frames, in RESP2 normale Arrays
+        payload = self.encode(items)
+        self.send(b">" + payload[1:] if self.protocol == 3 else payload)
+
+    def cmd_hello(self, *args):
+        if args:
+            self.protocol = int(args[0])
+        return {b"server": b"fake-redis", b"version": b"7.0.0", b"proto": self.protocol}
+
+    def cmd_ping(self, *args):
+        if self.channels:
+            return [b"pong", args[0] if args else b""]
+        return args[0] if args else "PONG"
+
+    def cmd_client(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_get(self, key):
+        return self.server.lookup(key)
+
+    def cmd_mget(self, *keys):
+        return [self.server.lookup(key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if b"NX" in options and self.server.lookup(key) is not None:
+            return None
+        self.server.data[key] = value
+        self.server.expires.pop(key, None)
+        for unit, scale in ((b"EX", 1), (b"PX", 0.001)):
+            if unit in options:
+                self.server.expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self.server.lookup(key) is not None:
+                removed += 1
+            self.server.data.pop(key, None)
+            self.server.expires.pop(key, None)
+        return removed
+
+    def cmd_incrby(self, key, amount):
+        value = int(self.server.lookup(key) or 0) + int(amount)
+        self.server.data[key] = str(value).encode()
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b"1")
+
+    def cmd_pexpire(self, key, milliseconds):
+        if self.server.lookup(key) is None:
+            return 0
+        self.server.expires[key] = time.monotonic() + int(milliseconds) / 1000
+        return 1
+
+    def cmd_scan(self, cursor, *options):
+        pattern = b"*"
+        if b"MATCH" in [option.upper() for option in options]:
+            pattern = options[[option.upper() for option in options].index(b"MATCH") + 1]
+        keys = [key for key in list(self.server.data) if self.server.lookup(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+        return [b"0", keys]
+
+    def cmd_publish(self, channel, message):
+        with self.server.lock:
+            subscribers = list(self.server.subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.push([b"message", channel, message])
+        return len(subscribers)
+
+    def cmd_subscribe(self, *channels):
+        for channel in channels:
+            with self.server.lock:
+                self.server.subscribers.setdefault(channel, set()).add(self)
+            self.channels.add(channel)
+            self.push([b"subscribe", channel, len(self.channels)])
+        return _noreply
+
+    def cmd_unsubscribe(self, *channels):
+        for channel in channels or list(self.channels):
+            with self.server.lock:
+                self.server.subscribers.get(channel, set()).discard(self)
+            self.channels.discard(channel)
+            self.push([b"unsubscribe", channel, len(self.channels)])
+        return _noreply
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_nolock = _NoLock()
+_noreply = object()
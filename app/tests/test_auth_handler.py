@@ -0,0 +1,42 @@
+import time
+
+import jwt
+
+from auth_handler import sign_jwt, decode_jwt, token_cache, verifier
+from config import JWT_SECRET, JWT_ALGORITHM, JWT_KEY_ID
+
+
+def test_decode_jwt_uses_cache():
+    token = sign_jwt(1, 1, "admin")
+    hits = token_cache.stats()["hits"]
+
+    assert decode_jwt(token).get("user_id") == 1
+    assert decode_jwt(token).get("user_id") == 1
+    assert token_cache.stats()["hits"] == hits + 1
+
+
+def test_decode_jwt_never_serves_expired_token():
+    payload = {"user_id": 1, "expires": time.time() + 0.05, "company_id": 1, "role": "admin"}
+    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+    assert decode_jwt(token) is not None
+    time.sleep(0.1)
+    assert decode_jwt(token) is None
+
+
+def test_decode_jwt_invalid_token():
+    assert decode_jwt("not-a-token") is None
+
+
+def test_decode_jwt_rejects_removed_key():
+    token = sign_jwt(1, 1, "admin")
+    assert decode_jwt(token) is not None
+
+    # Auch das gecachte Token gilt nach dem Entfernen des Keys nicht mehr
+    secret = verifier.keys[JWT_KEY_ID]
+    verifier.remove_key(JWT_KEY_ID)
+    try:
+        assert decode_jwt(token) is None
+    finally:
+        verifier.add_key(JWT_KEY_ID, secret)
+    assert decode_jwt(token) is not None
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from changelog import create_tables, record_changes, current_version, changes_since
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'changelog.db'}")
+    create_tables(engine)
+    yield engine
+    engine.dispose()
+
+
+def commit(engine, company_id, entity, ids):
+    with Session(engine) as session:
+        record_changes(session, company_id, entity, ids)
+        session.commit()
+
+
+def test_one_version_per_commit_and_company(engine):
+    commit(engine, 1, "user", [1, 2, 3])
+    commit(engine, 2, "user", [7])
+    commit(engine, 1, "group", [4])
+
+    with Session(engine) as session:
+        assert current_version(session, 1) == 2
+        assert current_version(session, 2) == 1
+        assert current_version(session, 3) == 0
+        assert changes_since(session, 1, 0, 100) == ({"user": [1, 2, 3], "group": [4], "layer": []}, 2, False)
+        assert changes_since(session, 1, 1, 100) == ({"user": [], "group": [4], "layer": []}, 2, False)
+
+
+def test_pages_never_split_a_version(engine):
+    commit(engine, 1, "user", [1, 2, 3])
+    commit(engine, 1, "user", [4])
+
+    with Session(engine) as session:
+        # Limit 2 endet mitten in Version 1, die Seite enthält trotzdem die ganze Version
+        assert changes_since(session, 1, 0, 2) == ({"user": [1, 2, 3], "group": [], "layer": []}, 1, True)
+        assert changes_since(session, 1, 1, 2) == ({"user": [4], "group": [], "layer": []}, 2, False)
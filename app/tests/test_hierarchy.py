@@ -0,0 +1,93 @@
+import threading
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from backend_db_lib.models import base, User
+from hierarchy import OrgHierarchy, supervisor_chain
+
+
+# (id, supervisor_id, layer_id, group_id)
+ROWS = [
+    (1, None, 1, 1),
+    (2, 1, 2, 1),
+    (3, 1, 2, 2),
+    (4, 2, 3, 1),
+    (5, 2, 3, 1),
+    (6, 3, 3, 2),
+]
+
+
+def test_ancestors():
+    hierarchy = OrgHierarchy(ROWS)
+    assert hierarchy.ancestors(4) == [2, 1]
+    assert hierarchy.ancestors(1) == []
+    # Der Lock ist danach wieder frei, auch für andere Threads
+    lock_free = []
+    thread = threading.Thread(target=lambda: lock_free.append(hierarchy._lock.acquire(blocking=False)))
+    thread.start()
+    thread.join()
+    assert lock_free == [True]
+
+
+def test_ancestor_at_layer():
+    hierarchy = OrgHierarchy(ROWS)
+    assert hierarchy.ancestor_at_layer(4, 2) == 2
+    assert hierarchy.ancestor_at_layer(4, 1) == 1
+    assert hierarchy.ancestor_at_layer(4, 3) == 4
+    assert hierarchy.ancestor_at_layer(1, 3) is None
+
+
+def test_subordinates():
+    hierarchy = OrgHierarchy(ROWS)
+    assert sorted(hierarchy.subordinates(1)) == [2, 3, 4, 5, 6]
+    assert sorted(hierarchy.subordinates(2)) == [4, 5]
+    assert hierarchy.subordinates(6) == []
+
+
+def test_supervisors_for_group():
+    hierarchy = OrgHierarchy(ROWS)
+    assert hierarchy.supervisors_for_group(1, 3, 2) == [2]
+    assert hierarchy.supervisors_for_group(2, 3, 2) == [3]
+    assert hierarchy.supervisors_for_group(1, 3, 1) == [1]
+
+
+def test_incremental_update():
+    hierarchy = OrgHierarchy(ROWS)
+    hierarchy.update(5, supervisor_id=3, group_id=2)
+    assert sorted(hierarchy.subordinates(3)) == [5, 6]
+    assert hierarchy.supervisors_for_group(2, 3, 2) == [3]
+
+    hierarchy.add(7, 6, 4, 2)
+    assert hierarchy.ancestor_at_layer(7, 2) == 3
+
+
+def test_cycle_does_not_loop():
+    hierarchy = OrgHierarchy([(1, 2, 1, 1), (2, 1, 2, 1)])
+    assert hierarchy.ancestor_at_layer(1, 3) is None
+    assert hierarchy.subordinates(1) == [2]
+
+
+def test_cycles():
+    hierarchy = OrgHierarchy(ROWS)
+    assert hierarchy.cycles({4: 3, 2: 6}) == set()
+    assert hierarchy.cycles({2: 4}) == {2}
+    assert hierarchy.cycles({1: 6, 4: 3}) == {1}
+    # Einzeln unkritisch, zusammen 3 -> 5 -> 6 -> 3
+    assert hierarchy.cycles({3: 5, 5: 6}) == {3, 5}
+    assert hierarchy.cycles({6: 6}) == {6}
+
+
+def test_supervisor_chain(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'hierarchy.db'}")
+    base.metadata.create_all(engine)
+    with Session(engine) as session:
+        # Company 2 hängt an 4, gehört aber nicht zur Kette; 7 <-> 8 ist ein schon gespeicherter Zyklus
+        rows = [{"id": i, "supervisor_id": s, "company_id": 1} for i, s, _, _ in ROWS]
+        rows += [{"id": 9, "supervisor_id": 4, "company_id": 2}, {"id": 7, "supervisor_id": 8, "company_id": 1}, {"id": 8, "supervisor_id": 7, "company_id": 1}]
+        session.execute(insert(User), rows)
+        assert supervisor_chain(session, 1, 4) == {4, 2, 1}
+        assert supervisor_chain(session, 1, 1) == {1}
+        assert supervisor_chain(session, 1, 9) == set()
+        assert supervisor_chain(session, 1, 7) == {7, 8}
+    engine.dispose()
@@ -0,0 +1,59 @@
+import time
+
+import jwt
+
+from auth_handler import sign_jwt
+from config import JWT_SECRET, JWT_KEY_ID
+from jwt_verifier import JWTVerifier
+
+
+NEW_SECRET = "new-secret-0123456789abcdef0123456789"
+OLD_SECRET = "old-secret-0123456789abcdef0123456789"
+
+
+def make_token(key, kid=None, expires_in=100):
+    payload = {"user_id": 1, "expires": time.time() + expires_in, "company_id": 1, "role": "admin"}
+    return jwt.encode(payload, key, algorithm="HS256", headers={"kid": kid} if kid else None)
+
+
+def test_verifies_service_tokens_locally():
+    verifier = JWTVerifier({JWT_KEY_ID: JWT_SECRET})
+    payload = verifier.verify(sign_jwt(1, 1, "admin"))
+    assert payload.get("user_id") == 1
+    assert payload.get("role") == "admin"
+
+
+def test_key_rotation():
+    verifier = JWTVerifier({"v2": NEW_SECRET, "v1": OLD_SECRET}, default_kid="v1")
+    old_token = make_token(OLD_SECRET, "v1")
+    legacy_token = make_token(OLD_SECRET)
+
+    assert verifier.verify(make_token(NEW_SECRET, "v2")) is not None
+    assert verifier.verify(old_token) is not None
+    assert verifier.verify(legacy_token) is not None
+    # Falscher Key für die kid, unbekannte kid
+    assert verifier.verify(make_token(OLD_SECRET, "v2")) is None
+    assert verifier.verify(make_token(NEW_SECRET, "v3")) is None
+
+    verifier.remove_key("v1")
+    assert verifier.verify(old_token) is None
+    assert verifier.verify(legacy_token) is None
+
+
+def test_expired_and_invalid_tokens():
+    verifier = JWTVerifier({"v1": NEW_SECRET})
+    token = make_token(NEW_SECRET, "v1", expires_in=0.05)
+    assert verifier.verify(token) is not None
+    time.sleep(0.1)
+    assert verifier.verify(token) is None
+
+    assert verifier.verify("not-a-token") is None
+    assert verifier.verify_many([make_token(NEW_SECRET, "v1"), "not-a-token"])[1] is None
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("JWT_KEYS", f"v2:{NEW_SECRET},v1:{OLD_SECRET}")
+    verifier = JWTVerifier.from_env()
+    assert verifier.default_kid == "v2"
+    assert verifier.verify(make_token(NEW_SECRET)) is not None
+    assert verifier.verify(make_token(OLD_SECRET, "v1")) is not None
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import create_engine
+
+from backend_db_lib.models import base, Layer
+from migrations import MIGRATIONS, upgrade, status
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_create_all_leaves_indexes_to_migrations(engine):
+    # Die Indizes gehören nicht zur Metadata von backend_db_lib, nur upgrade() legt sie an
+    for migration in MIGRATIONS:
+        for index in migration.indexes:
+            assert index.table.metadata is not base.metadata
+    for entry in status(engine):
+        assert not any(entry["indexes"].values())
+
+
+def test_upgrade_creates_indexes_once(engine):
+    assert upgrade(engine) == [migration.version for migration in MIGRATIONS]
+    assert upgrade(engine) == []
+
+    for entry in status(engine):
+        assert entry["applied"]
+        assert all(entry["indexes"].values())
+        assert all(entry["tables"].values())
+
+
+def test_user_filters_use_index(engine):
+    upgrade(engine)
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            'EXPLAIN QUERY PLAN SELECT id FROM "user" WHERE company_id = 1 AND group_id = 2 AND layer_id = 3'
+        ).fetchall()
+    assert "ix_user_company_group_layer" in " ".join(row[-1] for row in plan)
+
+
+def test_duplicate_layer_names_block_unique_index(engine):
+    with engine.begin() as conn:
+        conn.execute(Layer.__table__.insert(), [
+            {"layer_name": "Duplicate", "layer_number": 1, "company_id": 1},
+            {"layer_name": "Duplicate", "layer_number": 2, "company_id": 1},
+        ])
+
+    with pytest.raises(RuntimeError, match="uq_layer_company_name"):
+        upgrade(engine)
+    assert [entry["applied"] for entry in status(engine)] == [True] + [False] * (len(MIGRATIONS) - 1)
@@ -0,0 +1,22 @@
+from backend_db_lib.models import User
+
+from passwords import hash_password, verify_password, pwd_context
+
+
+def test_hash_and_verify_password():
+    password_hash = hash_password("secret")
+    assert pwd_context.identify(password_hash) is not None
+    assert verify_password("secret", password_hash) == (True, None)
+    assert verify_password("wrong", password_hash) == (False, None)
+
+
+def test_legacy_hash_is_upgraded():
+    valid, new_hash = verify_password("secret", User.generate_hash("secret"))
+    assert valid
+    assert verify_password("secret", new_hash) == (True, None)
+
+    assert verify_password("wrong", User.generate_hash("secret")) == (False, None)
+
+
+def test_unknown_user_is_rejected():
+    assert verify_password("secret", None) == (False, None)
@@ -0,0 +1,43 @@
+import time
+
+from profiling import RequestStats, SlowRequestProfiler, current_request, timed
+
+
+def test_timed_adds_to_current_request():
+    stats = RequestStats()
+    token = current_request.set(stats)
+    try:
+        with timed("jwt"):
+            time.sleep(0.01)
+    finally:
+        current_request.reset(token)
+    assert stats.durations["jwt"] >= 0.01
+
+    # Außerhalb eines Requests passiert nichts
+    with timed("jwt"):
+        pass
+
+
+def test_slow_request_profiler_dumps_folded_stacks(tmp_path):
+    profiler = SlowRequestProfiler(threshold=0.01, interval=0.001, directory=str(tmp_path))
+
+    samples = profiler.start()
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    path = profiler.stop(samples, 0.05, "GET /api/user_management/user/{user_id}")
+
+    assert path is not None
+    with open(path) as file:
+        lines = file.read().splitlines()
+    assert any("test_slow_request_profiler_dumps_folded_stacks" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_slow_request_profiler_skips_fast_requests(tmp_path):
+    profiler = SlowRequestProfiler(threshold=10, interval=0.001, directory=str(tmp_path))
+
+    samples = profiler.start()
+    time.sleep(0.01)
+    assert profiler.stop(samples, 0.01, "GET /") is None
+    assert list(tmp_path.iterdir()) == []
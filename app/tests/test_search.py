@@ -0,0 +1,43 @@
+from search import CompanyDirectory, trigrams, similarity, search_terms
+
+
+ROWS = [
+    (1, "Anna", "Schmidt", "anna.schmidt@example.de"),
+    (2, "Annika", "Schneider", "annika@example.de"),
+    (3, "Bernd", "Schmitt", "bernd.schmitt@example.de"),
+    (4, "Clara", "Meyer", "clara@example.de"),
+]
+
+
+def test_trigrams_like_pg_trgm():
+    # SELECT show_trgm('word') -> {"  w"," wo","ord","rd ","wor"}
+    assert trigrams("Word") == {"  w", " wo", "wor", "ord", "rd "}
+    assert similarity(trigrams("schmidt"), trigrams("schmidt")) == 1.0
+    assert similarity(trigrams("abc"), trigrams("xyz")) == 0.0
+
+
+def test_prefix_search():
+    directory = CompanyDirectory(ROWS)
+    assert directory.search(["ann"], fuzzy=False, offset=0, limit=10) == [1, 2]
+    assert directory.search(["schm"], fuzzy=False, offset=0, limit=10) == [1, 3]
+    # Jeder Begriff muss passen
+    assert directory.search(search_terms("Anna Sch"), fuzzy=False, offset=0, limit=10) == [1]
+    assert directory.search(["clara@"], fuzzy=False, offset=0, limit=10) == [4]
+    assert directory.search(["zzz"], fuzzy=True, offset=0, limit=10) == []
+
+
+def test_fuzzy_search_ranks_prefix_first():
+    directory = CompanyDirectory(ROWS)
+    # Tippfehler findet beide Schmi(d|t)t, exakter Präfix zuerst
+    assert directory.search(["schmitt"], fuzzy=True, offset=0, limit=10) == [3, 1]
+    assert directory.search(["schmitt"], fuzzy=False, offset=0, limit=10) == [3]
+    assert directory.search(["meier"], fuzzy=True, offset=0, limit=10) == [4]
+
+
+def test_pagination_and_add():
+    directory = CompanyDirectory(ROWS)
+    assert directory.search(["a"], fuzzy=False, offset=0, limit=1) == [1, 2]
+    assert directory.search(["a"], fuzzy=False, offset=1, limit=1) == [2]
+
+    directory.add(5, "Anton", "Albers", "anton@example.de")
+    assert directory.search(["anton"], fuzzy=False, offset=0, limit=10) == [5]
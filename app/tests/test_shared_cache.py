@@ -0,0 +1,135 @@
+import time
+
+import pytest
+
+pytest.importorskip("redis")
+
+from cache import Cache, RedisStore, create_store
+from etag import DataVersions
+from ratelimit import AttemptLimiter
+from tests.fake_redis import FakeRedisServer
+
+
+@pytest.fixture
+def server():
+    with FakeRedisServer() as server:
+        yield server
+
+
+@pytest.fixture
+def replicas(server):
+    # Zwei Stores mit eigenem Listener verhalten sich wie zwei Replicas
+    stores = [RedisStore(server.url, prefix="test"), RedisStore(server.url, prefix="test")]
+    for store in stores:
+        store.start()
+    time.sleep(0.2)
+    yield stores
+    for store in stores:
+        store.stop()
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_create_store():
+    assert create_store("memory://") is None
+    with pytest.raises(ValueError):
+        create_store("memcached://localhost")
+
+
+def test_memory_cache_without_store():
+    cache = Cache("test", maxsize=10, ttl=60)
+    cache.set(("layers", 1), [1, 2])
+    assert cache.get(("layers", 1)) == [1, 2]
+    cache.invalidate(("layers", 1))
+    assert cache.get(("layers", 1)) is None
+    assert cache.stats()["backend"] == "memory"
+
+
+def test_shared_cache_between_replicas(replicas):
+    first = Cache("users", maxsize=10, ttl=60, store=replicas[0])
+    second = Cache("users", maxsize=10, ttl=60, store=replicas[1])
+
+    first.set(1, {"id": 1, "first_name": "Josef"})
+    assert second.get(1) == {"id": 1, "first_name": "Josef"}
+    assert second.stats()["remote_hits"] == 1
+
+    # bytes-Schlüssel (Token-Hashes) landen als Hex im Store
+    first.set(b"\x01\x02", {"user_id": 1})
+    assert second.get(b"\x01\x02") == {"user_id": 1}
+
+
+def test_invalidate_evicts_near_cache_of_other_replicas(replicas):
+    first = Cache("users", maxsize=10, ttl=60, store=replicas[0])
+    second = Cache("users", maxsize=10, ttl=60, store=replicas[1])
+
+    first.set(1, {"layer_id": 1})
+    assert second.get(1) == {"layer_id": 1}
+
+    first.invalidate(1)
+    assert wait_for(lambda: second.local.get("1") is None)
+    assert second.get(1) is None
+
+
+def test_events_between_replicas(replicas):
+    received = []
+    replicas[1].subscribe("hierarchy", received.append)
+    replicas[0].subscribe("hierarchy", received.append)
+
+    replicas[0].publish("hierarchy", company_id=1)
+    assert wait_for(lambda: received)
+    time.sleep(0.05)
+    # Der Sender bekommt seine eigenen Nachrichten nicht
+    assert len(received) == 1
+    assert received[0]["company_id"] == 1
+
+
+def test_data_versions_shared_between_replicas(server):
+    first = DataVersions(RedisStore(server.url, prefix="test"))
+    second = DataVersions(RedisStore(server.url, prefix="test"))
+
+    etag = first.etag("layers", 1)
+    assert second.etag("layers", 1) == etag
+
+    second.bump(1)
+    assert first.etag("layers", 1) != etag
+    assert first.get(1) == 1
+    assert first.get() == 1
+
+
+def test_attempt_limiter_shared(server):
+    # Fehlversuche auf einer Replica sperren den Key auch auf der anderen
+    limiters = [AttemptLimiter("ip", 3, 60, RedisStore(server.url, prefix="test")) for _ in range(2)]
+    for _ in range(3):
+        assert not limiters[1].blocked("10.0.0.1")
+        limiters[0].failed("10.0.0.1")
+    assert limiters[1].blocked("10.0.0.1")
+    assert not limiters[1].blocked("10.0.0.2")
+
+    limiters[1].reset("10.0.0.1")
+    assert not limiters[0].blocked("10.0.0.1")
+
+
+def test_unavailable_store_fails_open():
+    store = RedisStore("redis://127.0.0.1:1/0", prefix="test")
+    versions = DataVersions(store)
+    assert versions.etag("layers", 1) is None
+    assert versions.get(1) is None
+    versions.bump(1)
+
+    cache = Cache("users", maxsize=10, ttl=60, store=store)
+    cache.set(1, {"id": 1})
+    assert cache.get(1) == {"id": 1}
+    cache.invalidate(1)
+    cache.clear()
+    assert cache.get(1) is None
+
+    limiter = AttemptLimiter("ip", 1, 60, store)
+    limiter.failed("10.0.0.1")
+    assert not limiter.blocked("10.0.0.1")
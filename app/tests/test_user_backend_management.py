@@ -1,16 +1,48 @@
-from main import client
+from fastapi.testclient import TestClient
+from main import app, dbm, async_dbm
+from cache import user_cache
+from schemas import UserResponse, UserListResponse, LayerListResponse, GroupListResponse
+from ratelimit import ip_attempts, account_attempts
+from sqlalchemy import event
+import json
+import pytest
 import random
 import string
 
+client = TestClient(app)
+
 token = ""
 jwt_token =""
 
+@pytest.fixture(scope="module", autouse=True)
+def lifespan():
+    # Startup wie im Betrieb, legt u.a. das Änderungsprotokoll an
+    with client:
+        yield
+
 def generate_random_email():
   return "".join(random.choices(string.ascii_uppercase + string.digits, k=10)) + "@email.com"
 
 def generate_random_name():
   return "".join(random.choices(string.ascii_uppercase + string.digits, k=15))
 
+class count_queries:
+    def __enter__(self):
+        self.count = 0
+        self.engine = async_dbm.engine.sync_engine if async_dbm is not None else dbm.engine
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def login_token():
+    response = client.post("/api/user_management/login", json={"email": "josef@test.de", "password": "test"})
+    return response.json().get("token")
+
 def test_login():
     data = {
         "email": "josef@test.de",
@@ -24,6 +56,48 @@ def test_login():
     assert response.json().get("token") is not None
     jwt_token = response.json().get("token") 
 
+def test_login_single_query():
+    with count_queries() as queries:
+        response = client.post("/api/user_management/login", json={"email": "josef@test.de", "password": "test"})
+    assert response.json().get("result") == 1
+    assert queries.count == 1
+
+def test_login_failures_are_rate_limited():
+    email = generate_random_email()
+    for _ in range(account_attempts.limit):
+        response = client.post("/api/user_management/login", json={"email": email, "password": "wrong"})
+        assert response.json().get("result") == 0
+
+    with count_queries() as queries:
+        response = client.post("/api/user_management/login", json={"email": email, "password": "wrong"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert queries.count == 0
+
+    # Andere Accounts sind nicht betroffen, derselbe Account von einer anderen IP auch nicht
+    response = client.post("/api/user_management/login", json={"email": "josef@test.de", "password": "test"})
+    assert response.json().get("result") == 1
+    other_client = TestClient(app, client=("10.0.0.2", 50000))
+    response = other_client.post("/api/user_management/login", json={"email": email.lower(), "password": "wrong"})
+    assert response.status_code == 200
+    ip_attempts.reset("testclient")
+    ip_attempts.reset("10.0.0.2")
+
+def test_login_rate_limit_behind_trusted_proxy(monkeypatch):
+    import ipaddress
+    import ratelimit
+    monkeypatch.setattr(ratelimit, "trusted_proxies", [ipaddress.ip_network("10.1.0.0/16")])
+    proxy = TestClient(app, client=("10.1.0.5", 50000))
+
+    response = proxy.post("/api/user_management/login", headers={"X-Forwarded-For": "1.2.3.4, 198.51.100.7, 10.1.0.9"},
+                          json={"email": generate_random_email(), "password": "wrong"})
+    assert response.json().get("result") == 0
+    # Die erste Adresse kann der Client selbst setzen, gezählt wird die letzte vor den eigenen Proxies
+    assert ip_attempts.failures("198.51.100.7") == 1
+    assert ip_attempts.failures("1.2.3.4") == 0
+    assert ip_attempts.failures("10.1.0.5") == 0
+    ip_attempts.reset("198.51.100.7")
+
 def test_get_groups():
     data = {
         "email": "josef@test.de",
@@ -70,12 +144,108 @@ def test_register():
     assert isinstance(response.json(), dict)
     assert response.json().get("result") == 1
 
+def test_register_bulk():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+
+    emails = [generate_random_email() for _ in range(3)]
+    csv_data = "first_name,last_name,email,password,supervisor_id,layer_id,group_id,role_id\n"
+    csv_data += f"Franz,Hans,{emails[0]},test,2,1,1,1\n"
+    csv_data += f"Franz,Hans,{emails[1]},test,,1,1,1\n"
+    csv_data += f"Franz,Hans,{emails[0]},test,,1,1,1\n"
+    csv_data += "Franz,Hans,josef@test.de,test,,1,1,1\n"
+    csv_data += f"Franz,,{emails[2]},test,,1,1,1\n"
+
+    response = client.post("/api/user_management/register/bulk", content=csv_data,
+                           headers={"Authorization":f"Bearer {token}", "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    assert response.json().get("imported") == 2
+    assert [error.get("row") for error in response.json().get("errors")] == [3, 4, 5]
+
+    ndjson_data = f'{{"first_name": "Franz", "last_name": "Hans", "email": "{generate_random_email()}", "password": "test", "layer_id": 1}}\n'
+    response = client.post("/api/user_management/register/bulk?format=ndjson", content=ndjson_data,
+                           headers={"Authorization":f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json().get("imported") == 1
+
+    response = client.post("/api/user_management/login", json={"email": emails[0], "password": "test"})
+    assert response.json().get("result") == 1
+
+def test_register_bulk_checks_targets():
+    token = login_token()
+
+    emails = [generate_random_email() for _ in range(4)]
+    csv_data = "first_name,last_name,email,password,supervisor_id,layer_id,group_id,role_id\n"
+    csv_data += f"Franz,Hans,{emails[0]},test,999999,1,1,1\n"
+    csv_data += f"Franz,Hans,{emails[1]},test,,999999,1,1\n"
+    csv_data += f"Franz,Hans,{emails[2]},test,,1,1,999999\n"
+    csv_data += f"Franz,Hans,{emails[3]},test,1,1,2,2\n"
+
+    response = client.post("/api/user_management/register/bulk", content=csv_data,
+                           headers={"Authorization":f"Bearer {token}", "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    assert response.json().get("imported") == 1
+    assert [(error.get("row"), error.get("error")) for error in response.json().get("errors")] == [
+        (1, "Supervisor not found in your company"), (2, "Layer not found in your company"), (3, "Role not found in your company")]
+
 def test_userInfo_abfragen():
     response = client.get("/api/user_management/user/1")
     assert response.status_code == 200
     assert isinstance(response.json(), dict)
     assert response.json().get("result") == 1
 
+def test_userInfo_abfragen_single_query():
+    user_cache.clear()
+    for user_id in (1, 3):
+        with count_queries() as queries:
+            response = client.get(f"/api/user_management/user/{user_id}")
+        assert response.status_code == 200
+        assert queries.count == 1
+
+        data = response.json().get("data")
+        assert "password_hash" not in data
+        assert data.get("company") is not None
+
+def test_userInfo_abfragen_cached():
+    client.get("/api/user_management/user/1")
+    with count_queries() as queries:
+        response = client.get("/api/user_management/user/1")
+    assert response.status_code == 200
+    assert queries.count == 0
+
+def test_userInfo_abfragen_unknown_user():
+    response = client.get("/api/user_management/user/999999999")
+    assert response.status_code == 404
+
+def test_pool_metrics():
+    client.get("/api/user_management/user/1")
+
+    response = client.get("/api/user_management/metrics")
+    assert response.status_code == 200
+    assert 'user_management_db_pool_checked_out{engine="sync"}' in response.text
+    assert 'user_management_db_pool_wait_seconds_count{engine="sync"}' in response.text
+    if async_dbm is not None:
+        assert 'user_management_db_pool_wait_seconds_count{engine="async"}' in response.text
+        assert 'user_management_db_pool_timeouts_total{engine="async"}' in response.text
+
+def test_request_metrics():
+    user_cache.clear()
+    client.get("/api/user_management/user/1")
+
+    response = client.get("/api/user_management/metrics")
+    labels = 'method="GET",route="/api/user_management/user/{user_id}"'
+    assert f"user_management_http_request_duration_seconds_count{{{labels}}}" in response.text
+    assert f"user_management_http_db_seconds_count{{{labels}}}" in response.text
+    assert f"user_management_http_serialization_seconds_count{{{labels}}}" in response.text
+    assert f'user_management_http_responses_total{{{labels},status="200"}}' in response.text
+    statements = [line for line in response.text.splitlines() if line.startswith(f"user_management_http_sql_statements_sum{{{labels}}}")]
+    assert float(statements[0].split()[-1]) >= 1
+
 def test_validateJWT():
     data = {
         "email": "josef@test.de",
@@ -91,6 +261,26 @@ def test_validateJWT():
     assert response.json().get("result") == 1
 
 
+def test_validateJWT_batch():
+    token = login_token()
+
+    response = client.post("/api/user_management/validateJWT/batch/", json={"tokens": [token, "invalid", token]})
+    assert response.status_code == 200
+    data = response.json().get("data")
+    assert [entry.get("result") for entry in data] == [1, 0, 1]
+    assert data[0].get("payload").get("user_id") == 1
+
+    response = client.post("/api/user_management/validateJWT/batch/", json={"tokens": ["invalid"] * 1001})
+    assert response.status_code == 400
+
+
+def test_missing_or_invalid_token():
+    response = client.get("/api/user_management/layers")
+    assert response.status_code == 403
+
+    response = client.get("/api/user_management/layers", headers={"Authorization":"Bearer invalid"})
+    assert response.status_code == 403
+
 def test_get_layers():
     data = {
         "email": "josef@test.de",
@@ -117,11 +307,16 @@ def test_add_user_to_layer():
     response = client.post("/api/user_management/login", json=data)
     token = response.json().get("token")
 
+    client.get("/api/user_management/user/3")
     response = client.post("/api/user_management/user/layer/3", headers={"Authorization":f"Bearer {token}"}, json=data2)
     assert response.status_code == 200
     assert isinstance(response.json(), dict) 
     assert response.json().get("result") == 1
 
+    # Gecachter User wird beim Schreiben verworfen
+    response = client.get("/api/user_management/user/3")
+    assert response.json().get("data").get("layer").get("id") == 2
+
 def test_add_User_to_group():
     data = {
         "email": "josef@test.de",
@@ -139,6 +334,114 @@ def test_add_User_to_group():
     assert isinstance(response.json(), dict) 
     assert response.json().get("result") == 1
 
+def test_patch_user_constant_queries():
+    token = login_token()
+
+    with count_queries() as queries:
+        response = client.patch("/api/user_management/user/3", headers={"Authorization":f"Bearer {token}"}, json={"group_id": 2})
+    assert response.status_code == 200
+    # UPDATE ... RETURNING, Version und Eintrag im Änderungsprotokoll, gejointer Read
+    assert queries.count == 4
+    assert response.json().get("group").get("id") == 2
+    assert response.json().get("supervisor").get("supervisorid") == 2
+
+    response = client.patch("/api/user_management/user/3", headers={"Authorization":f"Bearer {token}"}, json={"supervisor_id": 1, "role_id": 2})
+    assert response.status_code == 200
+    assert response.json().get("supervisor").get("supervisorid") == 1
+    response = client.patch("/api/user_management/user/3", headers={"Authorization":f"Bearer {token}"}, json={"supervisor_id": 2})
+    assert response.json().get("supervisor").get("supervisorid") == 2
+
+def test_patch_user_rejects_supervisor_cycle():
+    token = login_token()
+
+    # 1 ist Vorgesetzter von 2, 2 von 3
+    response = client.patch("/api/user_management/user/1", headers={"Authorization":f"Bearer {token}"}, json={"supervisor_id": 3})
+    assert response.status_code == 400
+    response = client.patch("/api/user_management/user/1", headers={"Authorization":f"Bearer {token}"}, json={"supervisor_id": 1})
+    assert response.status_code == 400
+
+def test_supervisor_cycle_checked_against_current_rows():
+    from backend_db_lib.models import User
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+    # Hierarchie-Index aufbauen, neue User landen darin
+    client.get("/api/user_management/user/1/subordinates", headers=headers)
+    first, second = [client.post("/api/user_management/register", json={"first_name": "Zyklus", "last_name": "Test", "email": generate_random_email(), "password_hash": "test",
+                                                                         "supervisor_id": 1, "layer_id": 2, "company_id": 1, "group_id": 1, "role_id": 2}).json().get("id") for _ in range(2)]
+    # Wie eine andere Replica am Index vorbei schreiben: second wird Vorgesetzter von first
+    with dbm.create_session() as session:
+        session.query(User).filter(User.id == first).update({"supervisor_id": second})
+        session.commit()
+
+    # second unter first wäre ein Zyklus, der Index kennt die neue Kante nicht
+    response = client.patch(f"/api/user_management/user/{second}", headers=headers, json={"supervisor_id": first})
+    assert response.status_code == 400
+    response = client.patch("/api/user_management/users/", headers=headers, json={"user_ids": [second], "supervisor_id": first})
+    assert response.status_code == 400
+    response = client.post("/api/user_management/reorg/", headers=headers, json={"changes": [{"user_id": second, "supervisor_id": first}]})
+    assert response.status_code == 400
+    assert response.json().get("detail").get("errors") == [{"index": 0, "user_id": second, "error": "Supervisor change would create a cycle"}]
+
+def test_patch_user_unknown_target():
+    token = login_token()
+
+    response = client.patch("/api/user_management/user/3", headers={"Authorization":f"Bearer {token}"}, json={"layer_id": 999999})
+    assert response.status_code == 404
+    assert response.json().get("detail") == "Layer not found in your company"
+    response = client.patch("/api/user_management/user/999999", headers={"Authorization":f"Bearer {token}"}, json={"layer_id": 2})
+    assert response.status_code == 404
+    assert response.json().get("detail") == "User not found"
+    response = client.patch("/api/user_management/user/3", headers={"Authorization":f"Bearer {token}"}, json={})
+    assert response.status_code == 400
+
+def test_patch_users_batch():
+    token = login_token()
+
+    response = client.patch("/api/user_management/users/", headers={"Authorization":f"Bearer {token}"}, json={"user_ids": [2, 3, 999999], "layer_id": 2})
+    assert response.status_code == 200
+    assert response.json().get("updated") == [2, 3]
+    assert response.json().get("not_found") == [999999]
+
+def test_reorg():
+    token = login_token()
+    changes = [{"user_id": 3, "group_id": 1, "supervisor_id": 1}, {"user_id": 2, "layer_id": 2}]
+
+    response = client.post("/api/user_management/reorg/", headers={"Authorization":f"Bearer {token}"}, json={"changes": changes, "dry_run": True})
+    assert response.status_code == 200
+    # User 2 ist schon in Layer 2
+    assert response.json() == {"result": 1, "dry_run": True, "updated": 1, "unchanged": 1, "changes": {"layer_id": 0, "group_id": 1, "supervisor_id": 1, "role_id": 0}}
+    assert client.get("/api/user_management/user/3").json().get("data").get("group").get("id") == 2
+
+    response = client.post("/api/user_management/reorg/", headers={"Authorization":f"Bearer {token}"}, json={"changes": changes})
+    assert response.status_code == 200
+    assert response.json().get("updated") == 1
+    user = client.get("/api/user_management/user/3").json().get("data")
+    assert user.get("group").get("id") == 1
+    assert user.get("supervisorid") == 1
+
+    response = client.post("/api/user_management/reorg/", headers={"Authorization":f"Bearer {token}"}, json={"changes": [{"user_id": 3, "group_id": 2, "supervisor_id": 2}]})
+    assert response.status_code == 200
+    assert client.get("/api/user_management/user/3").json().get("data").get("supervisorid") == 2
+
+def test_reorg_rejects_invalid_changes():
+    token = login_token()
+
+    # 2 unter 3 wäre ein Zyklus (3 ist Untergebener von 2), der Rest wird dann auch nicht geschrieben
+    changes = [{"user_id": 3, "group_id": 1}, {"user_id": 2, "supervisor_id": 3}, {"user_id": 999999, "layer_id": 2}, {"user_id": 1, "layer_id": 999999}]
+    response = client.post("/api/user_management/reorg/", headers={"Authorization":f"Bearer {token}"}, json={"changes": changes})
+    assert response.status_code == 400
+    assert response.json().get("detail").get("errors") == [
+        {"index": 1, "user_id": 2, "error": "Supervisor change would create a cycle"},
+        {"index": 2, "user_id": 999999, "error": "User not found in your company"},
+        {"index": 3, "user_id": 1, "error": "Layer not found in your company"},
+    ]
+    assert client.get("/api/user_management/user/3").json().get("data").get("group").get("id") == 2
+
+    response = client.post("/api/user_management/reorg/", headers={"Authorization":f"Bearer {token}"}, json={"changes": [{"user_id": 3, "layer_id": 1}, {"user_id": 3, "layer_id": 2}]})
+    assert response.json().get("detail").get("errors") == [{"index": 1, "user_id": 3, "error": "User changed twice"}]
+    response = client.post("/api/user_management/reorg/", headers={"Authorization":f"Bearer {token}"}, json={"changes": []})
+    assert response.status_code == 400
+
 def test_add_layer():
     data = {
         "email": "josef@test.de",
@@ -174,6 +477,98 @@ def test_add_group():
     assert isinstance(response.json(), dict) 
     assert response.json().get("result") == 1
 
+def test_add_layer_invalidates_cached_layers():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+    layer_name = generate_random_name()
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+
+    client.get("/api/user_management/layers", headers={"Authorization":f"Bearer {token}"})
+    client.post("/api/user_management/layers", headers={"Authorization":f"Bearer {token}"}, json={"layer_name": layer_name, "layer_number": 0})
+
+    cache_stats = lambda: client.get("/api/user_management/cache").json().get("data")
+    before = cache_stats()
+    response = client.get("/api/user_management/layers", headers={"Authorization":f"Bearer {token}"})
+    assert layer_name in [layer.get("layer_name") for layer in response.json().get("data")]
+    # Der neue Layer erhöht die Version: ein Miss für die Liste, die Company der Layer ist ein Treffer
+    after_miss = cache_stats()
+    assert after_miss.get("misses") - before.get("misses") == 1
+    assert after_miss.get("hits") - before.get("hits") == 1
+
+    client.get("/api/user_management/layers", headers={"Authorization":f"Bearer {token}"})
+    after_hit = cache_stats()
+    assert after_hit.get("hits") - after_miss.get("hits") == 1
+    assert after_hit.get("misses") - after_miss.get("misses") == 0
+
+def test_get_layers_not_modified():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.get("/api/user_management/layers", headers=headers)
+    etag = response.headers.get("ETag")
+    assert etag is not None
+    assert response.headers.get("Cache-Control") is not None
+
+    with count_queries() as queries:
+        response = client.get("/api/user_management/layers", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert queries.count == 0
+
+    client.post("/api/user_management/layers", headers=headers, json={"layer_name": generate_random_name(), "layer_number": 0})
+    response = client.get("/api/user_management/layers", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers.get("ETag") != etag
+
+def test_userInfo_not_modified():
+    response = client.get("/api/user_management/user/1")
+    etag = response.headers.get("ETag")
+
+    with count_queries() as queries:
+        response = client.get("/api/user_management/user/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert queries.count == 0
+
+def test_startup_fails_without_change_log(monkeypatch):
+    # Ohne Änderungsprotokoll würde jeder Schreibzugriff mit 500 enden, der Worker startet dann gar nicht
+    import main
+    def fail(engine):
+        raise RuntimeError("database not reachable")
+    monkeypatch.setattr(main, "create_tables", fail)
+    with pytest.raises(RuntimeError):
+        with TestClient(app):
+            pass
+
+def test_store_outage_fails_open(monkeypatch):
+    # Geteilter Store nicht erreichbar: Antworten ohne ETag statt 500, Schreibzugriffe bleiben erfolgreich
+    from cache import RedisStore
+    from etag import data_versions
+    unavailable = RedisStore("redis://127.0.0.1:1/0", prefix="test")
+    monkeypatch.setattr(data_versions, "store", unavailable)
+    monkeypatch.setattr(user_cache, "store", unavailable)
+    headers = {"Authorization": f"Bearer {login_token()}"}
+
+    response = client.get("/api/user_management/layers", headers={**headers, "If-None-Match": "*"})
+    assert response.status_code == 200
+    assert response.headers.get("ETag") is None
+    response = client.get("/api/user_management/user/2", headers={"If-None-Match": "*"})
+    assert response.status_code == 200
+    assert response.headers.get("ETag") is None
+    response = client.get("/api/user_management/statistics/", headers=headers)
+    assert response.status_code == 200
+
+    response = client.patch("/api/user_management/user/2", headers=headers, json={"layer_id": 2})
+    assert response.status_code == 200
+
 def test_get_all_groups():
     data = {
         "email": "josef@test.de",
@@ -202,6 +597,72 @@ def test_get_all_user_in_group():
     assert isinstance(response.json(), dict) 
     assert response.json().get("result") == 1
 
+def test_get_all_user_in_group_constant_queries():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+
+    with count_queries() as queries:
+        response = client.get("/api/user_management/group/1", headers={"Authorization":f"Bearer {token}"})
+    assert response.status_code == 200
+    # Users + je ein IN (...) Query für Company, Role, Group und Layer
+    assert queries.count <= 5
+    for user in response.json().get("data"):
+        assert "password_hash" not in user
+        assert user.get("company") is not None
+
+def test_get_all_user_in_group_paginated():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.get("/api/user_management/group/1", headers=headers)
+    all_ids = [user.get("id") for user in response.json().get("data")]
+    assert response.json().get("next_cursor") is None
+
+    ids = []
+    cursor = None
+    while True:
+        params = {"limit": 1} if cursor is None else {"limit": 1, "cursor": cursor}
+        response = client.get("/api/user_management/group/1", headers=headers, params=params)
+        assert response.status_code == 200
+        assert len(response.json().get("data")) <= 1
+        ids += [user.get("id") for user in response.json().get("data")]
+        cursor = response.json().get("next_cursor")
+        if cursor is None:
+            break
+    assert ids == sorted(all_ids)
+
+def test_get_all_user_in_group_fields():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.get("/api/user_management/group/1?fields=first_name,role", headers=headers)
+    assert response.status_code == 200
+    for user in response.json().get("data"):
+        assert set(user.keys()) == {"first_name", "role"}
+
+    response = client.get("/api/user_management/group/1?fields=password_hash", headers=headers)
+    assert response.status_code == 400
+
+    response = client.get("/api/user_management/group/1?cursor=%%%", headers=headers)
+    assert response.status_code == 400
+
 def test_get_all_employee_in_groups():
     data = {
         "email": "josef@test.de",
@@ -228,4 +689,234 @@ def test_get_all_supervisor_in_groups():
     response = client.get("/api/user_management/groups/supervisor/1", headers={"Authorization":f"Bearer {token}"})
     assert response.status_code == 200
     assert isinstance(response.json(), dict) 
-    assert response.json().get("result") == 1
\ No newline at end of file
+    assert response.json().get("result") == 1
+
+def test_get_user_subordinates():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+
+    response = client.get("/api/user_management/user/1/subordinates", headers={"Authorization":f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json().get("result") == 1
+    assert 1 not in [user.get("id") for user in response.json().get("data")]
+
+    response = client.get("/api/user_management/user/999999999/subordinates", headers={"Authorization":f"Bearer {token}"})
+    assert response.status_code == 404
+
+def test_get_group_supervisors_by_hierarchy():
+    data = {
+        "email": "josef@test.de",
+        "password": "test"
+    }
+
+    response = client.post("/api/user_management/login", json=data)
+    token = response.json().get("token")
+
+    response = client.get("/api/user_management/groups/supervisor/1/2/1", headers={"Authorization":f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json().get("result") == 1
+
+def test_directory_snapshot_and_changes():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.get("/api/user_management/directory/snapshot/", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0].get("type") == "version"
+    version = lines[0].get("version")
+    types = [line.get("type") for line in lines[1:]]
+    assert {"layer", "group", "user"} <= set(types)
+    user_ids = [line["data"]["id"] for line in lines if line.get("type") == "user"]
+    assert 1 in user_ids and len(user_ids) == len(set(user_ids))
+
+    response = client.get(f"/api/user_management/directory/changes/?since={version}", headers=headers)
+    assert response.json().get("users") == []
+    assert response.json().get("version") == version
+
+    # Schreibzugriffe landen im Änderungsprotokoll
+    client.patch("/api/user_management/user/3", headers=headers, json={"group_id": 2})
+    layer_name = generate_random_name()
+    client.post("/api/user_management/layers/", headers=headers, json={"layer_name": layer_name, "layer_number": 7})
+    response = client.get(f"/api/user_management/directory/changes/?since={version}", headers=headers)
+    data = response.json()
+    assert [user["id"] for user in data.get("users")] == [3]
+    assert [layer["layer_name"] for layer in data.get("layers")] == [layer_name]
+    assert data.get("version") > version
+    assert data.get("has_more") is False
+
+    response = client.get(f"/api/user_management/directory/changes/?since={data.get('version')}", headers=headers)
+    assert response.json().get("users") == [] and response.json().get("layers") == []
+
+def test_new_version_misses_cached_lists():
+    # Wie eine andere Replica: committen und Version erhöhen, die Invalidierung ist hier noch nicht angekommen
+    from backend_db_lib.models import Layer, User
+    from etag import data_versions
+    headers = {"Authorization":f"Bearer {login_token()}"}
+    client.get("/api/user_management/layers/", headers=headers)
+    client.get("/api/user_management/user/3")
+    layer_name = generate_random_name()
+    with dbm.create_session() as session:
+        session.add(Layer(layer_name=layer_name, layer_number=9, company_id=1))
+        first_name = session.query(User.first_name).filter(User.id == 3).scalar()
+        session.query(User).filter(User.id == 3).update({"first_name": "Neu"})
+        session.commit()
+    data_versions.bump(1)
+
+    response = client.get("/api/user_management/layers/", headers=headers)
+    assert layer_name in [layer.get("layer_name") for layer in response.json().get("data")]
+    assert client.get("/api/user_management/user/3").json().get("data").get("first_name") == "Neu"
+    with dbm.create_session() as session:
+        session.query(User).filter(User.id == 3).update({"first_name": first_name})
+        session.commit()
+    data_versions.bump(1)
+
+def test_directory_changes_ignore_stale_reference_cache():
+    from backend_db_lib.models import Layer
+    from changelog import record_changes
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+    version = client.get("/api/user_management/directory/changes/?since=0", headers=headers).json().get("version")
+
+    # Layer-Cache aufwärmen, danach wie eine andere Replica vor deren Invalidierung committen
+    client.get("/api/user_management/layers/", headers=headers)
+    layer_name = generate_random_name()
+    with dbm.create_session() as session:
+        layer = Layer(layer_name=layer_name, layer_number=8, company_id=1)
+        session.add(layer)
+        session.flush()
+        record_changes(session, 1, "layer", [layer.id])
+        session.commit()
+
+    data = client.get(f"/api/user_management/directory/changes/?since={version}", headers=headers).json()
+    assert [layer["layer_name"] for layer in data.get("layers")] == [layer_name]
+    response = client.get("/api/user_management/directory/snapshot/", headers=headers)
+    layers = [json.loads(line)["data"]["layer_name"] for line in response.text.splitlines() if json.loads(line).get("type") == "layer"]
+    assert layer_name in layers
+
+def test_lookup_users_by_ids():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    with count_queries() as queries:
+        response = client.post("/api/user_management/users/lookup/", headers=headers, json={"ids": [3, 1, 999999]})
+    assert response.status_code == 200
+    data = response.json().get("data")
+    assert [user.get("id") for user in data] == [3, 1]
+    assert response.json().get("not_found") == [999999]
+    assert data[0].get("supervisorid") == 2
+    assert data[0].get("layer") is not None and data[0].get("company") is not None
+    assert "password_hash" not in data[0]
+    # User, Supervisoren und je ein IN (...) pro nicht gecachter Relation
+    assert queries.count <= 6
+
+def test_lookup_users_by_emails_with_fields():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.post("/api/user_management/users/lookup/", headers=headers, json={"emails": ["josef@test.de", "unknown@test.de"], "fields": "first_name,supervisor"})
+    assert response.status_code == 200
+    assert response.json().get("data") == [{"first_name": "Josef"}]
+    assert response.json().get("not_found") == ["unknown@test.de"]
+
+def test_lookup_users_limits():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.post("/api/user_management/users/lookup/", headers=headers, json={"ids": list(range(1002))})
+    assert response.status_code == 400
+    response = client.post("/api/user_management/users/lookup/", headers=headers, json={"ids": [1], "emails": ["josef@test.de"]})
+    assert response.status_code == 400
+    response = client.post("/api/user_management/users/lookup/", headers=headers, json={"ids": [1], "fields": "password_hash"})
+    assert response.status_code == 400
+
+def test_search_users():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.get("/api/user_management/users/search/", headers=headers, params={"q": "Jos"})
+    assert response.status_code == 200
+    assert response.json().get("data")[0].get("id") == 1
+    assert response.json().get("data")[0].get("layer") is not None
+
+    # Unscharf: Tippfehler
+    response = client.get("/api/user_management/users/search/", headers=headers, params={"q": "josf", "fields": "id,first_name"})
+    assert response.json().get("data")[0] == {"id": 1, "first_name": "Josef"}
+    response = client.get("/api/user_management/users/search/", headers=headers, params={"q": "josf", "fuzzy": "false"})
+    assert response.json().get("data") == []
+
+def test_search_users_finds_new_users_and_paginates():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+    client.get("/api/user_management/users/search/", headers=headers, params={"q": "x"})
+
+    last_name = "Suchtest" + generate_random_name()
+    for first_name in ("Alpha", "Beta", "Gamma"):
+        client.post("/api/user_management/register", json={"first_name": first_name, "last_name": last_name, "email": generate_random_email(), "password_hash": "test",
+                                                         "supervisor_id": 1, "layer_id": 1, "company_id": 1, "group_id": 1, "role_id": 1})
+
+    response = client.get("/api/user_management/users/search/", headers=headers, params={"q": last_name, "limit": 2})
+    assert [user.get("first_name") for user in response.json().get("data")] == ["Alpha", "Beta"]
+    cursor = response.json().get("next_cursor")
+    response = client.get("/api/user_management/users/search/", headers=headers, params={"q": last_name, "limit": 2, "cursor": cursor})
+    assert [user.get("first_name") for user in response.json().get("data")] == ["Gamma"]
+    assert response.json().get("next_cursor") is None
+
+def test_org_statistics():
+    token = login_token()
+
+    response = client.get("/api/user_management/statistics/", headers={"Authorization":f"Bearer {token}"})
+    assert response.status_code == 200
+    stats = response.json().get("data")
+    total = stats.get("headcount")
+    assert sum(group["headcount"] for group in stats.get("groups")) + stats.get("unassigned").get("group") == total
+    assert sum(layer["headcount"] for layer in stats.get("layers")) + stats.get("unassigned").get("layer") == total
+    assert sum(role["headcount"] for role in stats.get("roles")) + stats.get("unassigned").get("role") == total
+    span = stats.get("span_of_control")
+    supervisors = {entry["id"]: entry for entry in span.get("by_supervisor")}
+    assert span.get("supervisors") == len(supervisors)
+    assert supervisors[2]["direct_reports"] >= 1
+    assert sum(layer["supervisors"] for layer in span.get("by_layer")) == len(supervisors)
+
+def test_org_statistics_cached_per_data_version():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    response = client.get("/api/user_management/statistics/", headers=headers)
+    before = response.json().get("data")
+    with count_queries() as queries:
+        assert client.get("/api/user_management/statistics/", headers=headers).json().get("data") == before
+    assert queries.count == 0
+    response = client.get("/api/user_management/statistics/", headers={**headers, "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+    # Schreibzugriff -> neue Version, die Statistik wird neu berechnet
+    response = client.patch("/api/user_management/user/3", headers=headers, json={"group_id": 1})
+    assert response.status_code == 200
+    with count_queries() as queries:
+        after = client.get("/api/user_management/statistics/", headers=headers).json().get("data")
+    # Zwei GROUP BY über die User, Rollen, Gruppen und Layer
+    assert queries.count == 5
+    group_headcounts = lambda stats: {group["id"]: group["headcount"] for group in stats.get("groups")}
+    assert group_headcounts(after)[1] == group_headcounts(before)[1] + 1
+    assert group_headcounts(after)[2] == group_headcounts(before)[2] - 1
+    client.patch("/api/user_management/user/3", headers=headers, json={"group_id": 2})
+
+def test_read_endpoints_match_response_models():
+    token = login_token()
+    headers = {"Authorization":f"Bearer {token}"}
+
+    # Die Routen rendern ihre dicts direkt, die Modelle (OpenAPI) müssen sie trotzdem unverändert beschreiben
+    for path, model in (("/api/user_management/user/1", UserResponse), ("/api/user_management/group/1?limit=2", UserListResponse),
+                        ("/api/user_management/group/1?fields=id,email", UserListResponse), ("/api/user_management/layers", LayerListResponse),
+                        ("/api/user_management/groups", GroupListResponse), ("/api/user_management/user/3/subordinates", UserListResponse)):
+        body = client.get(path, headers=headers).json()
+        validated = model(**body)
+        dump = validated.model_dump if hasattr(validated, "model_dump") else validated.dict
+        assert dump(exclude_unset=True) == body, path
@@ -0,0 +1,140 @@
+from sqlalchemy import bindparam, exists, true, update
+from sqlalchemy.orm import aliased
+
+from backend_db_lib.models import User, Layer, Group, Role
+from changelog import record_changes
+from hierarchy import current_supervisors, supervisor_chain, supervisor_cycles
+
+
+# Änderbare Spalte -> Model, auf das sie zeigt
+UPDATABLE_FIELDS = {
+    "layer_id": Layer,
+    "group_id": Group,
+    "supervisor_id": User,
+    "role_id": Role,
+}
+TARGET_NAMES = {"layer_id": "Layer", "group_id": "Group", "supervisor_id": "Supervisor", "role_id": "Role"}
+
+
+def target_exists(field: str, value, company_id: int):
+    # Ziel muss existieren und (falls es eine Company hat) zur Company gehören; supervisor_id=None entfernt den Vorgesetzten
+    if value is None and field == "supervisor_id":
+        return true()
+    model = UPDATABLE_FIELDS[field]
+    target = aliased(User) if model is User else model
+    conditions = [target.id == value]
+    if hasattr(target, "company_id"):
+        conditions.append(target.company_id == company_id)
+    return exists().where(*conditions)
+
+
+def update_users(session, company_id: int, user_ids, values: dict):
+    """
+    Updates the given users of the company in a single UPDATE ... RETURNING and commits.
+    The targets of `values` are checked in the same statement. Returns the ids that were updated.
+    """
+    conditions = [User.id.in_(list(user_ids)), User.company_id == company_id]
+    conditions += [target_exists(field, value, company_id) for field, value in values.items()]
+    statement = (
+        update(User).where(*conditions).values(**values).returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    updated = session.execute(statement).scalars().all()
+    record_changes(session, company_id, "user", updated)
+    session.commit()
+    return updated
+
+
+def creates_cycle(session, company_id: int, user_ids, values: dict):
+    # Neuer Vorgesetzter für alle user_ids, geprüft gegen den Stand in der DB und vor dem UPDATE in derselben Transaktion.
+    # Ein Zyklus entsteht genau dann, wenn der Vorgesetzte selbst oder einer seiner Vorgesetzten verschoben wird
+    if values.get("supervisor_id") is None:
+        return False
+    return not supervisor_chain(session, company_id, values["supervisor_id"]).isdisjoint(user_ids)
+
+
+def missing_target(session, company_id: int, values: dict):
+    # Nur im Fehlerfall: welches Ziel gibt es in der Company nicht?
+    for field, value in values.items():
+        if not session.query(target_exists(field, value, company_id)).scalar():
+            return TARGET_NAMES[field]
+    return None
+
+
+def existing_targets(session, company_id: int, field: str, ids):
+    # Eine IN-Query pro Feld statt einer Prüfung pro User
+    model = UPDATABLE_FIELDS[field]
+    query = session.query(model.id).filter(model.id.in_(list(ids)))
+    if hasattr(model, "company_id"):
+        query = query.filter(model.company_id == company_id)
+    return {target_id for (target_id,) in query}
+
+
+def plan_reorg(session, company_id: int, changes):
+    """
+    Validates a list of {"user_id": ..., <field>: ...} changes against the company and the
+    supervisor tree as stored in this transaction. Returns ({user_id: values}, errors); values that equal the stored ones are
+    dropped, so only real changes are written.
+    """
+    user_ids = [change["user_id"] for change in changes]
+    columns = [getattr(User, field) for field in UPDATABLE_FIELDS]
+    current = {row.id: row for row in session.query(User.id, *columns).filter(User.company_id == company_id, User.id.in_(user_ids))}
+    targets = {}
+    for field in UPDATABLE_FIELDS:
+        wanted = {change[field] for change in changes if change.get(field) is not None}
+        targets[field] = existing_targets(session, company_id, field, wanted) if wanted else set()
+
+    planned = {}
+    errors = []
+    positions = {}
+    for index, change in enumerate(changes):
+        user_id = change["user_id"]
+        values = {field: value for field, value in change.items() if field != "user_id"}
+        error = None
+        if user_id in positions:
+            error = "User changed twice"
+        elif user_id not in current:
+            error = "User not found in your company"
+        elif not values:
+            error = "Nothing to update"
+        else:
+            for field, value in values.items():
+                if value is None and field != "supervisor_id":
+                    error = "Only supervisor_id can be removed"
+                elif value is not None and value not in targets[field]:
+                    error = f"{TARGET_NAMES[field]} not found in your company"
+                if error:
+                    break
+        positions.setdefault(user_id, index)
+        if error:
+            errors.append({"index": index, "user_id": user_id, "error": error})
+            continue
+        values = {field: value for field, value in values.items() if getattr(current[user_id], field) != value}
+        if values:
+            planned[user_id] = values
+
+    new_supervisors = {user_id: values["supervisor_id"] for user_id, values in planned.items() if "supervisor_id" in values}
+    cyclic = supervisor_cycles(current_supervisors(session, company_id), new_supervisors) if new_supervisors else ()
+    for user_id in cyclic:
+        errors.append({"index": positions[user_id], "user_id": user_id, "error": "Supervisor change would create a cycle"})
+    return planned, sorted(errors, key=lambda error: error["index"])
+
+
+def apply_reorg(session, company_id: int, planned: dict):
+    """
+    Writes the changes of plan_reorg with one executemany UPDATE per combination of changed
+    fields and commits them together with the change log.
+    """
+    table = User.__table__
+    batches = {}
+    for user_id, values in planned.items():
+        batches.setdefault(tuple(sorted(values)), []).append({"user_key": user_id, **{f"new_{field}": value for field, value in values.items()}})
+    for fields, rows in batches.items():
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("user_key"), table.c.company_id == company_id)
+            .values({field: bindparam(f"new_{field}") for field in fields})
+        )
+        session.execute(statement, rows)
+    record_changes(session, company_id, "user", planned)
+    session.commit()
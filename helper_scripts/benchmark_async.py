@@ -0,0 +1,86 @@
+# This script compares the sync (psycopg2 + threadpool) and async (asyncpg/aiosqlite) read path
+# Every mode runs in its own process because ASYNC_DB_ENABLED is read when main.py is imported
+#   python ./helper_scripts/benchmark_async.py --clients 500 --requests 5000
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+async def run_load(clients, requests, company_id, user_ids):
+    import httpx
+    from main import app
+    from auth_handler import sign_jwt
+
+    headers = {"Authorization": f"Bearer {sign_jwt(user_ids[0], company_id, 'ceo')}"}
+    urls = ["/api/user_management/layers/", "/api/user_management/groups/"] + [
+        f"/api/user_management/user/{user_id}" for user_id in user_ids[:50]
+    ]
+    semaphore = asyncio.Semaphore(clients)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        async def call(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(urls[i % len(urls)], headers=headers)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(call(i) for i in range(requests)))
+        duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "clients": clients,
+        "throughput": requests / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_async.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--mode", choices=("sync", "async"))
+    parser.add_argument("--company", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        created = json.loads(args.company)
+        result = asyncio.run(run_load(args.clients, args.requests, created["company_id"], created["user_ids"]))
+        print(json.dumps(result))
+        return
+
+    from synthetic_data import seed_database
+
+    created = seed_database(args.database_url, users=args.users, reset=args.reset)
+    company = json.dumps({"company_id": created["company_id"], "user_ids": created["user_ids"][:50]})
+
+    for mode in ("sync", "async"):
+        env = dict(os.environ, DB_URL=args.database_url, ASYNC_DB_ENABLED="true" if mode == "async" else "false")
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--clients", str(args.clients), "--requests", str(args.requests), "--company", company],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<6} {result['throughput']:>8.1f} req/s  p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
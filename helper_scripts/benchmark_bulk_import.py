@@ -0,0 +1,61 @@
+# This script measures rows per second of the bulk import endpoint for CSV and NDJSON
+# Password hashing dominates, so run it with the production PASSWORD_HASH_* settings
+#   python ./helper_scripts/benchmark_bulk_import.py --rows 20000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+
+
+def csv_body(rows, prefix):
+    lines = ["first_name,last_name,email,password"]
+    lines += [f"First{i},Last{i},{prefix}{i}@import.example,secret{i}" for i in range(rows)]
+    return "\n".join(lines) + "\n"
+
+
+def ndjson_body(rows, prefix):
+    return "".join(
+        json.dumps({"first_name": f"First{i}", "last_name": f"Last{i}", "email": f"{prefix}{i}@import.example", "password": f"secret{i}"}) + "\n"
+        for i in range(rows)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_bulk_import.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    created = seed_database(args.database_url, users=10, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+
+    from fastapi.testclient import TestClient
+    from main import app
+    from auth_handler import sign_jwt
+
+    client = TestClient(app)
+    token = sign_jwt(created["user_ids"][0], created["company_id"], "admin")
+
+    for import_format, body, content_type in (
+        ("csv", csv_body(args.rows, "csv"), "text/csv"),
+        ("ndjson", ndjson_body(args.rows, "ndjson"), "application/x-ndjson"),
+    ):
+        start = time.perf_counter()
+        response = client.post("/api/user_management/register/bulk/", content=body,
+                               headers={"Authorization": f"Bearer {token}", "Content-Type": content_type})
+        duration = time.perf_counter() - start
+        report = response.json()
+        print(f"{import_format:<7} {report['imported']:>7} rows in {duration:>7.2f}s  {report['imported'] / duration:>9.1f} rows/s  ({report['failed']} failed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# This script benchmarks the org-hierarchy index on a synthetic org (default 50k users)
+# "per level" walks supervisor_id with one query per level like the old draft in main.py did
+#   python ./helper_scripts/benchmark_hierarchy.py --users 50000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+
+
+def per_level_ancestor(session, User, user_id, layer_id):
+    user = session.query(User.id, User.supervisor_id, User.layer_id).filter(User.id == user_id).first()
+    while user is not None and user.layer_id != layer_id:
+        user = session.query(User.id, User.supervisor_id, User.layer_id).filter(User.id == user.supervisor_id).first()
+    return user.id if user is not None else None
+
+
+def timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    duration = (time.perf_counter() - start) / repeat
+    print(f"{label:<44} {duration * 1000:>10.3f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_hierarchy.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    created = seed_database(args.database_url, users=args.users, layers=6, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+
+    from backend_db_lib.models import base, User
+    from database import PooledDatabaseManager
+    from hierarchy import HierarchyIndex
+
+    dbm = PooledDatabaseManager(base, args.database_url)
+    index = HierarchyIndex(ttl=3600)
+    cid = created["company_id"]
+    audit_layer, bottom_layer = created["layer_ids"][1], created["layer_ids"][-1]
+    samples = random.Random(0).sample(created["user_ids"][-1000:], min(args.lookups, 1000))
+
+    with dbm.create_session() as session:
+        hierarchy = timed("build index (1 query)", lambda: index.get(session, cid))
+        timed(f"ancestor at layer, index (x{len(samples)})", lambda: [hierarchy.ancestor_at_layer(u, audit_layer) for u in samples])
+        timed(f"ancestor at layer, per level (x{len(samples)})", lambda: [per_level_ancestor(session, User, u, audit_layer) for u in samples])
+        top_user = created["user_ids"][0]
+        subordinates = timed("all subordinates of the top user", lambda: hierarchy.subordinates(top_user))
+        supervisors = timed("supervisors at layer for group", lambda: hierarchy.supervisors_for_group(created["group_ids"][0], bottom_layer, audit_layer), repeat=10)
+        timed("incremental move of one user", lambda: hierarchy.update(samples[0], supervisor_id=top_user, layer_id=bottom_layer), repeat=1000)
+
+    print(f"{len(subordinates)} subordinates, {len(supervisors)} supervisors for group")
+
+
+if __name__ == "__main__":
+    main()
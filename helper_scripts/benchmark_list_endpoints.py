@@ -0,0 +1,118 @@
+# This script benchmarks the list endpoints on a synthetic company
+# "before" resolves company/role/group/layer per row like the old handlers did,
+# "after" uses the bulk resolver from app/hydration.py, "http" is the full endpoint
+#   python ./helper_scripts/benchmark_list_endpoints.py --users 10000
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+from synthetic_data import seed_database
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def measure(engine, func, repeat):
+    timings = []
+    counter = QueryCounter(engine)
+    for _ in range(repeat):
+        with counter:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, counter.count
+
+
+def legacy_resolve(session, entities, relations):
+    resolved = []
+    for entity in entities:
+        for name, (model, fk) in relations.items():
+            resolved.append(session.query(model).get(getattr(entity, fk)))
+    return resolved
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_list_endpoints.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    created = seed_database(args.database_url, users=args.users, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+
+    from fastapi.testclient import TestClient
+    from backend_db_lib.models import User, Layer, Group
+    from main import app, dbm
+    from auth_handler import sign_jwt
+    from hydration import hydrate_rows, USER_RELATIONS, COMPANY_RELATION
+    from cache import reference_cache
+
+    client = TestClient(app)
+    engine = dbm.create_session().get_bind()
+    cid = created["company_id"]
+    group_id = created["group_ids"][0]
+    layer_id = created["layer_ids"][-1]
+    headers = {"Authorization": f"Bearer {sign_jwt(created['user_ids'][0], cid, 'ceo')}"}
+
+    endpoints = {
+        "get_layers": ("/api/user_management/layers/",
+                       lambda s: s.query(Layer).where(Layer.company_id == cid).all(), COMPANY_RELATION),
+        "get_groups": ("/api/user_management/groups/",
+                       lambda s: s.query(Group).where(Group.company_id == cid).all(), COMPANY_RELATION),
+        "get_users_group_id": (f"/api/user_management/group/{group_id}",
+                               lambda s: s.query(User).where(User.company_id == cid).where(User.group_id == group_id).all(), USER_RELATIONS),
+        "get_auditlayer_employee": (f"/api/user_management/groups/employee/{group_id}/{layer_id}",
+                                    lambda s: s.query(User).where(User.company_id == cid).where(User.layer_id == layer_id).where(User.group_id == group_id).all(), USER_RELATIONS),
+        "get_group_supervisor": (f"/api/user_management/groups/supervisor/{layer_id}",
+                                 lambda s: s.query(User).where(User.company_id == cid).where(User.layer_id == layer_id).all(), USER_RELATIONS),
+    }
+
+    print(f"{'endpoint':<26}{'rows':>7}{'before ms':>12}{'before q':>10}{'after ms':>12}{'after q':>9}{'http ms':>10}{'http q':>8}")
+    for name, (url, load, relations) in endpoints.items():
+        def before():
+            with dbm.create_session() as session:
+                legacy_resolve(session, load(session), relations)
+
+        def after():
+            reference_cache.clear()
+            with dbm.create_session() as session:
+                hydrate_rows(session, load(session), relations)
+
+        def http():
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200, response.text
+
+        rows = len(client.get(url, headers=headers).json()["data"])
+        (before_ms, before_q), (after_ms, after_q), (http_ms, http_q) = [
+            measure(engine, func, args.repeat) for func in (before, after, http)
+        ]
+        print(f"{name:<26}{rows:>7}{before_ms:>12.1f}{before_q // args.repeat:>10}"
+              f"{after_ms:>12.1f}{after_q // args.repeat:>9}{http_ms:>10.1f}{http_q // args.repeat:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# This script measures logins per second (and per hashing worker) through the login endpoint
+# Password verification runs in passwords.hash_executor, sized by PASSWORD_HASH_WORKERS
+# --burst sends all logins at once (shift start), --flood adds failed logins with wrong passwords from a
+# second client IP, which the rate limiter (ratelimit.py) rejects before any DB or hashing work
+#   PASSWORD_HASH_ROUNDS=29000 python ./helper_scripts/benchmark_login.py --logins 500
+#   python ./helper_scripts/benchmark_login.py --logins 1000 --burst --flood 5000
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database, PASSWORD
+
+
+async def run_logins(emails, logins, clients, flood, flood_clients):
+    import httpx
+    from main import app
+
+    semaphore = asyncio.Semaphore(clients)
+    flood_semaphore = asyncio.Semaphore(flood_clients)
+    statuses = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client, \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=("10.66.0.1", 4711)), base_url="http://benchmark") as attacker:
+        async def login(i):
+            async with semaphore:
+                response = await client.post("/api/user_management/login/", json={"email": emails[i % len(emails)], "password": PASSWORD})
+                assert response.json().get("result") == 1, response.text
+
+        async def failed_login(i):
+            async with flood_semaphore:
+                response = await attacker.post("/api/user_management/login/", json={"email": emails[i % len(emails)], "password": "wrong"})
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        # Erster Durchlauf hebt die Hashes aus synthetic_data auf den konfigurierten Algorithmus
+        await asyncio.gather(*(login(i) for i in range(len(emails))))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)), *(failed_login(i) for i in range(flood)))
+        return logins / (time.perf_counter() - start), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_login.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--burst", action="store_true", help="send all logins concurrently")
+    parser.add_argument("--flood", type=int, default=0, help="failed logins sent alongside from another IP")
+    parser.add_argument("--flood-clients", type=int, default=10)
+    args = parser.parse_args()
+
+    seed_database(args.database_url, users=args.users, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+
+    from backend_db_lib.manager import DatabaseManager
+    from backend_db_lib.models import base, User
+    from passwords import pwd_context, hash_executor
+
+    with DatabaseManager(base, args.database_url).create_session() as session:
+        emails = [email for (email,) in session.query(User.email).limit(args.users).all()]
+
+    clients = args.logins if args.burst else args.clients
+    per_second, statuses = asyncio.run(run_logins(emails, args.logins, clients, args.flood, args.flood_clients))
+    workers = hash_executor._max_workers
+    print(f"scheme {pwd_context.default_scheme()}, {workers} hash workers, {clients} concurrent clients")
+    print(f"{per_second:.1f} logins/s, {per_second / workers:.1f} logins/s per core")
+    if args.flood:
+        print(f"failed logins: {', '.join(f'{count}x {status}' for status, count in sorted(statuses.items()))}")
+
+
+if __name__ == "__main__":
+    main()
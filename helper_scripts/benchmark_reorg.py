@@ -0,0 +1,100 @@
+# This script compares applying a reorganisation (new group, layer and supervisor per user) with one
+# PATCH /user/{id} per user against a single POST /reorg/ on a synthetic company.
+# The single calls run on a sample (--single) and are extrapolated, the reorg applies all --changes at once
+# (the sample is already applied by then and shows up as "unchanged").
+#   python ./helper_scripts/benchmark_reorg.py --users 20000 --changes 10000
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+from benchmark_list_endpoints import QueryCounter
+
+
+def reorg_changes(created, count, rng):
+    # Neuer Vorgesetzter immer mit kleinerer id, so entstehen keine Zyklen
+    user_ids = created["user_ids"]
+    changes = []
+    for index in sorted(rng.sample(range(1, len(user_ids)), count)):
+        changes.append({
+            "user_id": user_ids[index],
+            "group_id": rng.choice(created["group_ids"]),
+            "layer_id": rng.choice(created["layer_ids"]),
+            "supervisor_id": user_ids[rng.randrange(index)],
+        })
+    return changes
+
+
+async def run(created, changes, single, clients, engine):
+    import httpx
+    from main import app
+    from auth_handler import sign_jwt
+
+    headers = {"Authorization": f"Bearer {sign_jwt(created['user_ids'][0], created['company_id'], 'ceo')}"}
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=600) as client:
+        semaphore = asyncio.Semaphore(clients)
+
+        async def patch(change):
+            async with semaphore:
+                values = {field: value for field, value in change.items() if field != "user_id"}
+                response = await client.patch(f"/api/user_management/user/{change['user_id']}", headers=headers, json=values)
+                assert response.status_code == 200, response.text
+
+        # Sequenziell, wie ein Client die Moves heute nacheinander abschickt (Zyklusprüfung je Call)
+        counter = QueryCounter(engine)
+        with counter:
+            start = time.perf_counter()
+            for change in changes[:single]:
+                await patch(change)
+            results["single"] = (time.perf_counter() - start, counter.count, single)
+
+        for name, dry_run in (("dry_run", True), ("reorg", False)):
+            counter = QueryCounter(engine)
+            with counter:
+                start = time.perf_counter()
+                response = await client.post("/api/user_management/reorg/", headers=headers, json={"changes": changes, "dry_run": dry_run})
+                results[name] = (time.perf_counter() - start, counter.count, len(changes))
+            assert response.status_code == 200, response.text
+            results[name] += (response.json(),)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_reorg.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--changes", type=int, default=10000)
+    parser.add_argument("--single", type=int, default=500, help="changes applied with one PATCH each")
+    parser.add_argument("--clients", type=int, default=1)
+    args = parser.parse_args()
+
+    created = seed_database(args.database_url, users=args.users, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+    changes = reorg_changes(created, args.changes, random.Random(0))
+
+    from main import dbm, async_dbm
+
+    engine = async_dbm.engine.sync_engine if async_dbm is not None else dbm.engine
+    results = asyncio.run(run(created, changes, args.single, args.clients, engine))
+
+    seconds, queries, count = results["single"]
+    print(f"single PATCH   {count:>6} changes {seconds * 1000:>9.0f} ms {count / seconds:>9.0f} changes/s {queries / count:>7.1f} queries/change"
+          f"  (~{seconds / count * args.changes:.1f} s for {args.changes})")
+    for name in ("dry_run", "reorg"):
+        seconds, queries, count, body = results[name]
+        print(f"{name:<14} {count:>6} changes {seconds * 1000:>9.0f} ms {count / seconds:>9.0f} changes/s {queries:>7} queries total"
+              f"  updated={body['updated']} unchanged={body['unchanged']}")
+
+
+if __name__ == "__main__":
+    main()
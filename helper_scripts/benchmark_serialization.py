@@ -0,0 +1,96 @@
+# This script measures how user list responses are rendered, end to end through the ASGI app on a synthetic company.
+# All variants run the same query (GET /group/{id}?limit=N) and differ only in how the dicts become JSON:
+#   jsonable_encoder: no response_model, FastAPI's jsonable_encoder + JSONResponse (the original endpoints)
+#   response_model:   UserListResponse validation + serialization by FastAPI (handlers returning dicts)
+#   direct:           the real route, dicts rendered by orjson (main.typed_response)
+#   python ./helper_scripts/benchmark_serialization.py --sizes 1000 10000
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+
+
+def add_comparison_routes(app, run_in_session):
+    # Gleiche Query wie GET /group/{id}, nur ohne typed_response
+    from fastapi.responses import JSONResponse
+    from backend_db_lib.models import User
+    from hydration import query_user_page
+    from schemas import UserListResponse
+
+    async def page(group_id, limit):
+        data, _ = await run_in_session(lambda session: query_user_page(session, [User.group_id == group_id], None, limit))
+        return {"result": 1, "data": data, "next_cursor": None}
+
+    @app.get("/benchmark/jsonable_encoder/{group_id}", response_class=JSONResponse)
+    async def jsonable_encoder_route(group_id: int, limit: int):
+        return await page(group_id, limit)
+
+    @app.get("/benchmark/response_model/{group_id}", response_model=UserListResponse, response_model_exclude_unset=True)
+    async def response_model_route(group_id: int, limit: int):
+        return await page(group_id, limit)
+
+
+async def run(created, group_id, sizes, repeat):
+    import httpx
+    from main import app, run_in_session
+    from auth_handler import sign_jwt
+
+    add_comparison_routes(app, run_in_session)
+    headers = {"Authorization": f"Bearer {sign_jwt(created['user_ids'][0], created['company_id'], 'ceo')}"}
+    paths = {
+        "jsonable_encoder": f"/benchmark/jsonable_encoder/{group_id}",
+        "response_model": f"/benchmark/response_model/{group_id}",
+        "direct": f"/api/user_management/group/{group_id}",
+    }
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=600) as client:
+        for size in sizes:
+            row = {"users": size}
+            bodies = {}
+            for name, path in paths.items():
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    response = await client.get(path, headers=headers, params={"limit": size})
+                    timings.append(time.perf_counter() - start)
+                    assert response.status_code == 200, response.text
+                row[name] = statistics.median(timings) * 1000
+                bodies[name] = response.json()["data"]
+            # Alle Varianten müssen dasselbe liefern
+            assert bodies["jsonable_encoder"] == bodies["response_model"] == bodies["direct"]
+            row["returned"] = len(bodies["direct"])
+            results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_serialization.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Eine Gruppe, damit auch 10000 User auf eine Seite passen
+    created = seed_database(args.database_url, users=max(args.sizes), groups=1, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+    os.environ.setdefault("USER_LIST_MAX_LIMIT", str(max(args.sizes)))
+    results = asyncio.run(run(created, created["group_ids"][0], args.sizes, args.repeat))
+
+    print(f"{'users':>6}{'jsonable_encoder ms':>21}{'response_model ms':>19}{'direct ms':>11}{'speedup':>9}")
+    for row in results:
+        print(f"{row['returned']:>6}{row['jsonable_encoder']:>21.1f}{row['response_model']:>19.1f}{row['direct']:>11.1f}"
+              f"{row['jsonable_encoder'] / row['direct']:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# This script measures how fast a new replica becomes ready: the import time of app/main.py and the time from
+# starting `python main.py` (production mode, no reloader) to the first successful request that hits the database.
+# It fails (exit code 1) when a limit is exceeded or main.py pulls in a module that is only needed lazily.
+#   python ./helper_scripts/benchmark_startup.py --database-url sqlite:///benchmark_startup.db
+#   python ./helper_scripts/benchmark_startup.py --runs 10 --workers 4 --max-import-ms 1500 --max-first-request-ms 4000
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+
+# Dürfen beim Import von main.py nicht geladen werden
+LAZY_MODULES = ("pandas", "numpy", "fastapi.testclient", "httpx", "uvicorn")
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": [m for m in sys.argv[1:] if m in sys.modules]}))
+"""
+
+
+def absolute_sqlite_url(database_url):
+    # main.py läuft mit cwd app/, relative SQLite-Pfade müssen vorher aufgelöst werden
+    from sqlalchemy.engine import make_url
+
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        url = url.set(database=os.path.abspath(url.database))
+    return url.render_as_string(hide_password=False)
+
+
+def measure_import(env, modules):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET, *modules], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env, workers, path, timeout=60):
+    port = free_port()
+    env = dict(env, HOST="127.0.0.1", PORT=str(port), WEB_CONCURRENCY=str(workers), UVICORN_RELOAD="false")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise SystemExit("main.py exited during startup")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.005)
+        raise SystemExit(f"main.py did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_startup.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import time is higher")
+    parser.add_argument("--max-first-request-ms", type=float, help="fail if the median time to the first request is higher")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    database_url = absolute_sqlite_url(args.database_url)
+    company = seed_database(database_url, users=args.users, reset=args.reset)
+    env = dict(os.environ, DB_URL=database_url, PYTHONPATH=os.pathsep.join(filter(None, [APP_DIR, os.environ.get("PYTHONPATH")])))
+    # Lese-Endpunkt mit DB-Zugriff, damit auch Engine und Verbindungsaufbau mitgemessen werden
+    path = f"/api/user_management/user/{company['user_ids'][0]}"
+
+    imports = [measure_import(env, LAZY_MODULES) for _ in range(args.runs)]
+    first_requests = [measure_first_request(env, args.workers, path) for _ in range(args.runs)]
+
+    report = {
+        "runs": args.runs,
+        "workers": args.workers,
+        "import_ms": {"median": statistics.median(i["seconds"] for i in imports) * 1000, "max": max(i["seconds"] for i in imports) * 1000},
+        "first_request_ms": {"median": statistics.median(first_requests) * 1000, "max": max(first_requests) * 1000},
+        "eagerly_imported": sorted({m for i in imports for m in i["modules"]}),
+    }
+    failures = []
+    if report["eagerly_imported"]:
+        failures.append(f"main.py imports {', '.join(report['eagerly_imported'])}")
+    if args.max_import_ms is not None and report["import_ms"]["median"] > args.max_import_ms:
+        failures.append(f"import took {report['import_ms']['median']:.0f} ms (limit {args.max_import_ms:.0f} ms)")
+    if args.max_first_request_ms is not None and report["first_request_ms"]["median"] > args.max_first_request_ms:
+        failures.append(f"first request after {report['first_request_ms']['median']:.0f} ms (limit {args.max_first_request_ms:.0f} ms)")
+    report["failures"] = failures
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
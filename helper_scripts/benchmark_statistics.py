@@ -0,0 +1,115 @@
+# This script compares GET /statistics/ with what dashboards did before: paging through GET /group/{id} for
+# every group and counting groups, layers, roles and direct reports on the client.
+# The endpoint is measured cold (cache cleared), warm (cached for the data version) and with If-None-Match.
+#   python ./helper_scripts/benchmark_statistics.py --users 100000
+#   python ./helper_scripts/benchmark_statistics.py --users 100000 --skip-client-side
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+from benchmark_list_endpoints import QueryCounter
+
+
+async def client_side(client, headers, group_ids, limit):
+    counts = {"group": Counter(), "layer": Counter(), "role": Counter(), "supervisor": Counter()}
+    requests = 0
+    for group_id in group_ids:
+        cursor = None
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            response = await client.get(f"/api/user_management/group/{group_id}", headers=headers, params=params)
+            assert response.status_code == 200, response.text
+            requests += 1
+            body = response.json()
+            for user in body["data"]:
+                counts["group"][group_id] += 1
+                counts["layer"][(user.get("layer") or {}).get("id")] += 1
+                counts["role"][(user.get("role") or {}).get("id")] += 1
+                if user.get("supervisor_id") is not None:
+                    counts["supervisor"][user["supervisor_id"]] += 1
+            cursor = body.get("next_cursor")
+            if cursor is None:
+                break
+    return counts, requests
+
+
+async def run(created, repeat, limit, skip_client_side, engine):
+    import httpx
+    from main import app
+    from auth_handler import sign_jwt
+    from cache import stats_cache
+
+    headers = {"Authorization": f"Bearer {sign_jwt(created['user_ids'][0], created['company_id'], 'ceo')}"}
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=600) as client:
+        if not skip_client_side:
+            counter = QueryCounter(engine)
+            with counter:
+                start = time.perf_counter()
+                counts, requests = await client_side(client, headers, created["group_ids"], limit)
+                results["client_side"] = ([time.perf_counter() - start], counter.count, requests)
+            results["client_side_headcount"] = sum(counts["group"].values())
+
+        async def endpoint(extra_headers=None, status=200):
+            response = await client.get("/api/user_management/statistics/", headers={**headers, **(extra_headers or {})})
+            assert response.status_code == status, response.text
+            return response
+
+        etag = (await endpoint()).headers["etag"]
+        for name, before, extra_headers, status in (
+            ("cold", stats_cache.clear, None, 200),
+            ("warm", None, None, 200),
+            ("not_modified", None, {"If-None-Match": etag}, 304),
+        ):
+            timings = []
+            counter = QueryCounter(engine)
+            with counter:
+                for _ in range(repeat):
+                    if before is not None:
+                        before()
+                    start = time.perf_counter()
+                    response = await endpoint(extra_headers, status)
+                    timings.append(time.perf_counter() - start)
+            results[name] = (timings, counter.count // repeat, 1)
+            if name == "cold":
+                results["headcount"] = response.json()["data"]["headcount"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_statistics.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=1000, help="page size of the client-side variant")
+    parser.add_argument("--skip-client-side", action="store_true")
+    args = parser.parse_args()
+
+    created = seed_database(args.database_url, users=args.users, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+
+    from main import dbm, async_dbm
+
+    engine = async_dbm.engine.sync_engine if async_dbm is not None else dbm.engine
+    results = asyncio.run(run(created, args.repeat, args.limit, args.skip_client_side, engine))
+
+    print(f"{args.users} users, headcount {results.pop('headcount')}" +
+          (f" (client side counted {results.pop('client_side_headcount')})" if "client_side_headcount" in results else ""))
+    print(f"{'variant':<14}{'median ms':>11}{'requests':>10}{'queries':>9}")
+    for name, (timings, queries, requests) in results.items():
+        print(f"{name:<14}{statistics.median(timings) * 1000:>11.1f}{requests:>10}{queries:>9}")
+
+
+if __name__ == "__main__":
+    main()
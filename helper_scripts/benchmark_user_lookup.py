@@ -0,0 +1,95 @@
+# This script compares enriching a page of N users with N calls to GET /user/{id} against one call to
+# POST /users/lookup/ on a synthetic company. Caches are cleared before every run, so both sides start cold.
+#   python ./helper_scripts/benchmark_user_lookup.py --users 10000 --lookup 100 200 500
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import seed_database
+from benchmark_list_endpoints import QueryCounter
+
+
+def clear_caches():
+    from cache import reference_cache, user_cache
+
+    reference_cache.clear()
+    user_cache.clear()
+
+
+async def single_calls(client, user_ids, clients):
+    semaphore = asyncio.Semaphore(clients)
+
+    async def get(user_id):
+        async with semaphore:
+            response = await client.get(f"/api/user_management/user/{user_id}")
+            assert response.status_code == 200, response.text
+
+    await asyncio.gather(*(get(user_id) for user_id in user_ids))
+
+
+async def bulk_call(client, user_ids, headers):
+    response = await client.post("/api/user_management/users/lookup/", headers=headers, json={"ids": user_ids})
+    assert response.status_code == 200 and not response.json()["not_found"], response.text
+
+
+async def run(created, sizes, repeat, clients, engine):
+    import httpx
+    from main import app
+    from auth_handler import sign_jwt
+
+    headers = {"Authorization": f"Bearer {sign_jwt(created['user_ids'][0], created['company_id'], 'ceo')}"}
+    rng = random.Random(0)
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        for size in sizes:
+            row = {"users": size}
+            for name, call in (("single", lambda ids: single_calls(client, ids, clients)), ("bulk", lambda ids: bulk_call(client, ids, headers))):
+                timings = []
+                counter = QueryCounter(engine)
+                for _ in range(repeat):
+                    user_ids = rng.sample(created["user_ids"], size)
+                    clear_caches()
+                    with counter:
+                        start = time.perf_counter()
+                        await call(user_ids)
+                        timings.append(time.perf_counter() - start)
+                row[name] = (statistics.median(timings) * 1000, counter.count // repeat, size if name == "single" else 1)
+            results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///benchmark_user_lookup.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--lookup", type=int, nargs="+", default=[10, 100, 500], help="users per page render")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=20, help="concurrent single calls")
+    args = parser.parse_args()
+
+    created = seed_database(args.database_url, users=args.users, reset=args.reset)
+    os.environ["DB_URL"] = args.database_url
+
+    from main import dbm, async_dbm
+
+    engine = async_dbm.engine.sync_engine if async_dbm is not None else dbm.engine
+    results = asyncio.run(run(created, args.lookup, args.repeat, args.clients, engine))
+
+    print(f"{'users':>6}{'single ms':>12}{'requests':>10}{'queries':>9}{'bulk ms':>10}{'requests':>10}{'queries':>9}{'speedup':>9}")
+    for row in results:
+        (single_ms, single_q, single_r), (bulk_ms, bulk_q, bulk_r) = row["single"], row["bulk"]
+        print(f"{row['users']:>6}{single_ms:>12.1f}{single_r:>10}{single_q:>9}{bulk_ms:>10.1f}{bulk_r:>10}{bulk_q:>9}{single_ms / bulk_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+# This script runs a concurrent HTTP load test against every endpoint of main.py and prints the results as JSON
+# It seeds synthetic companies (see synthetic_data.py), starts uvicorn on the same database and drives it with httpx.
+# Query counts per request are taken from the /metrics endpoint before and after every scenario.
+#   python ./helper_scripts/load_test.py --database-url sqlite:///loadtest.db --users 10000 --output results.json
+#   python ./helper_scripts/load_test.py --base-url http://localhost:8000 --database-url postgresql://... --skip-seed --company-id 1
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+API = "/api/user_management"
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank, sorted_values muss sortiert sein
+    if not sorted_values:
+        return None
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+def unique(prefix):
+    return f"{prefix}{uuid.uuid4().hex[:12]}"
+
+
+def scenarios(company, ctx):
+    """
+    (name, method, route template, request factory). The factory gets the request number and
+    returns (path, httpx request kwargs). Route templates match the `route` label in /metrics.
+    """
+    from synthetic_data import FIRST_NAMES, LAST_NAMES
+
+    users = company["user_ids"]
+    layers = company["layer_ids"]
+    groups = company["group_ids"]
+    auth = {"Authorization": f"Bearer {ctx['token']}"}
+
+    def pick(values, i):
+        return values[i % len(values)]
+
+    def batch(values, i, size):
+        start = (i * size) % len(values)
+        return (values[start:] + values[:start])[:size]
+
+    # Präfixe, volle Namen und Tippfehler (unscharfe Suche)
+    search_terms = [name[:3] for name in FIRST_NAMES] + list(LAST_NAMES) + [name[:-2] + name[-1] + name[-2] for name in LAST_NAMES]
+
+    def bulk_body(i):
+        rows = [f"Bulk,User{i}_{n},{unique('bulk')}@loadtest.example,test,{users[0]},{ctx['worker_role_id']},{layers[-1]},{pick(groups, n)}" for n in range(ctx["bulk_rows"])]
+        return "first_name,last_name,email,password,supervisor_id,role_id,layer_id,group_id\n" + "\n".join(rows)
+
+    return [
+        ("login", "POST", f"{API}/login/", lambda i: (f"{API}/login/", {"json": {"email": ctx["email"], "password": "test"}})),
+        ("logout", "POST", f"{API}/logout/", lambda i: (f"{API}/logout/", {"headers": auth})),
+        ("validate_jwt", "POST", f"{API}/validateJWT/", lambda i: (f"{API}/validateJWT/", {"params": {"jwt": ctx["token"]}})),
+        ("validate_jwt_batch", "POST", f"{API}/validateJWT/batch/", lambda i: (f"{API}/validateJWT/batch/", {"json": {"tokens": ctx["tokens"]}})),
+        ("get_layers", "GET", f"{API}/layers/", lambda i: (f"{API}/layers/", {"headers": auth})),
+        ("get_groups", "GET", f"{API}/groups/", lambda i: (f"{API}/groups/", {"headers": auth})),
+        ("get_user", "GET", f"{API}/user/{{user_id}}", lambda i: (f"{API}/user/{pick(users, i)}", {})),
+        ("get_user_not_modified", "GET", f"{API}/user/{{user_id}}",
+         lambda i: (f"{API}/user/{users[0]}", {"headers": {"If-None-Match": ctx["user_etag"]}})),
+        ("get_group_users", "GET", f"{API}/group/{{group_id}}",
+         lambda i: (f"{API}/group/{pick(groups, i)}", {"headers": auth, "params": {"limit": 100}})),
+        ("get_group_employees", "GET", f"{API}/groups/employee/{{group_id}}/{{audit_layer_id}}",
+         lambda i: (f"{API}/groups/employee/{pick(groups, i)}/{layers[-1]}", {"headers": auth, "params": {"limit": 100}})),
+        ("get_layer_supervisors", "GET", f"{API}/groups/supervisor/{{audit_layer_id}}",
+         lambda i: (f"{API}/groups/supervisor/{pick(layers[:-1], i)}", {"headers": auth, "params": {"limit": 100}})),
+        ("get_group_supervisors_by_hierarchy", "GET", f"{API}/groups/supervisor/{{group_id}}/{{assigned_layer_id}}/{{audit_layer_id}}",
+         lambda i: (f"{API}/groups/supervisor/{pick(groups, i)}/{layers[-1]}/{layers[0]}", {"headers": auth})),
+        ("get_user_supervisor", "GET", f"{API}/user/{{user_id}}/supervisor/{{layer_id}}",
+         lambda i: (f"{API}/user/{pick(users[-100:], i)}/supervisor/{layers[0]}", {"headers": auth})),
+        ("get_user_subordinates", "GET", f"{API}/user/{{user_id}}/subordinates",
+         lambda i: (f"{API}/user/{pick(users[1:10], i)}/subordinates", {"headers": auth})),
+        ("lookup_users", "POST", f"{API}/users/lookup/",
+         lambda i: (f"{API}/users/lookup/", {"headers": auth, "json": {"ids": batch(users, i, 100)}})),
+        ("search_users", "GET", f"{API}/users/search/",
+         lambda i: (f"{API}/users/search/", {"headers": auth, "params": {"q": pick(search_terms, i), "fuzzy": str(i % 2 == 0).lower()}})),
+        ("get_statistics", "GET", f"{API}/statistics/", lambda i: (f"{API}/statistics/", {"headers": auth})),
+        ("directory_changes", "GET", f"{API}/directory/changes/",
+         lambda i: (f"{API}/directory/changes/", {"headers": auth, "params": {"since": ctx["directory_since"]}})),
+        ("directory_snapshot", "GET", f"{API}/directory/snapshot/", lambda i: (f"{API}/directory/snapshot/", {"headers": auth})),
+        ("get_cache_stats", "GET", f"{API}/cache/", lambda i: (f"{API}/cache/", {})),
+        ("get_metrics", "GET", f"{API}/metrics", lambda i: (f"{API}/metrics", {})),
+        ("post_user_layer", "POST", f"{API}/user/layer/{{user_id}}",
+         lambda i: (f"{API}/user/layer/{pick(users[-100:], i)}", {"headers": auth, "json": {"layer_id": layers[-1]}})),
+        ("post_user_group", "POST", f"{API}/user/group/{{user_id}}",
+         lambda i: (f"{API}/user/group/{pick(users[-100:], i)}", {"headers": auth, "json": {"group_id": pick(groups, i)}})),
+        ("patch_user", "PATCH", f"{API}/user/{{user_id}}",
+         lambda i: (f"{API}/user/{pick(users[-100:], i)}", {"headers": auth, "json": {"layer_id": layers[-1], "group_id": pick(groups, i)}})),
+        ("patch_users", "PATCH", f"{API}/users/",
+         lambda i: (f"{API}/users/", {"headers": auth, "json": {"user_ids": batch(users[-1000:], i, 100), "group_id": pick(groups, i)}})),
+        ("reorg", "POST", f"{API}/reorg/",
+         lambda i: (f"{API}/reorg/", {"headers": auth, "json": {"changes": [
+             {"user_id": user_id, "group_id": pick(groups, i + n), "layer_id": layers[-1]} for n, user_id in enumerate(batch(users[-1000:], i, 100))
+         ]}})),
+        ("post_layer", "POST", f"{API}/layers/",
+         lambda i: (f"{API}/layers/", {"headers": auth, "json": {"layer_name": unique("layer"), "layer_number": len(layers) + 1}})),
+        ("post_group", "POST", f"{API}/groups/",
+         lambda i: (f"{API}/groups/", {"headers": auth, "json": {"group_name": unique("group")}})),
+        ("register", "POST", f"{API}/register/",
+         lambda i: (f"{API}/register/", {"json": {
+             "first_name": "Load", "last_name": f"Test{i}", "email": f"{unique('register')}@loadtest.example", "password_hash": "test",
+             "supervisor_id": users[0], "role_id": ctx["worker_role_id"], "layer_id": layers[-1], "company_id": company["company_id"], "group_id": groups[0],
+         }})),
+        ("register_bulk", "POST", f"{API}/register/bulk/",
+         lambda i: (f"{API}/register/bulk/", {"headers": {**auth, "Content-Type": "text/csv"}, "content": bulk_body(i)})),
+    ]
+
+
+def parse_sql_metrics(text):
+    # {(method, route): (sum, count)} aus user_management_http_sql_statements_sum/_count
+    result = {}
+    for kind, method, route, value in re.findall(r'^user_management_http_sql_statements_(sum|count)\{method="([^"]+)",route="([^"]+)"\} (\S+)$', text, re.M):
+        total, count = result.get((method, route), (0.0, 0.0))
+        result[(method, route)] = (float(value), count) if kind == "sum" else (total, float(value))
+    return result
+
+
+async def scrape_sql_metrics(client):
+    response = await client.get(f"{API}/metrics")
+    return parse_sql_metrics(response.text) if response.status_code == 200 else {}
+
+
+async def run_scenario(client, scenario, requests, concurrency, warmup):
+    name, method, route, build = scenario
+    for i in range(warmup):
+        path, kwargs = build(i)
+        try:
+            await client.request(method, path, **kwargs)
+        except Exception:
+            pass
+
+    before = await scrape_sql_metrics(client)
+    latencies = []
+    statuses = Counter()
+    counter = iter(range(warmup, warmup + requests))
+
+    async def worker():
+        for i in counter:
+            path, kwargs = build(i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                statuses[str(response.status_code)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    after = await scrape_sql_metrics(client)
+
+    # Jeder uvicorn-Worker hat eigene Metriken, die Query-Zahlen stimmen nur mit --workers 1
+    total_before, count_before = before.get((method, route), (0.0, 0.0))
+    total_after, count_after = after.get((method, route), (0.0, 0.0))
+    observed = count_after - count_before - (1 if name == "get_metrics" else 0)
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        "name": name,
+        "method": method,
+        "route": route,
+        "requests": requests,
+        "ok": ok,
+        "errors": requests - ok,
+        "statuses": dict(statuses),
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(requests / duration, 2) if duration else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            "p95": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+            "p99": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            "max": round(latencies[-1] * 1000, 3) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        },
+        "queries_per_request": round((total_after - total_before) / observed, 3) if observed > 0 else None,
+    }
+
+
+async def prepare_context(client, company, bulk_rows):
+    email = f"user{company['user_ids'][0]}@company{company['company_id']}.example"
+    response = await client.post(f"{API}/login/", json={"email": email, "password": "test"})
+    token = response.json().get("token")
+    if not token:
+        raise SystemExit(f"Login as {email} failed: {response.text}")
+
+    # Tokens verschiedener User für validateJWT/batch
+    tokens = [token]
+    for user_id in company["user_ids"][1:10]:
+        response = await client.post(f"{API}/login/", json={"email": f"user{user_id}@company{company['company_id']}.example", "password": "test"})
+        tokens.append(response.json().get("token") or token)
+
+    response = await client.get(f"{API}/user/{company['user_ids'][-1]}")
+    worker_role_id = response.json()["data"]["role"]["id"]
+    response = await client.get(f"{API}/directory/changes/", headers={"Authorization": f"Bearer {token}"})
+    # Clients fragen die letzten Änderungen ab, nicht das ganze Protokoll
+    directory_since = max(0, response.json()["version"] - 100)
+    response = await client.get(f"{API}/user/{company['user_ids'][0]}")
+    return {"email": email, "token": token, "tokens": tokens, "worker_role_id": worker_role_id, "directory_since": directory_since,
+            "user_etag": response.headers.get("ETag", ""), "bulk_rows": bulk_rows}
+
+
+async def run_load(base_url, company, args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        ctx = await prepare_context(client, company, args.bulk_rows)
+        results = []
+        for scenario in scenarios(company, ctx):
+            if args.scenarios and scenario[0] not in args.scenarios:
+                continue
+            # Schreibende und teure Endpunkte mit weniger Requests, damit ein Lauf überschaubar bleibt
+            full = (scenario[1] == "GET" and scenario[0] != "directory_snapshot") or scenario[0] in ("validate_jwt", "validate_jwt_batch", "lookup_users", "logout")
+            requests = args.requests if full else max(1, args.requests // args.write_ratio)
+            result = await run_scenario(client, scenario, requests, args.concurrency, args.warmup)
+            print(f"{result['name']:<36} {result['throughput_rps'] or 0:>9.1f} req/s  p50 {result['latency_ms']['p50'] or 0:>8.2f} ms  "
+                  f"p99 {result['latency_ms']['p99'] or 0:>8.2f} ms  queries {result['queries_per_request']}", file=sys.stderr)
+            results.append(result)
+        return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url, workers):
+    port = free_port()
+    env = dict(os.environ, DB_URL=database_url)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+
+    import httpx
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("uvicorn exited during startup")
+        try:
+            if httpx.get(f"{base_url}{API}/cache/").status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("uvicorn did not start within 60s")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default="sqlite:///loadtest.db")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding (default: add a new company)")
+    parser.add_argument("--base-url", help="test an already running server instead of starting uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when the server is started by this script")
+    parser.add_argument("--companies", type=int, default=1)
+    parser.add_argument("--users", type=int, default=10000, help="users per company (1k to 100k)")
+    parser.add_argument("--layers", type=int, default=5)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--company-id", type=int, default=1, help="company to load test with --skip-seed")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per read scenario")
+    parser.add_argument("--write-ratio", type=int, default=10, help="write, login and directory snapshot scenarios run requests / write-ratio requests")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--bulk-rows", type=int, default=100, help="rows per register/bulk request")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--scenarios", nargs="*", help="only run these scenarios")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    from synthetic_data import seed_companies, load_company
+
+    seed_start = time.perf_counter()
+    if args.skip_seed:
+        company = load_company(args.database_url, args.company_id)
+    else:
+        company = seed_companies(args.database_url, args.companies, args.users, args.layers, args.groups, seed=args.seed, reset=args.reset)[0]
+    seed_duration = time.perf_counter() - seed_start
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_server(args.database_url, args.workers)
+    try:
+        results = asyncio.run(run_load(base_url, company, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "database": args.database_url.split(":", 1)[0],
+        "dataset": {
+            "companies": args.companies if not args.skip_seed else None,
+            "users_per_company": len(company["user_ids"]),
+            "layers": len(company["layer_ids"]),
+            "groups": len(company["group_ids"]),
+            "seed": args.seed,
+            "seed_duration_s": round(seed_duration, 2),
+        },
+        "load": {"concurrency": args.concurrency, "requests": args.requests, "write_ratio": args.write_ratio, "warmup": args.warmup, "workers": args.workers},
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()